@@ -1,24 +1,42 @@
 # app/api/v1/session.py
+import base64
 import json
+import logging
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-from fastapi import APIRouter, HTTPException, Path
+from fastapi import APIRouter, HTTPException, Path, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_, select
 
 from app.models.schemas import (
     FinalizeResponse,
+    JobResponse,
+    ReviseAnswerRequest,
+    ReviseAnswerResponse,
     SessionCreateRequest,
     SessionCreateResponse,
     SessionDetailResponse,
+    SessionImportResponse,
+    SessionListResponse,
     SessionReplyRequest,
     SessionReplyResponse,
+    SessionSearchHit,
+    SessionSearchResponse,
+    SessionSummary,
 )
+from app.core.config import settings
 from app.core.db import database
-from app.models.db_models import sessions, SessionStatus
-from app.services import llm_service
+from app.models.db_models import sessions, JobStatus, SessionStatus
+from app.services import (
+    archive, conversation_store, job_queue, llm_service, search, session_service, similarity, speculation,
+    transfer,
+)
 
 router = APIRouter(prefix="/session", tags=["session"])
+logger = logging.getLogger(__name__)
 
 
 # -----------------------------
@@ -60,20 +78,23 @@ async def create_session(request: SessionCreateRequest):
     session_id = str(uuid.uuid4())
     now = datetime.utcnow()
 
-    # Generate initial questions
-    questions = await llm_service.generate_initial_questions(request.prompt, conversation=[], num_questions=4)
+    # Reuse the questions of a near-duplicate past prompt, otherwise generate them
+    questions = similarity.reusable_questions(request.prompt)
+    if questions is None:
+        questions = await llm_service.generate_initial_questions(request.prompt, conversation=[], num_questions=4)
 
     query = sessions.insert().values(
         id=session_id,
         prompt=request.prompt,
         questions=questions,
         answers=[],
-        conversation=[],
         status=SessionStatus.in_progress,
+        version=0,
         created_at=now,
         updated_at=now
     )
     await database.execute(query)
+    similarity.record_session(session_id, request.prompt, questions)
 
     return SessionCreateResponse(
         session_id=session_id,
@@ -93,131 +114,383 @@ async def reply_to_session(
     session_id: str,
     request: SessionReplyRequest
 ):
-    query = sessions.select().where(sessions.c.id == session_id)
-    session_record = await database.fetch_one(query)
-    if not session_record:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    data = record_to_dict(session_record)
-    conversation: List[Dict] = data.get("conversation") or []
-    answers: List[Dict] = data.get("answers") or []
-    questions: List[str] = data.get("questions") or []
-    now = datetime.utcnow()
-
-    # Track which questions are already answered
-    answered_questions = {a['question'] for a in answers}
-
-    # Process all new answers in one request
-    for ans in request.answers:
-        q = ans.get("question")
-        a = ans.get("answer")
-        if not q or not a or q in answered_questions:
-            continue  # Skip invalid or already answered
-
-        # Record user answer
-        conversation.append({"role": "user", "text": a})
-
-        # Build prompt for LLM
-        llm_prompt = f"Question: {q}\nUser answer: {a}"
-        llm_reply = await llm_service.get_next_reply(llm_prompt, conversation)
-        conversation.append({
-            "role": "architai",
-            "text": llm_reply,
-            "meta": json.dumps({"prompt": llm_prompt})
-        })
-
-        # Record answer
-        answers.append({"question": q, "answer": a})
-        answered_questions.add(q)
-
-    # Determine next unanswered questions
-    next_qs = [q for q in questions if q not in answered_questions]
-
-    # Update DB
-    status = "ready_to_finalize" if not next_qs else "in_progress"
-    update_query = sessions.update().where(sessions.c.id == session_id).values(
-        answers=answers,
-        conversation=conversation,
-        status=status,
-        updated_at=now
-    )
-    await database.execute(update_query)
+    with session_errors():
+        data = await session_service.load_session(session_id)
+    conversation, persisted = await conversation_store.load_conversation(session_id, data.get("conversation"))
+
+    # Fetch the LLM replies for all new, valid answers together
+    new_answers = session_service.collect_new_answers(data, request.answers)
+    llm_replies = await llm_service.get_next_replies(new_answers, conversation)
+
+    # Append the new messages and answers; merged with any concurrent reply on conflict
+    with session_errors():
+        data, conversation = await session_service.save_replies(
+            session_id, data, conversation, persisted, list(zip(new_answers, llm_replies))
+        )
+    next_qs = session_service.next_questions(data)
 
     return SessionReplyResponse(
         next_questions=next_qs,
-        status=status,
+        status=data["status"],
         conversation=stringify_meta(conversation),
-        updated_at=now
+        updated_at=data["updated_at"]
     )
 
 
 
+# -----------------------------
+# Conversation over WebSocket
+# -----------------------------
+@router.websocket("/{session_id}/ws")
+async def conversation_socket(websocket: WebSocket, session_id: str):
+    """
+    Answer questions over one connection and get each reply streamed back.
+
+    Client sends:  {"question": ..., "answer": ...} or {"answers": [{...}, ...]}
+    Server sends:
+      state    - {"status", "next_questions"}; on connect and after every saved answer
+      token    - reply text chunks as Gemini produces them ({"text": ...})
+      messages - only the messages added since the last frame, with their seq
+                 (includes messages written concurrently by other clients)
+      error    - {"detail": ...}; the connection stays open unless the session is missing
+    History is never resent; load it once with GET /session/{id}.
+    """
+    await websocket.accept()
+    try:
+        data = await session_service.load_session(session_id)
+    except session_service.SessionNotFound:
+        await websocket.send_json({"type": "error", "detail": "Session not found"})
+        await websocket.close(code=1008)
+        return
+    conversation, persisted = await conversation_store.load_conversation(session_id, data.get("conversation"))
+    await websocket.send_json({
+        "type": "state", "status": data["status"], "next_questions": session_service.next_questions(data)
+    })
+
+    try:
+        while True:
+            try:
+                payload = await websocket.receive_json()
+            except (ValueError, TypeError):
+                await websocket.send_json({"type": "error", "detail": "Invalid JSON"})
+                continue
+            if not isinstance(payload, dict):
+                await websocket.send_json({"type": "error", "detail": "Expected a JSON object"})
+                continue
+            submitted = payload.get("answers") if isinstance(payload.get("answers"), list) else [payload]
+            new_answers = session_service.collect_new_answers(data, submitted)
+            if not new_answers:
+                await websocket.send_json({"type": "error", "detail": "No new valid answers"})
+                continue
+
+            for ans in new_answers:
+                prompt = llm_service.format_answer_prompt(ans["question"], ans["answer"])
+                history = conversation + [{"role": "user", "text": ans["answer"]}]
+                chunks = []
+                try:
+                    async for chunk in llm_service.stream_next_reply(prompt, history):
+                        chunks.append(chunk)
+                        await websocket.send_json({"type": "token", "text": chunk})
+                    sent = len(conversation)
+                    data, conversation = await session_service.save_replies(
+                        session_id, data, conversation, persisted, [(ans, "".join(chunks))]
+                    )
+                except WebSocketDisconnect:
+                    raise
+                except Exception as e:
+                    logger.exception(f"WebSocket reply failed for session {session_id}")
+                    await websocket.send_json({"type": "error", "detail": str(e)})
+                    break
+                persisted = len(conversation)
+                await websocket.send_json({
+                    "type": "messages",
+                    "messages": [
+                        {"seq": seq, **msg}
+                        for seq, msg in enumerate(stringify_meta(conversation[sent:]), start=sent)
+                    ],
+                })
+                await websocket.send_json({
+                    "type": "state", "status": data["status"], "next_questions": session_service.next_questions(data)
+                })
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket closed for session {session_id}")
+
+
 # -----------------------------
 # Finalize session
 # -----------------------------
-@router.post("/{session_id}/finalize", response_model=FinalizeResponse)
-async def finalize_session(session_id: str = Path(..., description="ID of the session")):
-    query = sessions.select().where(sessions.c.id == session_id)
-    session_record = await database.fetch_one(query)
-    if not session_record:
+@contextmanager
+def session_errors():
+    """Map session_service exceptions to HTTP errors."""
+    try:
+        yield
+    except session_service.SessionNotFound:
         raise HTTPException(status_code=404, detail="Session not found")
+    except session_service.SessionNotReady:
+        raise HTTPException(status_code=400, detail="Not all questions answered yet")
+    except session_service.NoFinalDesign:
+        raise HTTPException(status_code=400, detail="Session has not been finalized yet")
+    except session_service.UnknownQuestion:
+        raise HTTPException(status_code=400, detail="Question is not part of this session")
+    except session_service.SessionConflict:
+        raise HTTPException(status_code=409, detail="Session was modified concurrently, retry the request")
 
-    data = record_to_dict(session_record)
-    answers: List[Dict] = data.get("answers") or []
-    questions: List[str] = data.get("questions") or []
 
-    if len(answers) < len(questions):
-        raise HTTPException(status_code=400, detail="Not all questions answered yet")
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
-    conversation: List[Dict] = data.get("conversation") or []
+@router.post("/{session_id}/finalize", response_model=FinalizeResponse)
+async def finalize_session(
+    session_id: str = Path(..., description="ID of the session"),
+    refresh: bool = Query(False, description="Bypass the LLM response cache"),
+):
+    with session_errors():
+        return await session_service.finalize(session_id, bypass_cache=refresh)
+
+
+@router.post("/{session_id}/finalize/stream")
+async def finalize_session_stream(session_id: str = Path(..., description="ID of the session")):
+    """
+    Streaming finalize as Server-Sent Events:
+      token   - raw text chunks from Gemini ({"text": ...}); absent when a speculative draft is used
+      section - a top-level design key once it has parsed ({"name": ..., "value": ...})
+      done    - the full sanitized design, sent after it has been persisted
+      error   - generation failed ({"detail": ...}); nothing is persisted
+    """
+    with session_errors():
+        data = await session_service.load_finalizable_session(session_id)
+    conversation, persisted = await conversation_store.load_conversation(session_id, data.get("conversation"))
     prompt: str = data["prompt"]
-    now = datetime.utcnow()
 
-    # Generate final design
-    final_design = await llm_service.generate_final_design(prompt, conversation)
+    # A matching speculative draft is replayed as sections without token events
+    draft = speculation.usable_draft(data, conversation)
+    if draft is not None:
+        events = speculation.replay_draft(data, draft, conversation)
+    else:
+        events = llm_service.stream_final_design(prompt, conversation, similarity.design_references(data))
+
+    async def event_stream():
+        try:
+            async for kind, payload in events:
+                if kind == "token":
+                    yield sse_event("token", {"text": payload})
+                elif kind == "section":
+                    name, value = payload
+                    yield sse_event("section", {"name": name, "value": value})
+                elif kind == "design":
+                    await session_service.save_final_design(session_id, data, conversation, persisted, payload)
+                    yield sse_event("done", payload)
+        except Exception as e:
+            logger.exception(f"Streaming finalize failed for session {session_id}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    # Log in conversation
-    conversation.append({
-        "role": "architai",
-        "text": str(final_design),
-        "meta": json.dumps({"prompt": prompt})
-    })
 
-    # Update DB
-    update_query = sessions.update().where(sessions.c.id == session_id).values(
-        final_design=final_design,
-        conversation=conversation,
-        status=SessionStatus.completed,
-        updated_at=now
+@router.post("/{session_id}/revise", response_model=ReviseAnswerResponse)
+async def revise_answer(
+    request: ReviseAnswerRequest,
+    session_id: str = Path(..., description="ID of the session"),
+):
+    """Change one answer of a finalized session; only the affected design sections are regenerated."""
+    with session_errors():
+        data, diff, full_regeneration = await session_service.revise_answer(
+            session_id, request.question, request.answer
+        )
+    return ReviseAnswerResponse(
+        final_design=data["final_design"],
+        changed_sections=list(diff),
+        diff=diff,
+        full_regeneration=full_regeneration,
+        updated_at=data["updated_at"],
     )
-    await database.execute(update_query)
 
-    return final_design
+
+# -----------------------------
+# Finalize as a background job
+# -----------------------------
+async def job_to_response(job: Dict) -> JobResponse:
+    result = None
+    if job["kind"] == "finalize" and job["status"] == JobStatus.succeeded:
+        record = await database.fetch_one(
+            select(sessions.c.final_design, sessions.c.archived_at).where(sessions.c.id == job["session_id"])
+        )
+        if record and record["archived_at"]:
+            result = await archive.archived_final_design(job["session_id"])
+        else:
+            result = record["final_design"] if record else None
+    return JobResponse(
+        job_id=job["id"],
+        session_id=job["session_id"],
+        kind=job["kind"],
+        status=job["status"],
+        error=job.get("error"),
+        result=result,
+        created_at=job.get("created_at"),
+        started_at=job.get("started_at"),
+        finished_at=job.get("finished_at"),
+    )
+
+
+@router.post("/{session_id}/finalize/jobs", response_model=JobResponse, status_code=202)
+async def submit_finalize_job(
+    session_id: str = Path(..., description="ID of the session"),
+    refresh: bool = Query(False, description="Bypass the LLM response cache"),
+):
+    """Queue finalize and return immediately; poll GET /session/jobs/{job_id} for the result."""
+    with session_errors():
+        await session_service.load_finalizable_session(session_id)
+    try:
+        job = await job_queue.queue.submit("finalize", session_id, {"refresh": refresh})
+    except job_queue.QueueFull:
+        raise HTTPException(
+            status_code=429,
+            detail="Finalize queue is full, retry later",
+            headers={"Retry-After": "5"},
+        )
+    return await job_to_response(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str = Path(..., description="ID of the job"),
+    wait: float = Query(0, ge=0, le=30, description="Seconds to wait for the job to finish (long-poll)"),
+):
+    job = await job_queue.queue.wait(job_id, timeout=wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await job_to_response(job)
 
 
 # -----------------------------
-# List all sessions
+# List sessions
 # -----------------------------
-@router.get("/", response_model=List[SessionCreateResponse])
-async def list_sessions():
-    all_sessions = await database.fetch_all(sessions.select())
-    response_list = []
+def encode_cursor(updated_at: datetime, session_id: str) -> str:
+    raw = json.dumps({"updated_at": updated_at.isoformat(), "id": session_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(raw["updated_at"]), raw["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Light columns only: conversation, answers and final_design are never loaded here
+SUMMARY_COLUMNS = [
+    sessions.c.id,
+    sessions.c.prompt,
+    sessions.c.status,
+    sessions.c.user_id,
+    sessions.c.questions,
+    sessions.c.created_at,
+    sessions.c.updated_at,
+]
+
+
+@router.get("/", response_model=SessionListResponse)
+async def list_sessions(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    status: Optional[SessionStatus] = Query(None),
+    user_id: Optional[str] = Query(None),
+):
+    """Sessions ordered by most recently updated, one keyset page at a time."""
+    query = select(*SUMMARY_COLUMNS)
+    if status is not None:
+        query = query.where(sessions.c.status == status)
+    if user_id is not None:
+        query = query.where(sessions.c.user_id == user_id)
+    if cursor:
+        cursor_updated_at, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            sessions.c.updated_at < cursor_updated_at,
+            and_(sessions.c.updated_at == cursor_updated_at, sessions.c.id < cursor_id),
+        ))
+    query = query.order_by(sessions.c.updated_at.desc(), sessions.c.id.desc()).limit(limit + 1)
+
+    rows = [record_to_dict(r) for r in await database.fetch_all(query)]
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(last["updated_at"], last["id"])
+
+    items = [
+        SessionSummary(
+            session_id=s["id"],
+            prompt=s["prompt"],
+            status=s["status"],
+            user_id=s.get("user_id"),
+            questions=s["questions"] if s["status"] == SessionStatus.in_progress else [],
+            created_at=s["created_at"],
+            updated_at=s["updated_at"],
+        )
+        for s in page
+    ]
+    return SessionListResponse(items=items, next_cursor=next_cursor)
 
-    for record in all_sessions:
-        s = record_to_dict(record)
-        conv_fixed = stringify_meta(s.get("conversation") or [])
 
-        response_list.append(
-            SessionCreateResponse(
-                session_id=s["id"],
-                questions=s["questions"] if s["status"] == SessionStatus.in_progress else [],
-                conversation=conv_fixed,
-                created_at=s["created_at"],
-                updated_at=s["updated_at"]
-            )
+# -----------------------------
+# Full-text search
+# -----------------------------
+# Declared before /{session_id} so "search" is not taken for a session id
+@router.get("/search", response_model=SessionSearchResponse)
+async def search_sessions(
+    q: str = Query(..., min_length=1, max_length=500, description="words to find, e.g. kafka event sourcing"),
+    limit: int = Query(20, ge=1, le=100),
+    status: Optional[SessionStatus] = Query(None),
+    user_id: Optional[str] = Query(None),
+):
+    """Sessions whose prompt, answers or final design match every word, best match first."""
+    hits = await search.search_sessions(q, limit=limit, status=status, user_id=user_id)
+    items = [
+        SessionSearchHit(
+            session_id=h["id"],
+            prompt=h["prompt"],
+            status=h["status"],
+            user_id=h.get("user_id"),
+            snippet=h["snippet"] or "",
+            rank=h["rank"],
+            updated_at=h["updated_at"],
         )
+        for h in hits
+    ]
+    return SessionSearchResponse(items=items)
+
+
+# -----------------------------
+# Export / import (NDJSON)
+# -----------------------------
+# Declared before /{session_id} so "export" is not taken for a session id
+@router.get("/export")
+async def export_sessions(gzip: bool = Query(False, description="gzip-compress the stream")):
+    """Stream every session, with its messages, as one JSON object per line."""
+    stream = transfer.export_ndjson(settings.SESSION_TRANSFER_BATCH_SIZE, compress=gzip)
+    filename = "sessions.ndjson.gz" if gzip else "sessions.ndjson"
+    return StreamingResponse(
+        stream,
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 
-    return response_list
+@router.post("/import", response_model=SessionImportResponse)
+async def import_sessions(request: Request):
+    """Import an export stream (plain or gzip NDJSON request body); existing session ids are skipped."""
+    try:
+        stats = await transfer.import_ndjson(request.stream(), settings.SESSION_TRANSFER_BATCH_SIZE)
+    except transfer.InvalidRecord as e:
+        raise HTTPException(status_code=400, detail=f"Invalid session record, {e}")
+    return SessionImportResponse(**stats)
 
 
 # -----------------------------
@@ -230,8 +503,9 @@ async def get_session(session_id: str = Path(..., description="ID of the session
     if not session_record:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    data = record_to_dict(session_record)
-    conversation: List[Dict] = stringify_meta(data.get("conversation") or [])
+    data = await archive.hydrate_session(record_to_dict(session_record))
+    conversation, _ = await conversation_store.load_conversation(session_id, data.get("conversation"))
+    conversation = stringify_meta(conversation)
 
     return SessionDetailResponse(
         session_id=data["id"],
@@ -0,0 +1,43 @@
+import argparse
+import asyncio
+
+from app.core.config import settings
+from app.core.db import database
+from app.services import archive
+
+# Usage:
+#   python -m app.core.archive                        archive completed sessions idle for ARCHIVE_AFTER_DAYS
+#   python -m app.core.archive --older-than-days 7 --vacuum
+#   python -m app.core.archive --stats                only report archive size
+
+parser = argparse.ArgumentParser(description="Move completed ArchitAI sessions into compressed storage.")
+parser.add_argument("--older-than-days", type=float, default=settings.ARCHIVE_AFTER_DAYS)
+parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+parser.add_argument("--limit", type=int, default=None, help="archive at most this many sessions")
+parser.add_argument("--level", type=int, default=settings.ARCHIVE_COMPRESSION_LEVEL, help="zlib level 1-9")
+parser.add_argument("--vacuum", action="store_true", help="reclaim freed space afterwards (VACUUM)")
+parser.add_argument("--stats", action="store_true", help="print archive totals without archiving")
+args = parser.parse_args()
+
+
+def ratio(raw: int, stored: int) -> str:
+    return f"{raw} -> {stored} bytes ({1 - stored / raw:.1%} saved)" if raw else "nothing stored"
+
+
+async def main() -> None:
+    await database.connect()
+    try:
+        if not args.stats:
+            stats = await archive.compact(args.older_than_days, args.batch_size, args.limit, args.level)
+            print(f"Archived {stats['archived']} sessions, skipped {stats['skipped']} changed concurrently: "
+                  f"{ratio(stats['raw_bytes'], stats['stored_bytes'])}")
+            if args.vacuum:
+                await database.execute("VACUUM")
+                print("Vacuumed database")
+        totals = await archive.totals()
+        print(f"Archive holds {totals['sessions']} sessions: {ratio(totals['raw_bytes'], totals['stored_bytes'])}")
+    finally:
+        await database.disconnect()
+
+
+asyncio.run(main())
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import sys
+
+from app.core.config import settings
+from app.core.db import database
+from app.services import transfer
+
+# Usage:
+#   python -m app.core.backup export -o sessions.ndjson.gz --gzip
+#   python -m app.core.backup import sessions.ndjson.gz     (plain or gzip, detected automatically)
+#   "-" reads from stdin / writes to stdout
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def read_chunks(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def export(args) -> None:
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        async for chunk in transfer.export_ndjson(args.batch_size, compress=args.gzip):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+async def import_(args) -> None:
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    try:
+        stats = await transfer.import_ndjson(read_chunks(source), args.batch_size)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    print(f"Imported {stats['imported']} sessions ({stats['messages']} messages), "
+          f"skipped {stats['skipped']} existing", file=sys.stderr)
+
+
+async def main(args) -> None:
+    await database.connect()
+    try:
+        await args.func(args)
+    finally:
+        await database.disconnect()
+
+
+parser = argparse.ArgumentParser(description="Export or import ArchitAI sessions as NDJSON.")
+parser.add_argument("--batch-size", type=int, default=settings.SESSION_TRANSFER_BATCH_SIZE)
+commands = parser.add_subparsers(required=True)
+
+export_parser = commands.add_parser("export", help="write every session to a file")
+export_parser.add_argument("-o", "--output", default="-")
+export_parser.add_argument("--gzip", action="store_true")
+export_parser.set_defaults(func=export)
+
+import_parser = commands.add_parser("import", help="load sessions from an export file")
+import_parser.add_argument("input", nargs="?", default="-")
+import_parser.set_defaults(func=import_)
+
+asyncio.run(main(parser.parse_args()))
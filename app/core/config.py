@@ -1,13 +1,121 @@
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     APP_NAME: str = "ArchitAI"
     VERSION: str = "0.1"
-    DATABASE_URL: str = "sqlite+aiosqlite:///./architai.db"
+    DATABASE_URL: str = "sqlite+aiosqlite:///./architai.db"   # or postgresql+asyncpg://... for multi-worker deployments
+    DB_AUTO_MIGRATE: bool = True                # run non-destructive migrations on startup
+    DB_POOL_MIN_SIZE: int = 1                   # Postgres connection pool, per worker process
+    DB_POOL_MAX_SIZE: int = 10
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000          # wait for the write lock instead of failing with "database is locked"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"          # safe with WAL; FULL trades write latency for durability on power loss
+    SQLITE_CACHE_SIZE_KB: int = 16384
+    SESSION_TRANSFER_BATCH_SIZE: int = 200      # sessions per chunk for NDJSON export/import
+    SESSION_WRITE_MAX_ATTEMPTS: int = 5         # compare-and-swap retries before a session write returns 409
 
-    # Gemini API settings
-    GOOGLE_GEMINI_API_KEY: str
+    # Archival of completed sessions into compressed blobs (see app/services/archive.py)
+    ARCHIVE_AFTER_DAYS: float = 30.0            # completed sessions untouched this long are archived
+    ARCHIVE_BATCH_SIZE: int = 100
+    ARCHIVE_INTERVAL_SECONDS: int = 0           # in-app compaction period; 0 = only via python -m app.core.archive
+    ARCHIVE_COMPRESSION_LEVEL: int = 6          # zlib level, 1 (fastest) .. 9 (smallest)
+
+    # LLM provider (see app/services/llm_providers.py): "gemini" or "openai"
+    LLM_PROVIDER: str = "gemini"
+    LLM_MODEL: Optional[str] = None             # default model; falls back to GOOGLE_GEMINI_MODEL
+
+    # Gemini API settings (key only required when LLM_PROVIDER=gemini and not replaying)
+    GOOGLE_GEMINI_API_KEY: Optional[str] = None
     GOOGLE_GEMINI_MODEL: str = "gemini-1.5"  # default model
+    GOOGLE_GEMINI_BASE_URL: str = "https://generativelanguage.googleapis.com/v1beta"
+
+    # OpenAI API settings (LLM_PROVIDER=openai); OPENAI_BASE_URL for compatible servers
+    OPENAI_API_KEY: Optional[str] = None
+    OPENAI_BASE_URL: Optional[str] = None
+
+    # Record/replay of LLM exchanges: "off", "record" (save real calls) or "replay" (offline)
+    LLM_RECORD_MODE: str = "off"
+    LLM_RECORDINGS_DIR: str = "recordings"
+    LLM_REPLAY_LATENCY_SECONDS: Optional[float] = None  # fixed latency; None replays the recorded one
+    LLM_REPLAY_LATENCY_SCALE: float = 1.0               # multiplier for recorded latencies
+    LLM_REPLAY_JITTER: float = 0.0                      # up to this fraction of extra random latency
+
+    # Model routing: questions/replies/summaries use the fast tier, finalize the large tier.
+    # Unset tiers fall back to LLM_MODEL / GOOGLE_GEMINI_MODEL.
+    LLM_MODEL_FAST: Optional[str] = None
+    LLM_MODEL_LARGE: Optional[str] = None
+    LLM_ROUTES: Dict[str, str] = {}             # per-operation override, e.g. {"finalize": "gemini-2.5-pro"}
+    LLM_MODEL_FALLBACK: Optional[str] = None    # used when the primary model errors or is slow
+    LLM_FALLBACK_AFTER_SECONDS: float = 20.0
+    # per-operation override; large-tier calls normally run longer than the default
+    LLM_FALLBACK_AFTER: Dict[str, float] = {"finalize": 90.0, "revise": 90.0}
+
+    # Shared HTTP client (connection pool) settings
+    HTTP_POOL_LIMIT: int = 100            # max open connections overall
+    HTTP_POOL_LIMIT_PER_HOST: int = 20    # max open connections per upstream host
+    HTTP_KEEPALIVE_TIMEOUT: float = 30.0  # seconds an idle connection is kept
+    HTTP_DNS_CACHE_TTL: int = 300         # seconds DNS lookups are cached
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP_READ_TIMEOUT: float = 60.0
+    HTTP_TOTAL_TIMEOUT: float = 120.0
+
+    # Multi-answer replies: "sequential", "concurrent" or "batched"
+    REPLY_MODE: str = "concurrent"
+    REPLY_CONCURRENCY: int = 4            # max parallel Gemini calls per reply request
+
+    # LLM response cache
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL_SECONDS: int = 24 * 3600
+    LLM_CACHE_MAX_ENTRIES: int = 512            # in-process LRU tier
+    LLM_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    LLM_CACHE_PERSIST: bool = True              # also keep responses in the llm_cache table
+    LLM_CACHE_DB_MAX_ENTRIES: int = 10000
+    LLM_SINGLE_FLIGHT: bool = True              # coalesce concurrent identical requests
+
+    # Prompt construction: older turns beyond the budget are folded into a rolling summary
+    PROMPT_TOKEN_BUDGET: int = 6000
+    PROMPT_RECENT_MESSAGES: int = 8             # newest messages kept verbatim when over budget
+    PROMPT_SUMMARY_TOKENS: int = 400
+    PROMPT_SUMMARY_MODE: str = "llm"            # "llm" or "extractive" (no extra Gemini call)
+
+    # Final design: constrain output with a responseSchema derived from FinalizeResponse
+    LLM_STRUCTURED_OUTPUT: bool = True
+    # Generate a draft design in the background as soon as a session is ready_to_finalize (opt-in)
+    LLM_SPECULATIVE_FINALIZE: bool = False
+    LLM_SPECULATIVE_MAX_INFLIGHT: int = 4       # concurrent speculative generations per process
+
+    # Warm start from similar past sessions (see app/services/similarity.py)
+    SIMILARITY_ENABLED: bool = True
+    SIMILARITY_DIM: int = 512                   # hashed n-gram vector size
+    SIMILARITY_MAX_ENTRIES: int = 20000         # most recent sessions kept in the per-process index
+    SIMILARITY_QUESTION_THRESHOLD: float = 0.85 # cosine similarity above which a past prompt's questions are reused
+    SIMILARITY_DESIGN_TOP_K: int = 3            # similar completed designs given to finalize as reference (0 = off)
+    SIMILARITY_DESIGN_THRESHOLD: float = 0.35
+    SIMILARITY_REFERENCE_CHARS: int = 600       # max length of each reference design summary
+
+    # Upstream protection around Gemini calls
+    LLM_REQUEST_DEADLINE_SECONDS: float = 30.0  # total budget per call, retries included
+    LLM_MAX_ATTEMPTS: int = 3
+    LLM_CONCURRENCY_INITIAL: int = 8            # AIMD limiter: starting concurrent calls
+    LLM_CONCURRENCY_MIN: int = 1
+    LLM_CONCURRENCY_MAX: int = 64
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5      # consecutive failures before failing fast
+    LLM_CIRCUIT_RECOVERY_SECONDS: float = 30.0
+
+    # Hedged requests (off by default): duplicate requests slower than the latency percentile
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_BUDGET: float = 0.05              # max fraction of requests that may be hedged
+    LLM_HEDGE_MIN_SAMPLES: int = 20             # latencies to observe per model before hedging
+
+    # Background job queue (async finalize)
+    JOB_WORKERS: int = 2                        # concurrent jobs per process
+    JOB_QUEUE_MAX_DEPTH: int = 100              # pending jobs before submissions get 429
+    JOB_STALE_SECONDS: int = 600                # running jobs older than this are assumed orphaned and re-queued
+
+    # Debug logging of full Gemini payloads (off by default; sampled per request)
+    LLM_LOG_PAYLOADS: bool = False
+    LLM_LOG_SAMPLE_RATE: float = 0.01
 
     class Config:
         env_file = ".env"   # automatically load keys from .env
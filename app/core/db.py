@@ -1,5 +1,100 @@
+import sqlite3
+
 from databases import Database
 from app.core.config import settings
+from app.core.metrics import DB_QUERY_SECONDS
 
 DATABASE_URL = settings.DATABASE_URL
-database = Database(DATABASE_URL)
+
+
+def is_sqlite(url: str = DATABASE_URL) -> bool:
+    return url.startswith("sqlite")
+
+
+def sync_database_url(url: str = DATABASE_URL) -> str:
+    """URL for SQLAlchemy's sync engine (migrations, CLI scripts): drop the async driver suffix."""
+    return url.replace("+aiosqlite", "").replace("+asyncpg", "")
+
+
+def sqlite_pragmas() -> list:
+    """Per-connection pragmas for single-node SQLite: WAL lets readers run alongside the writer."""
+    return [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+class SQLitePragmaConnection(sqlite3.Connection):
+    """sqlite3 connection factory applying sqlite_pragmas() to every new connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for pragma in sqlite_pragmas():
+            self.execute(pragma)
+
+    def execute(self, sql, *args):
+        # databases opens transactions with a deferred BEGIN. A write that first reads
+        # (e.g. the FTS5 search triggers) must then upgrade its lock, and SQLite fails
+        # that with "database is locked" right away instead of waiting busy_timeout.
+        # Every transaction here writes, so take the write lock up front.
+        if sql == "BEGIN":
+            sql = "BEGIN IMMEDIATE"
+        return super().execute(sql, *args)
+
+
+def database_options() -> dict:
+    if is_sqlite():
+        return {
+            "factory": SQLitePragmaConnection,
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+    return {
+        "min_size": settings.DB_POOL_MIN_SIZE,
+        "max_size": settings.DB_POOL_MAX_SIZE,
+    }
+
+
+def query_label(query) -> str:
+    """Short, low-cardinality metrics label such as 'select_sessions' or 'insert_messages'."""
+    if isinstance(query, str):
+        words = query.split(None, 1)
+        return words[0].lower() if words else "raw"
+    verb = getattr(query, "__visit_name__", "query")
+    table = getattr(query, "table", None)
+    if table is None:
+        table = getattr(query, "element", None)  # DDL such as CreateTable
+    if table is None and hasattr(query, "get_final_froms"):
+        froms = query.get_final_froms()
+        table = froms[0] if froms else None
+    name = getattr(table, "name", None)
+    return f"{verb}_{name}" if name else verb
+
+
+class InstrumentedDatabase(Database):
+    """databases.Database that records per-query latency in DB_QUERY_SECONDS."""
+
+    async def fetch_all(self, query, values=None):
+        with DB_QUERY_SECONDS.time(query=query_label(query)):
+            return await super().fetch_all(query, values)
+
+    async def fetch_one(self, query, values=None):
+        with DB_QUERY_SECONDS.time(query=query_label(query)):
+            return await super().fetch_one(query, values)
+
+    async def fetch_val(self, query, values=None, column=0):
+        with DB_QUERY_SECONDS.time(query=query_label(query)):
+            return await super().fetch_val(query, values, column=column)
+
+    async def execute(self, query, values=None):
+        with DB_QUERY_SECONDS.time(query=query_label(query)):
+            return await super().execute(query, values)
+
+    async def execute_many(self, query, values):
+        with DB_QUERY_SECONDS.time(query=query_label(query)):
+            return await super().execute_many(query, values)
+
+
+database = InstrumentedDatabase(DATABASE_URL, **database_options())
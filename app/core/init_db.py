@@ -1,16 +1,31 @@
+import argparse
+import logging
+
 from sqlalchemy import create_engine
+from app.core import migrations
+from app.core.db import sync_database_url
 from app.models.db_models import metadata
-from app.core.config import settings
 
-# Remove "+aiosqlite" if present, SQLAlchemy sync engine
-engine = create_engine(settings.DATABASE_URL.replace("+aiosqlite", ""), echo=True)
+# Usage:
+#   python -m app.core.init_db           create / upgrade the schema, keeping data
+#   python -m app.core.init_db --reset   drop every table first (destroys all data)
+
+parser = argparse.ArgumentParser(description="Create or upgrade the ArchitAI database schema.")
+parser.add_argument("--reset", action="store_true", help="drop all tables before creating them (destroys data)")
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO)
 
-# Drop all tables
-print("Dropping all tables...")
-metadata.drop_all(engine)
-print("Tables dropped successfully!")
+if args.reset:
+    engine = create_engine(sync_database_url(), echo=True)
+    print("Dropping all tables...")
+    with engine.begin() as conn:
+        migrations.drop_search_index(conn)
+    metadata.drop_all(engine)
+    migrations.schema_migrations.drop(engine, checkfirst=True)
+    print("Tables dropped successfully!")
+    engine.dispose()
 
-# Create tables again
-print("Creating tables...")
-metadata.create_all(engine)
-print("Tables created successfully!")
+print("Migrating schema...")
+migrations.run()
+print("Schema is up to date!")
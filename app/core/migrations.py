@@ -0,0 +1,274 @@
+"""
+Non-destructive schema migrations.
+
+`run()` brings any existing database up to the current metadata without
+dropping data:
+  1. creates missing tables,
+  2. adds missing columns (ALTER TABLE ... ADD COLUMN; new columns must be
+     nullable or have a server default),
+  3. creates missing indexes,
+  4. applies versioned data migrations not yet recorded in schema_migrations
+     (including dialect-specific objects such as the full-text search index).
+
+Concurrent runs (several workers starting at once) are serialized with an
+advisory lock on Postgres and BEGIN IMMEDIATE on SQLite.
+"""
+import json
+import logging
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, create_engine, event, func, inspect, null, select, text
+)
+from sqlalchemy.schema import CreateColumn
+
+from app.core.db import is_sqlite, sqlite_pragmas, sync_database_url
+from app.models.db_models import metadata, messages, sessions
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK_ID = 0x41524348  # arbitrary constant for pg_advisory_xact_lock
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def create_migration_engine(url: str = None):
+    url = url or sync_database_url()
+    engine = create_engine(url)
+    if is_sqlite(url):
+        # pysqlite does not emit BEGIN itself; take the write lock up front instead
+        @event.listens_for(engine, "connect")
+        def _autocommit_driver(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+            for pragma in sqlite_pragmas():
+                dbapi_connection.execute(pragma)
+
+        @event.listens_for(engine, "begin")
+        def _begin_immediate(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+    return engine
+
+
+# -----------------------------
+# Versioned data migrations
+# -----------------------------
+def _backfill_messages(conn) -> None:
+    """Move legacy sessions.conversation JSON into the append-only messages table."""
+    already = select(messages.c.session_id).distinct()
+    rows = conn.execute(
+        select(sessions.c.id, sessions.c.conversation)
+        .where(sessions.c.conversation.is_not(None))
+        .where(sessions.c.id.not_in(already))
+    ).fetchall()
+
+    batch = []
+    for session_id, conversation in rows:
+        for seq, msg in enumerate(conversation or []):
+            meta = msg.get("meta")  # legacy rows may hold dicts; the messages table stores JSON strings
+            batch.append({
+                "session_id": session_id,
+                "seq": seq,
+                "role": msg.get("role", ""),
+                "text": msg.get("text", ""),
+                "meta": meta if meta is None or isinstance(meta, str) else json.dumps(meta),
+                "created_at": datetime.utcnow(),
+            })
+        # updated_at is pinned (or its onupdate would stamp every legacy session with the migration time)
+        conn.execute(
+            sessions.update()
+            .where(sessions.c.id == session_id)
+            .values(conversation=null(), updated_at=sessions.c.updated_at)
+        )
+        if len(batch) >= 500:
+            conn.execute(messages.insert(), batch)
+            batch = []
+    if batch:
+        conn.execute(messages.insert(), batch)
+    logger.info(f"Backfilled messages for {len(rows)} sessions")
+
+
+# Full-text search over prompt, answer texts and the final design's strings (diagrams
+# excluded), kept current by triggers on sessions so every writer updates it.
+# SQLite: FTS5 table keyed by search_docs.id (an explicit INTEGER PRIMARY KEY, so
+# VACUUM cannot renumber it the way it can sessions' implicit rowid).
+_SQLITE_SEARCH_REFRESH = """
+    INSERT OR IGNORE INTO search_docs(session_id) VALUES (NEW.id);
+    DELETE FROM sessions_fts WHERE rowid = (SELECT id FROM search_docs WHERE session_id = NEW.id);
+    INSERT INTO sessions_fts(rowid, prompt, answers, design) VALUES (
+        (SELECT id FROM search_docs WHERE session_id = NEW.id),
+        NEW.prompt,
+        (SELECT group_concat(json_extract(value, '$.answer'), ' ') FROM json_each(NEW.answers)),
+        (SELECT group_concat(value, ' ') FROM json_tree(NEW.final_design)
+         WHERE type = 'text' AND fullkey NOT LIKE '$.mermaid%' AND fullkey NOT LIKE '$.diagram%')
+    );
+"""
+
+SQLITE_SEARCH_DDL = [
+    "CREATE TABLE IF NOT EXISTS search_docs (id INTEGER PRIMARY KEY, session_id VARCHAR NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts USING fts5(prompt, answers, design, tokenize='porter unicode61')",
+    # bm25 weights per column: prompt, answers, design
+    "INSERT INTO sessions_fts(sessions_fts, rank) VALUES('rank', 'bm25(10.0, 4.0, 2.0)')",
+    f"CREATE TRIGGER IF NOT EXISTS sessions_fts_insert AFTER INSERT ON sessions BEGIN {_SQLITE_SEARCH_REFRESH} END",
+    "CREATE TRIGGER IF NOT EXISTS sessions_fts_update AFTER UPDATE OF prompt, answers, final_design ON sessions "
+    f"BEGIN {_SQLITE_SEARCH_REFRESH} END",
+    """
+    CREATE TRIGGER IF NOT EXISTS sessions_fts_delete AFTER DELETE ON sessions
+    BEGIN
+        DELETE FROM sessions_fts WHERE rowid = (SELECT id FROM search_docs WHERE session_id = OLD.id);
+        DELETE FROM search_docs WHERE session_id = OLD.id;
+    END
+    """,
+]
+
+# Postgres: weighted tsvector in a side table with a GIN index
+POSTGRES_SEARCH_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS session_search (
+        session_id VARCHAR PRIMARY KEY REFERENCES sessions(id) ON DELETE CASCADE,
+        body TEXT NOT NULL,
+        document TSVECTOR NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_session_search_document ON session_search USING GIN (document)",
+    """
+    CREATE OR REPLACE FUNCTION session_search_refresh() RETURNS trigger AS $$
+    DECLARE
+        answers_text TEXT;
+        design_text TEXT;
+    BEGIN
+        IF json_typeof(NEW.answers) = 'array' THEN
+            SELECT string_agg(a->>'answer', ' ') INTO answers_text FROM json_array_elements(NEW.answers) a;
+        END IF;
+        IF NEW.final_design IS NOT NULL AND json_typeof(NEW.final_design) = 'object' THEN
+            SELECT string_agg(v #>> '{}', ' ') INTO design_text
+            FROM jsonb_path_query(NEW.final_design::jsonb - ARRAY['mermaid', 'diagrams', 'diagram_url'], 'strict $.**') v
+            WHERE jsonb_typeof(v) = 'string';
+        END IF;
+        INSERT INTO session_search(session_id, body, document) VALUES (
+            NEW.id,
+            concat_ws(' ', NEW.prompt, answers_text, design_text),
+            setweight(to_tsvector('english', coalesce(NEW.prompt, '')), 'A')
+                || setweight(to_tsvector('english', coalesce(answers_text, '')), 'B')
+                || setweight(to_tsvector('english', coalesce(design_text, '')), 'C')
+        )
+        ON CONFLICT (session_id) DO UPDATE SET body = EXCLUDED.body, document = EXCLUDED.document;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS session_search_refresh ON sessions",
+    """
+    CREATE TRIGGER session_search_refresh AFTER INSERT OR UPDATE OF prompt, answers, final_design ON sessions
+    FOR EACH ROW EXECUTE FUNCTION session_search_refresh()
+    """,
+]
+
+SEARCH_DROP_DDL = {
+    "sqlite": [
+        "DROP TRIGGER IF EXISTS sessions_fts_update",
+        "DROP TRIGGER IF EXISTS sessions_fts_insert",
+        "DROP TRIGGER IF EXISTS sessions_fts_delete",
+        "DROP TABLE IF EXISTS sessions_fts",
+        "DROP TABLE IF EXISTS search_docs",
+    ],
+    "postgresql": [
+        "DROP TABLE IF EXISTS session_search",
+        "DROP FUNCTION IF EXISTS session_search_refresh() CASCADE",
+    ],
+}
+
+
+def _create_search_index(conn) -> None:
+    """Create the full-text index and its triggers, then index existing sessions."""
+    ddl = SQLITE_SEARCH_DDL if conn.dialect.name == "sqlite" else POSTGRES_SEARCH_DDL
+    for statement in ddl:
+        conn.exec_driver_sql(statement)
+    # A no-op update fires the refresh trigger for every existing row
+    result = conn.execute(sessions.update().values(prompt=sessions.c.prompt, updated_at=sessions.c.updated_at))
+    logger.info(f"Indexed {result.rowcount} sessions for full-text search")
+
+
+def _skip_archived_in_search_index(conn) -> None:
+    """Archiving clears final_design on the hot row; keep the search index entry as it was."""
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("DROP TRIGGER IF EXISTS sessions_fts_update")
+        conn.exec_driver_sql(
+            "CREATE TRIGGER sessions_fts_update AFTER UPDATE OF prompt, answers, final_design ON sessions "
+            f"WHEN NEW.archived_at IS NULL BEGIN {_SQLITE_SEARCH_REFRESH} END"
+        )
+    else:
+        conn.exec_driver_sql("DROP TRIGGER IF EXISTS session_search_refresh ON sessions")
+        conn.exec_driver_sql(
+            "CREATE TRIGGER session_search_refresh AFTER INSERT OR UPDATE OF prompt, answers, final_design "
+            "ON sessions FOR EACH ROW WHEN (NEW.archived_at IS NULL) EXECUTE FUNCTION session_search_refresh()"
+        )
+
+
+def drop_search_index(conn) -> None:
+    """Drop the objects created by _create_search_index (used by init_db --reset)."""
+    for statement in SEARCH_DROP_DDL.get(conn.dialect.name, []):
+        conn.exec_driver_sql(statement)
+
+
+# (version, name, fn) - append only, never renumber
+DATA_MIGRATIONS = [
+    (1, "backfill_messages_from_conversation_json", _backfill_messages),
+    (2, "create_session_search_index", _create_search_index),
+    (3, "skip_archived_sessions_in_search_index", _skip_archived_in_search_index),
+]
+
+
+# -----------------------------
+# Schema sync
+# -----------------------------
+def _add_missing_columns(conn) -> None:
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+
+def _create_missing_indexes(conn) -> None:
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def run(url: str = None) -> None:
+    engine = create_migration_engine(url)
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+        metadata.create_all(conn, checkfirst=True)
+        schema_migrations.create(conn, checkfirst=True)
+        _add_missing_columns(conn)
+        _create_missing_indexes(conn)
+
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+        for version, name, fn in DATA_MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info(f"Applying migration {version}: {name}")
+            fn(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+
+        current = conn.execute(select(func.max(schema_migrations.c.version))).scalar()
+    engine.dispose()
+    logger.info(f"Database schema is up to date (data migration version {current})")
@@ -1,5 +1,5 @@
 from sqlalchemy import (
-    MetaData, Table, Column, String, JSON, Enum, DateTime
+    MetaData, Table, Column, String, JSON, Enum, DateTime, Text, Integer, Index, ForeignKey, LargeBinary
 )
 import enum
 from datetime import datetime
@@ -18,10 +18,82 @@ sessions = Table(
     Column("prompt", String, nullable=False),
     Column("questions", JSON, nullable=False),
     Column("answers", JSON, nullable=False),
-    Column("conversation", JSON, nullable=True),  # Optional, for direct chat history
+    Column("conversation", JSON, nullable=True),  # Legacy chat history, superseded by the messages table
     Column("final_design", JSON, nullable=True),
+    # Speculative finalize draft, valid only while draft_inputs_hash matches (see services/speculation.py)
+    Column("draft_design", JSON, nullable=True),
+    Column("draft_raw", Text, nullable=True),
+    Column("draft_inputs_hash", String, nullable=True),
     Column("status", Enum(SessionStatus), default=SessionStatus.in_progress),
     Column("user_id", String, nullable=True),  # For future multi-user support
+    Column("version", Integer, nullable=False, default=0, server_default="0"),  # bumped on every write (compare-and-swap)
+    # Set while final_design and the messages live compressed in session_archive (see services/archive.py)
+    Column("archived_at", DateTime, nullable=True),
     Column("created_at", DateTime, default=datetime.utcnow),
     Column("updated_at", DateTime, default=datetime.utcnow, onupdate=datetime.utcnow),
+    # Keyset pagination of the session list, optionally filtered by status or user
+    Index("ix_sessions_updated_at_id", "updated_at", "id"),
+    Index("ix_sessions_status_updated_at", "status", "updated_at"),
+    Index("ix_sessions_user_id_updated_at", "user_id", "updated_at"),
+)
+
+# Append-only conversation log, one row per message
+messages = Table(
+    "messages",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("session_id", String, ForeignKey("sessions.id"), nullable=False),
+    Column("seq", Integer, nullable=False),  # position in the conversation, 0-based
+    Column("role", String, nullable=False),
+    Column("text", Text, nullable=False),
+    Column("meta", Text, nullable=True),     # JSON-encoded string, as returned by the API
+    Column("created_at", DateTime, default=datetime.utcnow),
+    Index("ix_messages_session_seq", "session_id", "seq", unique=True),
+)
+
+class JobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+# Background jobs (e.g. async finalize), processed by app/services/job_queue.py
+jobs = Table(
+    "jobs",
+    metadata,
+    Column("id", String, primary_key=True),
+    Column("session_id", String, ForeignKey("sessions.id"), nullable=False),
+    Column("kind", String, nullable=False),  # e.g. "finalize"
+    Column("params", JSON, nullable=True),
+    Column("status", Enum(JobStatus), nullable=False, default=JobStatus.queued),
+    Column("error", Text, nullable=True),
+    Column("created_at", DateTime, default=datetime.utcnow),
+    Column("started_at", DateTime, nullable=True),
+    Column("finished_at", DateTime, nullable=True),
+    Index("ix_jobs_status_created_at", "status", "created_at"),
+    Index("ix_jobs_session_id", "session_id"),
+)
+
+# Cold tier for completed sessions: final_design and messages as one compressed JSON blob
+session_archive = Table(
+    "session_archive",
+    metadata,
+    Column("session_id", String, ForeignKey("sessions.id"), primary_key=True),
+    Column("codec", String, nullable=False),  # "zlib"
+    Column("payload", LargeBinary, nullable=False),  # {"final_design": {...}, "messages": [...]}
+    Column("raw_bytes", Integer, nullable=False),
+    Column("stored_bytes", Integer, nullable=False),
+    Column("archived_at", DateTime, default=datetime.utcnow),
+)
+
+# Persistent tier of the LLM response cache (see app/services/llm_cache.py)
+llm_cache = Table(
+    "llm_cache",
+    metadata,
+    Column("key", String, primary_key=True),  # sha256 of (model, prompt, generation params)
+    Column("model", String, nullable=False),
+    Column("response", Text, nullable=False),
+    Column("size_bytes", Integer, nullable=False),
+    Column("created_at", DateTime, default=datetime.utcnow),
+    Index("ix_llm_cache_created_at", "created_at"),
 )
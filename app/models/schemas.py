@@ -64,6 +64,94 @@ class FinalizeResponse(BaseModel):
     diagrams: Optional[List[Any]] = None  # e.g. {"system_architecture": "..."}
 
 
+# -----------------------------
+# Incremental re-finalize
+# -----------------------------
+class DesignPatch(BaseModel):
+    """Sections of a final design that changed; omitted (null) sections are kept as they are."""
+    summary: Optional[str] = None
+    components: Optional[List[Component]] = None  # new or updated components, matched by name
+    removed_components: List[str] = []
+    db_schema: Optional[str] = None
+    mermaid: Optional[str] = None
+    tech_stack: Optional[List[str]] = None
+    integration_steps: Optional[List[str]] = None
+    rationale: Optional[str] = None
+
+
+class ReviseAnswerRequest(BaseModel):
+    question: str
+    answer: str
+
+
+class ReviseAnswerResponse(BaseModel):
+    final_design: FinalizeResponse
+    changed_sections: List[str]
+    # {"summary": {"before": ..., "after": ...}, "components": {"added": [...], "updated": [...], "removed": [...]}}
+    diff: Dict[str, Any]
+    full_regeneration: bool = False  # the patch could not be used and the whole design was regenerated
+    updated_at: Optional[datetime] = None
+
+
+# -----------------------------
+# Export / import
+# -----------------------------
+class SessionImportResponse(BaseModel):
+    imported: int
+    skipped: int  # already present, by session id
+    messages: int
+
+
+# -----------------------------
+# Background jobs
+# -----------------------------
+class JobResponse(BaseModel):
+    job_id: str
+    session_id: str
+    kind: str
+    status: str  # "queued", "running", "succeeded" or "failed"
+    error: Optional[str] = None
+    result: Optional[FinalizeResponse] = None  # set once a finalize job has succeeded
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+# -----------------------------
+# Session list
+# -----------------------------
+class SessionSummary(BaseModel):
+    session_id: str
+    prompt: str
+    status: str
+    user_id: Optional[str] = None
+    questions: List[str] = []
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+class SessionListResponse(BaseModel):
+    items: List[SessionSummary]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= to fetch the next page
+
+
+# -----------------------------
+# Search
+# -----------------------------
+class SessionSearchHit(BaseModel):
+    session_id: str
+    prompt: str
+    status: str
+    user_id: Optional[str] = None
+    snippet: str  # matched terms wrapped in <mark></mark>
+    rank: float  # higher is more relevant; only comparable within one response
+    updated_at: Optional[datetime] = None
+
+
+class SessionSearchResponse(BaseModel):
+    items: List[SessionSearchHit]
+
+
 # -----------------------------
 # Session detail
 # -----------------------------
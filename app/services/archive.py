@@ -0,0 +1,237 @@
+# app/services/archive.py
+"""
+Tiered storage for completed sessions.
+
+Hot rows keep everything a list or search needs (prompt, questions, answers,
+status, timestamps). Once a completed session has not been updated for
+ARCHIVE_AFTER_DAYS, compact() moves its heavy parts - final_design and the
+whole conversation, including the raw design dumps - into one
+zlib-compressed JSON blob in session_archive, and sets sessions.archived_at.
+
+Reads are transparent: hydrate_session() puts the archived final_design and
+conversation back on the session dict. The conversation comes back as the
+legacy JSON conversation with nothing persisted, so the first write to an
+archived session (a reply, revise or re-finalize) re-inserts its messages,
+and update_session() clears archived_at and drops the blob in the same
+transaction. Archiving bumps sessions.version so it never races a writer.
+"""
+import asyncio
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, func, null, or_, select
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.db import database
+from app.models.db_models import messages, session_archive, sessions, SessionStatus
+from app.services.conversation_store import row_to_message
+
+logger = logging.getLogger(__name__)
+
+CODEC = "zlib"
+
+ARCHIVED_SESSIONS = metrics.counter("architai_archived_sessions_total", "Sessions moved to compressed storage")
+ARCHIVED_BYTES = metrics.counter(
+    "architai_archived_bytes_total", "Archived payload size before (raw) and after (stored) compression", ["kind"]
+)
+
+
+class _Skip(Exception):
+    pass
+
+
+# -----------------------------
+# Encoding
+# -----------------------------
+def encode_payload(final_design: Optional[Dict], conversation: List[Dict]) -> bytes:
+    raw = json.dumps({"final_design": final_design, "messages": conversation}, separators=(",", ":"))
+    return raw.encode()
+
+
+def decode_payload(codec: str, payload: bytes) -> Dict:
+    if codec != CODEC:
+        raise ValueError(f"Unknown archive codec {codec!r}")
+    return json.loads(zlib.decompress(payload))
+
+
+# -----------------------------
+# Reads
+# -----------------------------
+async def load_payloads(session_ids: List[str]) -> Dict[str, Dict]:
+    """Decoded archive payloads by session id; ids without an archive are left out."""
+    if not session_ids:
+        return {}
+    rows = await database.fetch_all(
+        select(session_archive.c.session_id, session_archive.c.codec, session_archive.c.payload)
+        .where(session_archive.c.session_id.in_(session_ids))
+    )
+    return {r["session_id"]: decode_payload(r["codec"], r["payload"]) for r in rows}
+
+
+def hydrate(data: Dict, payload: Optional[Dict]) -> Dict:
+    """Put an archived final_design and conversation back on a session dict."""
+    if payload is not None:
+        data["final_design"] = payload.get("final_design")
+        data["conversation"] = payload.get("messages") or []
+    return data
+
+
+async def hydrate_session(data: Dict) -> Dict:
+    if not data.get("archived_at"):
+        return data
+    payloads = await load_payloads([data["id"]])
+    return hydrate(data, payloads.get(data["id"]))
+
+
+async def archived_final_design(session_id: str) -> Optional[Dict]:
+    payload = (await load_payloads([session_id])).get(session_id)
+    return payload.get("final_design") if payload else None
+
+
+# -----------------------------
+# Compaction
+# -----------------------------
+async def _archive_one(row: Dict, conversation: List[Dict], level: int) -> Optional[Dict]:
+    """Archive one session unless it changed since it was read; returns its size stats."""
+    raw = encode_payload(row["final_design"], conversation)
+    payload = zlib.compress(raw, level)
+    now = datetime.utcnow()
+    try:
+        async with database.transaction():
+            # updated_at is kept (explicitly, or its onupdate would apply): archiving is not a user-visible change
+            updated = await database.fetch_one(
+                sessions.update()
+                .where(sessions.c.id == row["id"])
+                .where(sessions.c.version == row["version"])
+                .where(sessions.c.archived_at.is_(None))
+                .values(
+                    final_design=null(),
+                    conversation=null(),
+                    archived_at=now,
+                    version=sessions.c.version + 1,
+                    updated_at=sessions.c.updated_at,
+                )
+                .returning(sessions.c.id)
+            )
+            if updated is None:
+                raise _Skip()
+            await database.execute(session_archive.insert().values(
+                session_id=row["id"],
+                codec=CODEC,
+                payload=payload,
+                raw_bytes=len(raw),
+                stored_bytes=len(payload),
+                archived_at=now,
+            ))
+            await database.execute(messages.delete().where(messages.c.session_id == row["id"]))
+    except _Skip:
+        return None
+    return {"raw_bytes": len(raw), "stored_bytes": len(payload)}
+
+
+async def compact(
+    older_than_days: float = None, batch_size: int = None, limit: int = None, level: int = None
+) -> Dict:
+    """
+    Archive completed sessions not updated for `older_than_days`, oldest first.
+    Returns {"archived", "skipped", "raw_bytes", "stored_bytes"}; sessions
+    written concurrently are skipped and picked up by a later run.
+    """
+    older_than_days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    level = settings.ARCHIVE_COMPRESSION_LEVEL if level is None else level
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    stats = {"archived": 0, "skipped": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+    cursor = None
+    while limit is None or stats["archived"] + stats["skipped"] < limit:
+        take = batch_size if limit is None else min(batch_size, limit - stats["archived"] - stats["skipped"])
+        query = (
+            select(sessions.c.id, sessions.c.version, sessions.c.final_design,
+                   sessions.c.conversation, sessions.c.updated_at)
+            .where(sessions.c.status == SessionStatus.completed)
+            .where(sessions.c.archived_at.is_(None))
+            .where(sessions.c.updated_at < cutoff)
+            .order_by(sessions.c.updated_at, sessions.c.id)
+            .limit(take)
+        )
+        if cursor is not None:
+            query = query.where(or_(
+                sessions.c.updated_at > cursor[0],
+                and_(sessions.c.updated_at == cursor[0], sessions.c.id > cursor[1]),
+            ))
+        rows = [dict(r) for r in await database.fetch_all(query)]
+        if not rows:
+            break
+        cursor = (rows[-1]["updated_at"], rows[-1]["id"])
+
+        message_rows = await database.fetch_all(
+            messages.select()
+            .where(messages.c.session_id.in_([r["id"] for r in rows]))
+            .order_by(messages.c.session_id, messages.c.seq)
+        )
+        by_session: Dict[str, List[Dict]] = {}
+        for m in message_rows:
+            by_session.setdefault(m["session_id"], []).append(row_to_message(m))
+
+        for row in rows:
+            conversation = by_session.get(row["id"]) or list(row["conversation"] or [])
+            result = await _archive_one(row, conversation, level)
+            if result is None:
+                stats["skipped"] += 1
+                continue
+            stats["archived"] += 1
+            stats["raw_bytes"] += result["raw_bytes"]
+            stats["stored_bytes"] += result["stored_bytes"]
+
+    if stats["archived"]:
+        ARCHIVED_SESSIONS.inc(stats["archived"])
+        ARCHIVED_BYTES.inc(stats["raw_bytes"], kind="raw")
+        ARCHIVED_BYTES.inc(stats["stored_bytes"], kind="stored")
+        logger.info(
+            f"Archived {stats['archived']} sessions: {stats['raw_bytes']} -> {stats['stored_bytes']} bytes"
+        )
+    return stats
+
+
+async def totals() -> Dict:
+    """Archive-wide size figures: sessions, raw and stored bytes."""
+    row = await database.fetch_one(select(
+        func.count(session_archive.c.session_id).label("sessions"),
+        func.coalesce(func.sum(session_archive.c.raw_bytes), 0).label("raw_bytes"),
+        func.coalesce(func.sum(session_archive.c.stored_bytes), 0).label("stored_bytes"),
+    ))
+    return dict(row)
+
+
+class Compactor:
+    """Runs compact() every `interval` seconds in the background; interval 0 disables it."""
+
+    def __init__(self, interval: int):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await compact()
+            except Exception:
+                logger.exception("Session archival failed")
+
+
+compactor = Compactor(interval=settings.ARCHIVE_INTERVAL_SECONDS)
@@ -0,0 +1,134 @@
+# app/services/context_manager.py
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DESIGN_KINDS = {"design", "design_raw", "design_patch"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def message_kind(msg: Dict) -> Optional[str]:
+    meta = msg.get("meta")
+    if isinstance(meta, str):
+        try:
+            meta = json.loads(meta)
+        except json.JSONDecodeError:
+            return None
+    return meta.get("kind") if isinstance(meta, dict) else None
+
+
+def is_design_dump(msg: Dict) -> bool:
+    """
+    Final design payloads logged in the conversation. Older sessions have no
+    'kind' in meta, so they are recognised by their JSON / dict-repr prefix.
+    """
+    if message_kind(msg) in DESIGN_KINDS:
+        return True
+    text = (msg.get("text") or "").lstrip()
+    return msg.get("role") == "architai" and text.startswith(("```json", "{'summary'", '{"summary"'))
+
+
+def format_message(msg: Dict) -> str:
+    return f"{msg['role']}: {msg['text']}"
+
+
+class ContextManager:
+    """
+    Fit a conversation into a prompt token budget.
+
+    Conversations that fit are used verbatim. Otherwise the most recent
+    messages (at most `recent_messages`, fewer if they alone exceed the
+    budget) stay verbatim and everything older is replaced by a rolling
+    summary. Summaries are cached by a hash chain over the summarized
+    prefix, so each new turn only summarizes the messages that newly fell
+    out of the recent window, on top of the previous summary.
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        recent_messages: int,
+        summary_tokens: int,
+        summarizer: Optional[Callable[[str, List[Dict]], Awaitable[str]]] = None,
+        cache_size: int = 1024,
+    ):
+        self.token_budget = token_budget
+        self.recent_messages = recent_messages
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        self.cache_size = cache_size
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+
+    async def fit(self, conversation: List[Dict], reserved_tokens: int = 0) -> Tuple[Optional[str], List[Dict]]:
+        """Return (summary or None, messages to include verbatim)."""
+        history = [m for m in conversation if not is_design_dump(m)]
+        available = max(self.token_budget - reserved_tokens, 0)
+        sizes = [estimate_tokens(format_message(m)) for m in history]
+        if sum(sizes) <= available:
+            return None, history
+
+        # Recent window: newest messages that fit next to the summary
+        window_budget = max(available - self.summary_tokens, 0)
+        boundary = len(history)
+        used = 0
+        while boundary > 0 and len(history) - boundary < self.recent_messages:
+            if used + sizes[boundary - 1] > window_budget:
+                break
+            used += sizes[boundary - 1]
+            boundary -= 1
+
+        summary = await self._summary_for(history[:boundary])
+        return summary, history[boundary:]
+
+    async def _summary_for(self, messages: List[Dict]) -> Optional[str]:
+        if not messages:
+            return None
+
+        # Hash chain over the prefix: chain[i] identifies messages[:i]
+        chain = [hashlib.sha256(b"").hexdigest()]
+        for msg in messages:
+            chain.append(hashlib.sha256((chain[-1] + format_message(msg)).encode("utf-8")).hexdigest())
+
+        start, summary = 0, None
+        for i in range(len(messages), 0, -1):
+            if chain[i] in self._summaries:
+                start, summary = i, self._summaries[chain[i]]
+                self._summaries.move_to_end(chain[i])
+                break
+        if start == len(messages):
+            return summary
+
+        summary = await self._extend(summary, messages[start:])
+        self._summaries[chain[-1]] = summary
+        while len(self._summaries) > self.cache_size:
+            self._summaries.popitem(last=False)
+        return summary
+
+    async def _extend(self, summary: Optional[str], new_messages: List[Dict]) -> str:
+        if self.summarizer is not None:
+            try:
+                updated = await self.summarizer(summary or "", new_messages)
+                if updated:
+                    return self._clip(updated)
+            except Exception as e:
+                logger.warning(f"Conversation summarization failed, using extractive summary: {e}")
+        return self._extractive(summary, new_messages)
+
+    def _extractive(self, summary: Optional[str], new_messages: List[Dict]) -> str:
+        lines = [summary] if summary else []
+        lines += [format_message(m)[:200] for m in new_messages]
+        return self._clip("\n".join(lines), keep_tail=True)
+
+    def _clip(self, text: str, keep_tail: bool = False) -> str:
+        max_chars = self.summary_tokens * 4
+        if len(text) <= max_chars:
+            return text
+        return text[-max_chars:] if keep_tail else text[:max_chars]
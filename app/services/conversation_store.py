@@ -0,0 +1,60 @@
+# app/services/conversation_store.py
+import json
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from app.core.db import database
+from app.models.db_models import messages
+
+
+def row_to_message(row) -> Dict:
+    msg = {"role": row["role"], "text": row["text"]}
+    if row["meta"] is not None:
+        msg["meta"] = row["meta"]
+    return msg
+
+
+async def load_conversation(session_id: str, legacy: List[Dict] = None) -> Tuple[List[Dict], int]:
+    """
+    Return (conversation, persisted) for a session.
+
+    `persisted` is how many of the returned messages already have rows in the
+    messages table; everything after that index still needs to be appended.
+    Sessions that predate the messages table fall back to their legacy JSON
+    conversation with persisted=0, so the first append migrates them.
+    """
+    query = (
+        messages.select()
+        .where(messages.c.session_id == session_id)
+        .order_by(messages.c.seq)
+    )
+    rows = await database.fetch_all(query)
+    if rows:
+        conversation = [row_to_message(r) for r in rows]
+        return conversation, len(conversation)
+    return list(legacy or []), 0
+
+
+async def append_messages(session_id: str, conversation: List[Dict], persisted: int) -> int:
+    """
+    Insert conversation[persisted:] as new rows and return the new persisted count.
+    Existing rows are never rewritten.
+    """
+    new_messages = conversation[persisted:]
+    if not new_messages:
+        return persisted
+
+    now = datetime.utcnow()
+    values = []
+    for seq, msg in enumerate(new_messages, start=persisted):
+        meta = msg.get("meta")
+        values.append({
+            "session_id": session_id,
+            "seq": seq,
+            "role": msg["role"],
+            "text": msg["text"],
+            "meta": meta if meta is None or isinstance(meta, str) else json.dumps(meta),
+            "created_at": now,
+        })
+    await database.execute_many(messages.insert(), values)
+    return len(conversation)
@@ -0,0 +1,58 @@
+# app/services/http_client.py
+import logging
+from typing import Optional
+
+import aiohttp
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# One pooled client for the whole process, opened/closed by the app lifespan.
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def _build_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=settings.HTTP_POOL_LIMIT,
+        limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=settings.HTTP_TOTAL_TIMEOUT,
+        connect=settings.HTTP_CONNECT_TIMEOUT,
+        sock_read=settings.HTTP_READ_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def start() -> None:
+    """Open the shared client. Called from the FastAPI lifespan hook."""
+    global _session
+    if _session is None or _session.closed:
+        _session = _build_session()
+        logger.info(
+            f"HTTP client started (pool={settings.HTTP_POOL_LIMIT}, "
+            f"per_host={settings.HTTP_POOL_LIMIT_PER_HOST})"
+        )
+
+
+async def close() -> None:
+    """Close the shared client and release pooled connections."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("HTTP client closed")
+    _session = None
+
+
+def get_client() -> aiohttp.ClientSession:
+    """
+    Return the shared client. Outside the app lifespan (scripts, one-off
+    calls) the client is created lazily on first use.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = _build_session()
+    return _session
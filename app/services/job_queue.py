@@ -0,0 +1,203 @@
+# app/services/job_queue.py
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core import metrics
+from sqlalchemy import and_, or_
+
+from app.core.config import settings
+from app.core.db import database
+from app.models.db_models import jobs, JobStatus
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[str, Dict], Awaitable[None]]
+
+JOBS_TOTAL = metrics.counter("architai_jobs_total", "Background jobs by final outcome", ["kind", "status"])
+JOB_QUEUE_DEPTH = metrics.gauge("architai_job_queue_depth", "Jobs waiting for a worker")
+JOB_SECONDS = metrics.histogram("architai_job_seconds", "Background job run time", ["kind"])
+
+
+class QueueFull(Exception):
+    """The queue is at JOB_QUEUE_MAX_DEPTH; the caller should back off and retry."""
+
+
+class JobQueue:
+    """
+    Bounded in-process worker pool backed by the jobs table.
+
+    Job state lives in the database so clients can poll it from any worker
+    and so unfinished jobs survive a restart: on start(), queued jobs and
+    jobs stuck in running for JOB_STALE_SECONDS are re-queued. Several
+    processes may recover the same job; a worker only runs a job after
+    atomically claiming it (queued -> running). Handlers must still be safe
+    to re-run.
+    """
+
+    def __init__(self, workers: int, max_depth: int, stale_seconds: int = 600):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.stale_seconds = stale_seconds
+        self.handlers: Dict[str, JobHandler] = {}
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._done_events: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}
+        self._running: set = set()
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self.handlers[kind] = handler
+
+    async def start(self) -> None:
+        # Running jobs may belong to another live worker; only take over stale ones
+        stale_before = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        query = (
+            jobs.select()
+            .where(or_(
+                jobs.c.status == JobStatus.queued,
+                and_(jobs.c.status == JobStatus.running, jobs.c.started_at < stale_before),
+            ))
+            .order_by(jobs.c.created_at)
+        )
+        unfinished = await database.fetch_all(query)
+        for row in unfinished:
+            if row["status"] == JobStatus.running:
+                await database.execute(
+                    jobs.update()
+                    .where(jobs.c.id == row["id"])
+                    .where(jobs.c.status == JobStatus.running)
+                    .values(status=JobStatus.queued)
+                )
+            self._enqueue(row["id"])
+        if unfinished:
+            logger.info(f"Recovered {len(unfinished)} unfinished jobs")
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stop the workers and hand interrupted jobs back to the queue for the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job_id in list(self._running):
+            await self._set_status(job_id, JobStatus.queued)
+        self._running.clear()
+
+    async def submit(self, kind: str, session_id: str, params: Optional[Dict] = None) -> Dict:
+        """
+        Queue a job, or return the existing unfinished job of the same kind for
+        this session so double submits do not run twice.
+        """
+        existing = await database.fetch_one(
+            jobs.select()
+            .where(jobs.c.session_id == session_id)
+            .where(jobs.c.kind == kind)
+            .where(jobs.c.status.in_([JobStatus.queued, JobStatus.running]))
+        )
+        if existing:
+            return dict(existing)
+        if self._queue.qsize() >= self.max_depth:
+            raise QueueFull()
+
+        job_id = str(uuid.uuid4())
+        await database.execute(jobs.insert().values(
+            id=job_id,
+            session_id=session_id,
+            kind=kind,
+            params=params or {},
+            status=JobStatus.queued,
+            created_at=datetime.utcnow(),
+        ))
+        self._enqueue(job_id)
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        row = await database.fetch_one(jobs.select().where(jobs.c.id == job_id))
+        return dict(row) if row else None
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """Long-poll: return the job once finished or after `timeout` seconds, whichever is first."""
+        # Register before reading the status, so a job finishing in between still sets our event
+        event = self._done_events.setdefault(job_id, asyncio.Event())
+        self._waiters[job_id] = self._waiters.get(job_id, 0) + 1
+        try:
+            job = await self.get(job_id)
+            if job is None or timeout <= 0 or job["status"] in (JobStatus.succeeded, JobStatus.failed):
+                return job
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return await self.get(job_id)
+        finally:
+            # Jobs run by another process never set (and drop) their event here
+            self._waiters[job_id] -= 1
+            if not self._waiters[job_id]:
+                del self._waiters[job_id]
+                self._done_events.pop(job_id, None)
+
+    def _enqueue(self, job_id: str) -> None:
+        self._queue.put_nowait(job_id)
+        JOB_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _set_status(self, job_id: str, status: JobStatus, **values) -> None:
+        await database.execute(jobs.update().where(jobs.c.id == job_id).values(status=status, **values))
+
+    async def _claim(self, job_id: str) -> bool:
+        """Atomically move a job from queued to running; False if another worker got it first."""
+        claimed = await database.fetch_one(
+            jobs.update()
+            .where(jobs.c.id == job_id)
+            .where(jobs.c.status == JobStatus.queued)
+            .values(status=JobStatus.running, started_at=datetime.utcnow())
+            .returning(jobs.c.id)
+        )
+        return claimed is not None
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            JOB_QUEUE_DEPTH.set(self._queue.qsize())
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception(f"Job worker {index} failed to record job {job_id}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        if not await self._claim(job_id):
+            return
+        self._running.add(job_id)
+        job = await self.get(job_id)
+        handler = self.handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job kind '{job['kind']}'")
+            with JOB_SECONDS.time(kind=job["kind"]):
+                await handler(job["session_id"], job.get("params") or {})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job_id} ({job['kind']}) failed")
+            self._running.discard(job_id)
+            await self._set_status(job_id, JobStatus.failed, error=str(e), finished_at=datetime.utcnow())
+            JOBS_TOTAL.inc(kind=job["kind"], status="failed")
+        else:
+            self._running.discard(job_id)
+            await self._set_status(job_id, JobStatus.succeeded, finished_at=datetime.utcnow())
+            JOBS_TOTAL.inc(kind=job["kind"], status="succeeded")
+        finally:
+            event = self._done_events.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+
+queue = JobQueue(
+    workers=settings.JOB_WORKERS,
+    max_depth=settings.JOB_QUEUE_MAX_DEPTH,
+    stale_seconds=settings.JOB_STALE_SECONDS,
+)
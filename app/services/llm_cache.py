@@ -0,0 +1,182 @@
+# app/services/llm_cache.py
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, delete
+
+from app.core.config import settings
+from app.core.db import database
+from app.models.db_models import llm_cache
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(model: str, prompt: str, params: Optional[Dict] = None) -> str:
+    """Content address of an LLM request: sha256 over model, full prompt and generation params."""
+    material = json.dumps(
+        {"model": model, "prompt": prompt, "params": params or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier response cache:
+      memory - bounded LRU (entry count and total bytes), per-entry TTL
+      disk   - optional rows in the llm_cache table, TTL plus max row count
+    Disk failures are logged and treated as misses so the cache never
+    breaks an LLM call.
+    """
+
+    # Prune the disk tier every N writes rather than on every insert
+    PRUNE_EVERY = 50
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        ttl_seconds: int,
+        persist: bool,
+        db_max_entries: int,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self.db_max_entries = db_max_entries
+
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._writes_since_prune = 0
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "bypassed": 0,
+        }
+
+    # -----------------------------
+    # Memory tier
+    # -----------------------------
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._memory_drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._memory_drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._memory_drop(oldest)
+            self.stats["evictions"] += 1
+
+    def _memory_drop(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value.encode("utf-8"))
+
+    # -----------------------------
+    # Disk tier
+    # -----------------------------
+    async def _disk_get(self, key: str) -> Optional[str]:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        query = select(llm_cache.c.response).where(
+            llm_cache.c.key == key,
+            llm_cache.c.created_at >= cutoff,
+        )
+        try:
+            row = await database.fetch_one(query)
+        except Exception as e:
+            logger.warning(f"LLM cache disk read failed: {e}")
+            return None
+        return row["response"] if row else None
+
+    async def _disk_set(self, key: str, model: str, value: str) -> None:
+        try:
+            await database.execute(delete(llm_cache).where(llm_cache.c.key == key))
+            await database.execute(llm_cache.insert().values(
+                key=key,
+                model=model,
+                response=value,
+                size_bytes=len(value.encode("utf-8")),
+                created_at=datetime.utcnow(),
+            ))
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= self.PRUNE_EVERY:
+                self._writes_since_prune = 0
+                await self.prune()
+        except Exception as e:
+            logger.warning(f"LLM cache disk write failed: {e}")
+
+    async def prune(self) -> None:
+        """Drop expired rows and keep at most db_max_entries of the newest ones."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        await database.execute(delete(llm_cache).where(llm_cache.c.created_at < cutoff))
+        keep = (
+            select(llm_cache.c.key)
+            .order_by(llm_cache.c.created_at.desc())
+            .limit(self.db_max_entries)
+        )
+        await database.execute(delete(llm_cache).where(llm_cache.c.key.not_in(keep)))
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    async def get(self, key: str) -> Optional[str]:
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+        if self.persist:
+            value = await self._disk_get(key)
+            if value is not None:
+                self.stats["disk_hits"] += 1
+                self._memory_set(key, value)
+                return value
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, model: str, value: str) -> None:
+        self._memory_set(key, value)
+        if self.persist:
+            await self._disk_set(key, model, value)
+
+    def clear_memory(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def snapshot(self) -> Dict:
+        """Counters plus current memory tier occupancy."""
+        return {
+            **self.stats,
+            "memory_entries": len(self._entries),
+            "memory_bytes": self._bytes,
+        }
+
+
+cache = LLMCache(
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    max_bytes=settings.LLM_CACHE_MAX_BYTES,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+    persist=settings.LLM_CACHE_PERSIST,
+    db_max_entries=settings.LLM_CACHE_DB_MAX_ENTRIES,
+)
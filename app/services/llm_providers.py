@@ -0,0 +1,358 @@
+# app/services/llm_providers.py
+"""
+LLM backends behind llm_service's call path.
+
+A provider only speaks one vendor's wire protocol: it sends a single prompt
+and returns a Completion (or yields streamed text). Retries, deadlines, the
+concurrency limiter, circuit breakers, caching and routing stay in
+llm_service and apply to every provider alike. Failures are raised as
+UpstreamError, with status None for network errors and timeouts.
+
+  gemini  - Google Gemini REST API (default)
+  openai  - OpenAI chat completions (or any compatible endpoint via OPENAI_BASE_URL)
+
+LLM_RECORD_MODE wraps the configured provider:
+  record  - pass calls through and save every exchange under LLM_RECORDINGS_DIR
+  replay  - serve saved exchanges with synthetic latency, no network or API key needed
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiohttp
+
+from app.core.config import settings
+from app.services import http_client, llm_cache
+from app.services.resilience import UpstreamError, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+class Completion:
+    def __init__(self, text: str, prompt_tokens: int = 0, response_tokens: int = 0, raw: str = ""):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = response_tokens
+        self.raw = raw or text  # provider response body, for size metrics and debug logging
+
+
+class LLMProvider:
+    name = "base"
+
+    async def generate(self, prompt: str, model: str, generation_config: Optional[Dict], timeout: float) -> Completion:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, model: str, generation_config: Optional[Dict]) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+
+# -----------------------------
+# Gemini
+# -----------------------------
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str], base_url: str):
+        if not api_key:
+            raise RuntimeError("GOOGLE_GEMINI_API_KEY is not set (required for LLM_PROVIDER=gemini)")
+        self.api_key = api_key
+        self.base_url = base_url
+
+    def _request(self, prompt: str, generation_config: Optional[Dict]):
+        headers = {
+            "Content-Type": "application/json",
+            "X-Goog-Api-Key": self.api_key,
+        }
+        payload = {
+            "contents": [{"parts": [{"text": prompt}]}]
+        }
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return headers, payload
+
+    async def generate(self, prompt: str, model: str, generation_config: Optional[Dict], timeout: float) -> Completion:
+        url = f"{self.base_url}/models/{model}:generateContent"
+        headers, payload = self._request(prompt, generation_config)
+        logger.debug(f"Gemini request URL: {url}")
+        session = http_client.get_client()
+        # A per-request ClientTimeout replaces the session's, so carry its connect/read limits over
+        request_timeout = aiohttp.ClientTimeout(
+            total=min(timeout, settings.HTTP_TOTAL_TIMEOUT),
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            sock_read=settings.HTTP_READ_TIMEOUT,
+        )
+        try:
+            async with session.post(url, headers=headers, json=payload, timeout=request_timeout) as resp:
+                text = await resp.text()
+                if resp.status != 200:
+                    raise UpstreamError(
+                        resp.status, f"Gemini API error {resp.status}: {text}",
+                        retry_after=parse_retry_after(resp.headers.get("Retry-After")),
+                    )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise UpstreamError(None, f"Gemini API error: {type(e).__name__}: {e}")
+
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise UpstreamError(None, f"Gemini API returned an invalid body: {e}")
+        usage = data.get("usageMetadata") or {}
+        candidates = data.get("candidates", [])
+        if not candidates:
+            logger.warning("Gemini returned no candidates")
+            return Completion("", raw=text)
+
+        parts = candidates[0].get("content", {}).get("parts", [])
+        text_parts = [part.get("text") if isinstance(part, dict) else str(part) for part in parts]
+        return Completion(
+            "\n".join([t.strip() for t in text_parts]),
+            prompt_tokens=usage.get("promptTokenCount", 0),
+            response_tokens=usage.get("candidatesTokenCount", 0),
+            raw=text,
+        )
+
+    async def stream(self, prompt: str, model: str, generation_config: Optional[Dict]) -> AsyncIterator[str]:
+        url = f"{self.base_url}/models/{model}:streamGenerateContent?alt=sse"
+        headers, payload = self._request(prompt, generation_config)
+        logger.debug(f"Gemini stream request URL: {url}")
+        session = http_client.get_client()
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=settings.HTTP_READ_TIMEOUT)
+        try:
+            async with session.post(url, headers=headers, json=payload, timeout=timeout) as resp:
+                if resp.status != 200:
+                    text = await resp.text()
+                    raise UpstreamError(
+                        resp.status, f"Gemini API error {resp.status}: {text}",
+                        retry_after=parse_retry_after(resp.headers.get("Retry-After")),
+                    )
+                async for raw_line in resp.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = json.loads(line[len("data:"):])
+                    for candidate in data.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            text = part.get("text") if isinstance(part, dict) else str(part)
+                            if text:
+                                yield text
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise UpstreamError(None, f"Gemini API error: {type(e).__name__}: {e}")
+
+
+# -----------------------------
+# OpenAI
+# -----------------------------
+class OpenAIProvider(LLMProvider):
+    """
+    Chat completions with the prompt as one user message. Gemini's generation
+    config is mapped onto the closest OpenAI options; a responseSchema becomes
+    plain JSON mode since Gemini schemas are not OpenAI strict schemas.
+    """
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str], base_url: Optional[str]):
+        import openai
+
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY is not set (required for LLM_PROVIDER=openai)")
+        self.openai = openai
+        # Retries are done by llm_service so they share the deadline and breaker
+        self.client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    @staticmethod
+    def _options(generation_config: Optional[Dict]) -> Dict:
+        config = generation_config or {}
+        options = {}
+        if config.get("responseMimeType") == "application/json":
+            options["response_format"] = {"type": "json_object"}
+        if "temperature" in config:
+            options["temperature"] = config["temperature"]
+        if "maxOutputTokens" in config:
+            options["max_tokens"] = config["maxOutputTokens"]
+        return options
+
+    def _error(self, e: Exception) -> UpstreamError:
+        if isinstance(e, self.openai.APIStatusError):
+            return UpstreamError(
+                e.status_code, f"OpenAI API error {e.status_code}: {e.message}",
+                retry_after=parse_retry_after(e.response.headers.get("Retry-After")),
+            )
+        return UpstreamError(None, f"OpenAI API error: {type(e).__name__}: {e}")
+
+    async def generate(self, prompt: str, model: str, generation_config: Optional[Dict], timeout: float) -> Completion:
+        try:
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                timeout=timeout,
+                **self._options(generation_config),
+            )
+        except self.openai.OpenAIError as e:
+            raise self._error(e)
+        usage = response.usage
+        return Completion(
+            (response.choices[0].message.content or "") if response.choices else "",
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            response_tokens=usage.completion_tokens if usage else 0,
+            raw=response.model_dump_json(),
+        )
+
+    async def stream(self, prompt: str, model: str, generation_config: Optional[Dict]) -> AsyncIterator[str]:
+        try:
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                **self._options(generation_config),
+            )
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except self.openai.OpenAIError as e:
+            raise self._error(e)
+
+
+# -----------------------------
+# Record / replay
+# -----------------------------
+class RecordReplayProvider(LLMProvider):
+    """
+    Exchanges are stored one JSON file per request, named by the same content
+    address as the response cache (model, prompt, generation config):
+      {"model", "prompt", "generation_config", "text", "chunks", "latency_seconds",
+       "prompt_tokens", "response_tokens"}
+
+    Replay sleeps for the recorded latency times `latency_scale`, or for a
+    fixed `latency_seconds` when set, plus up to `jitter` (a fraction) extra.
+    A request with no recording fails with status 404.
+    """
+    name = "replay"
+
+    def __init__(self, directory: str, inner: Optional[LLMProvider] = None,
+                 latency_seconds: Optional[float] = None, latency_scale: float = 1.0, jitter: float = 0.0):
+        self.directory = directory
+        self.inner = inner  # None: replay only
+        self.latency_seconds = latency_seconds
+        self.latency_scale = latency_scale
+        self.jitter = jitter
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, prompt: str, model: str, generation_config: Optional[Dict]) -> str:
+        return os.path.join(self.directory, llm_cache.make_key(model, prompt, generation_config) + ".json")
+
+    def _write(self, path: str, exchange: Dict) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(exchange, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+    def _read(self, path: str) -> Optional[Dict]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    async def _load(self, prompt: str, model: str, generation_config: Optional[Dict]) -> Dict:
+        exchange = await asyncio.to_thread(self._read, self._path(prompt, model, generation_config))
+        if exchange is None:
+            raise UpstreamError(404, f"No recorded LLM exchange for model {model} and this prompt")
+        return exchange
+
+    async def _record(self, prompt: str, model: str, generation_config: Optional[Dict], **fields) -> None:
+        exchange = {"model": model, "prompt": prompt, "generation_config": generation_config, **fields}
+        await asyncio.to_thread(self._write, self._path(prompt, model, generation_config), exchange)
+
+    def _latency(self, recorded: float) -> float:
+        base = self.latency_seconds if self.latency_seconds is not None else recorded * self.latency_scale
+        return base * (1 + random.uniform(0, self.jitter))
+
+    async def generate(self, prompt: str, model: str, generation_config: Optional[Dict], timeout: float) -> Completion:
+        if self.inner is not None:
+            start = time.monotonic()
+            completion = await self.inner.generate(prompt, model, generation_config, timeout)
+            await self._record(
+                prompt, model, generation_config,
+                text=completion.text,
+                chunks=None,
+                latency_seconds=round(time.monotonic() - start, 4),
+                prompt_tokens=completion.prompt_tokens,
+                response_tokens=completion.response_tokens,
+            )
+            return completion
+
+        exchange = await self._load(prompt, model, generation_config)
+        delay = self._latency(exchange.get("latency_seconds") or 0.0)
+        if delay > timeout:
+            await asyncio.sleep(timeout)
+            raise UpstreamError(None, "Replayed LLM exchange exceeded the request timeout")
+        await asyncio.sleep(delay)
+        text = exchange["text"] if exchange.get("text") is not None else "".join(exchange.get("chunks") or [])
+        return Completion(
+            text,
+            prompt_tokens=exchange.get("prompt_tokens", 0),
+            response_tokens=exchange.get("response_tokens", 0),
+        )
+
+    async def stream(self, prompt: str, model: str, generation_config: Optional[Dict]) -> AsyncIterator[str]:
+        if self.inner is not None:
+            start = time.monotonic()
+            chunks: List[str] = []
+            async for chunk in self.inner.stream(prompt, model, generation_config):
+                chunks.append(chunk)
+                yield chunk
+            await self._record(
+                prompt, model, generation_config,
+                text="".join(chunks),
+                chunks=chunks,
+                latency_seconds=round(time.monotonic() - start, 4),
+            )
+            return
+
+        exchange = await self._load(prompt, model, generation_config)
+        chunks = exchange.get("chunks") or [exchange.get("text") or ""]
+        per_chunk = self._latency(exchange.get("latency_seconds") or 0.0) / len(chunks)
+        for chunk in chunks:
+            await asyncio.sleep(per_chunk)
+            yield chunk
+
+
+# -----------------------------
+# Provider selection
+# -----------------------------
+_provider: Optional[LLMProvider] = None
+
+
+def build_provider() -> LLMProvider:
+    mode = settings.LLM_RECORD_MODE
+    if mode == "replay":
+        return RecordReplayProvider(
+            settings.LLM_RECORDINGS_DIR,
+            latency_seconds=settings.LLM_REPLAY_LATENCY_SECONDS,
+            latency_scale=settings.LLM_REPLAY_LATENCY_SCALE,
+            jitter=settings.LLM_REPLAY_JITTER,
+        )
+
+    if settings.LLM_PROVIDER == "openai":
+        provider: LLMProvider = OpenAIProvider(settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL)
+    elif settings.LLM_PROVIDER == "gemini":
+        provider = GeminiProvider(settings.GOOGLE_GEMINI_API_KEY, settings.GOOGLE_GEMINI_BASE_URL)
+    else:
+        raise RuntimeError(f"Unknown LLM_PROVIDER '{settings.LLM_PROVIDER}' (expected gemini or openai)")
+
+    if mode == "record":
+        return RecordReplayProvider(settings.LLM_RECORDINGS_DIR, inner=provider)
+    return provider
+
+
+def get_provider() -> LLMProvider:
+    """The configured provider, built on first use so the app imports without any API key."""
+    global _provider
+    if _provider is None:
+        _provider = build_provider()
+        logger.info(f"LLM provider: {settings.LLM_PROVIDER} (record mode: {settings.LLM_RECORD_MODE})")
+    return _provider
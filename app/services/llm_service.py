@@ -1,20 +1,38 @@
 # app/services/llm_service.py
+import asyncio
+import hashlib
 import json
+import random
 import re
-import aiohttp
 import logging
-from typing import List, Dict
-from tenacity import retry, stop_after_attempt, wait_exponential
+import time
+from pydantic import ValidationError
+from typing import Any, AsyncIterator, List, Dict, Optional, Tuple
+from tenacity import (
+    AsyncRetrying, retry_if_exception, stop_after_attempt, stop_before_delay, wait_exponential
+)
+from app.core import metrics
 from app.core.config import settings
+from app.services import llm_cache
+from app.services.llm_providers import get_provider
+from app.services.resilience import (
+    AIMDLimiter, CircuitBreaker, CircuitOpenError, DeadlineExceeded, HedgePolicy, UpstreamError,
+    is_retryable, wait_retry_after,
+)
+from app.services.context_manager import ContextManager, estimate_tokens
+from app.models.schemas import DesignPatch, FinalizeResponse
+from app.utils.json_stream import JSONSectionParser, repair_json
+from app.utils.response_schema import gemini_response_schema
 
 # -----------------------------
 # Config
 # -----------------------------
-GEMINI_API_KEY = settings.GOOGLE_GEMINI_API_KEY
-DEFAULT_MODEL = getattr(settings, "GOOGLE_GEMINI_MODEL", "gemini-2.0-flash")
+DEFAULT_MODEL = settings.LLM_MODEL or settings.GOOGLE_GEMINI_MODEL
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
+if settings.LLM_LOG_PAYLOADS:
+    logger.setLevel(logging.DEBUG)
 
 # -----------------------------
 # Helpers
@@ -29,86 +47,545 @@ def parse_json_safe(raw_text: str, fallback_key: str = "summary") -> Dict:
         logger.warning(f"Failed to parse JSON. Using fallback key '{fallback_key}'. Raw: {raw_text}")
         return {fallback_key: raw_text}
 
-def build_prompt(conversation: List[Dict], user_prompt: str, system_prompt: str = None) -> str:
+def build_prompt(conversation: List[Dict], user_prompt: str, system_prompt: str = None, summary: str = None) -> str:
     messages = []
     if system_prompt:
         messages.append(f"system: {system_prompt}")
+    if summary:
+        messages.append(f"summary of earlier conversation: {summary}")
     for msg in conversation:
         messages.append(f"{msg['role']}: {msg['text']}")
     messages.append(f"user: {user_prompt}")
     return "\n".join(messages)
 
+async def build_budgeted_prompt(conversation: List[Dict], user_prompt: str, system_prompt: str = None) -> str:
+    """
+    build_prompt within PROMPT_TOKEN_BUDGET: older turns are folded into a rolling
+    summary and logged final-design dumps are left out (see context_manager).
+    """
+    reserved = estimate_tokens(user_prompt) + (estimate_tokens(system_prompt) if system_prompt else 0)
+    summary, recent = await context.fit(conversation, reserved_tokens=reserved)
+    return build_prompt(recent, user_prompt, system_prompt=system_prompt, summary=summary)
+
+def format_answer_prompt(question: str, answer: str) -> str:
+    return f"Question: {question}\nUser answer: {answer}"
+
 def clean_gemini_json_text(raw_text: str) -> str:
     """Remove markdown code fences like ```json ... ``` from Gemini output."""
     return re.sub(r"^```json\s*|\s*```$", "", raw_text.strip(), flags=re.MULTILINE)
 
 # -----------------------------
-# Core Gemini call with retry
+# Core Gemini call with cache and retry
 # -----------------------------
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-async def _call_gemini(prompt: str, model: str) -> str:
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-    headers = {
-        "Content-Type": "application/json",
-        "X-Goog-Api-Key": GEMINI_API_KEY,
-    }
-    payload = {
-        "contents": [{"parts": [{"text": prompt}]}]
-    }
+async def _call_gemini(prompt: str, model: str, generation_config: Dict = None, bypass_cache: bool = False) -> str:
+    """
+    Return Gemini's text for `prompt`, served from the response cache when an
+    identical (model, prompt, generation_config) request was answered before.
+    Pass bypass_cache=True to force a fresh upstream call (the result is still stored).
+    """
+    key = llm_cache.make_key(model, prompt, generation_config)
+    if settings.LLM_CACHE_ENABLED:
+        if bypass_cache:
+            llm_cache.cache.stats["bypassed"] += 1
+        else:
+            cached = await llm_cache.cache.get(key)
+            if cached is not None:
+                logger.debug(f"LLM cache hit for {model} ({key[:12]})")
+                return cached
+
+    if not settings.LLM_SINGLE_FLIGHT:
+        return await _fetch_and_store(key, prompt, model, generation_config)
+    return await _single_flight(key, prompt, model, generation_config)
+
+async def _fetch_and_store(key: str, prompt: str, model: str, generation_config: Dict = None) -> str:
+    result_text = await _hedged_request(prompt, model, generation_config)
+    if result_text and settings.LLM_CACHE_ENABLED:
+        await llm_cache.cache.set(key, model, result_text)
+    return result_text
+
+# -----------------------------
+# Single-flight: concurrent identical requests share one upstream call
+# -----------------------------
+_inflight: Dict[str, asyncio.Task] = {}
+single_flight_stats = {"leaders": 0, "followers": 0}
+
+async def _single_flight(key: str, prompt: str, model: str, generation_config: Dict = None) -> str:
+    """
+    Join the in-flight upstream call for `key`, or start it if there is none.
+    Waiters are shielded: cancelling one caller never cancels the shared call,
+    which runs to completion (and fills the cache) even if every waiter leaves.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        single_flight_stats["leaders"] += 1
+        task = asyncio.create_task(_fetch_and_store(key, prompt, model, generation_config))
+        _inflight[key] = task
+
+        def _forget(t: asyncio.Task) -> None:
+            if _inflight.get(key) is t:
+                del _inflight[key]
+            if not t.cancelled() and t.exception() is not None:
+                # Mark the exception retrieved even when no waiter is left to see it
+                logger.debug(f"Shared Gemini call {key[:12]} failed: {t.exception()}")
+
+        task.add_done_callback(_forget)
+    else:
+        single_flight_stats["followers"] += 1
+        logger.info(f"Coalesced identical Gemini request ({key[:12]})")
+    return await asyncio.shield(task)
 
-    logger.info(f"Gemini request URL: {url}")
-    logger.info(f"Gemini request payload: {json.dumps(payload)}")
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
-            text = await resp.text()
-            if resp.status != 200:
-                logger.error(f"Gemini API error {resp.status}: {text}")
-                raise Exception(f"Gemini API error {resp.status}: {text}")
-
-            logger.info(f"Gemini raw response: {text}")
-            data = await resp.json()
-            candidates = data.get("candidates", [])
-            if not candidates:
-                logger.warning("Gemini returned no candidates")
-                return ""
-
-            first_candidate = candidates[0]
-            content = first_candidate.get("content", {})
-            parts = content.get("parts", [])
-            text_parts = []
-            for part in parts:
-                text_parts.append(part.get("text") if isinstance(part, dict) else str(part))
-            result_text = "\n".join([t.strip() for t in text_parts])
-            logger.info(f"Gemini processed text: {result_text}")
-            return result_text
+def _sample_payload_log() -> bool:
+    """Full payload logging is opt-in (LLM_LOG_PAYLOADS) and sampled per request."""
+    return settings.LLM_LOG_PAYLOADS and random.random() < settings.LLM_LOG_SAMPLE_RATE
+
+# -----------------------------
+# Upstream protection: adaptive concurrency, circuit breaker, deadline
+# -----------------------------
+limiter = AIMDLimiter(
+    initial=settings.LLM_CONCURRENCY_INITIAL,
+    min_limit=settings.LLM_CONCURRENCY_MIN,
+    max_limit=settings.LLM_CONCURRENCY_MAX,
+)
+breakers: Dict[str, CircuitBreaker] = {}
+
+def breaker_for(model: str) -> CircuitBreaker:
+    """One breaker per model, so an unhealthy primary does not block its fallback."""
+    if model not in breakers:
+        breakers[model] = CircuitBreaker(
+            failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+            recovery_seconds=settings.LLM_CIRCUIT_RECOVERY_SECONDS,
+        )
+    return breakers[model]
+
+def _count_retry(model: str, retry_state) -> None:
+    metrics.GEMINI_RETRIES.inc(model=model)
+    logger.warning(f"Retrying Gemini call to {model} (attempt {retry_state.attempt_number}): {retry_state.outcome.exception()}")
+
+async def _request_gemini(
+    prompt: str, model: str, generation_config: Dict = None, deadline: Optional[float] = None
+) -> str:
+    """
+    Call Gemini with retries. Only network errors, 429 and 5xx are retried;
+    429 waits honour Retry-After, and no retry starts after the
+    LLM_REQUEST_DEADLINE_SECONDS budget for the whole call is spent.
+    `deadline` (time.monotonic()) lets a hedge share its primary's budget.
+    """
+    if deadline is None:
+        deadline = time.monotonic() + settings.LLM_REQUEST_DEADLINE_SECONDS
+    async for attempt in AsyncRetrying(
+        stop=stop_after_attempt(settings.LLM_MAX_ATTEMPTS) | stop_before_delay(max(deadline - time.monotonic(), 0)),
+        wait=wait_retry_after(wait_exponential(multiplier=1, min=2, max=10)),
+        retry=retry_if_exception(is_retryable),
+        before_sleep=lambda retry_state: _count_retry(model, retry_state),
+        reraise=True,
+    ):
+        with attempt:
+            return await _attempt_gemini(prompt, model, generation_config, deadline)
+
+# -----------------------------
+# Hedged requests: duplicate the slow tail, keep the first success
+# -----------------------------
+hedger = HedgePolicy(
+    percentile=settings.LLM_HEDGE_PERCENTILE,
+    budget=settings.LLM_HEDGE_BUDGET,
+    min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+)
+
+async def _timed_request(prompt: str, model: str, generation_config: Dict, deadline: float) -> str:
+    start = time.monotonic()
+    result = await _request_gemini(prompt, model, generation_config, deadline)
+    hedger.observe(model, time.monotonic() - start)
+    return result
+
+async def _hedged_request(prompt: str, model: str, generation_config: Dict = None) -> str:
+    """
+    _request_gemini, plus (with LLM_HEDGE_ENABLED) a second identical request when the
+    first has not answered within the model's LLM_HEDGE_PERCENTILE latency. The first
+    success wins and the other request is cancelled; hedges are capped by LLM_HEDGE_BUDGET.
+    Both requests share one LLM_REQUEST_DEADLINE_SECONDS deadline, set when the first starts.
+    """
+    if not settings.LLM_HEDGE_ENABLED:
+        return await _request_gemini(prompt, model, generation_config)
+
+    hedger.on_request()
+    delay = hedger.delay(model)
+    deadline = time.monotonic() + settings.LLM_REQUEST_DEADLINE_SECONDS
+    primary = asyncio.create_task(_timed_request(prompt, model, generation_config, deadline))
+    if delay is None:
+        return await primary
+
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done or not hedger.try_acquire():
+            return await primary
+
+        logger.info(f"Hedging Gemini request to {model} after {delay:.2f}s")
+        hedge = asyncio.create_task(_timed_request(prompt, model, generation_config, deadline))
+        pending.add(hedge)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        hedger.on_hedge_won()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+def _upstream_failed(model: str, status: Optional[int], text: str, retry_after: Optional[float] = None) -> UpstreamError:
+    """Record a failed attempt with the limiter and breaker and build the error to raise."""
+    breaker = breaker_for(model)
+    if status == 429:
+        limiter.on_throttle(retry_after)
+        breaker.record_neutral()
+    elif status is None or status >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()  # a client error still means the upstream is up
+    metrics.GEMINI_ERRORS.inc(model=model, status=str(status) if status else "network")
+    logger.error(f"LLM API error {status}: {text}")
+    return UpstreamError(status, text, retry_after=retry_after)
+
+async def _attempt_gemini(prompt: str, model: str, generation_config: Dict, deadline: float) -> str:
+    """One upstream call through the configured provider (see llm_providers), guarded by breaker, limiter and deadline."""
+    provider = get_provider()
+    log_payload = _sample_payload_log()
+    if log_payload:
+        logger.debug(f"{provider.name} request to {model}: {json.dumps({'prompt': prompt, 'generation_config': generation_config})}")
+    metrics.GEMINI_PROMPT_BYTES.observe(len(prompt.encode("utf-8")), model=model)
+
+    breaker = breaker_for(model)
+    breaker.before_call()
+    recorded = False
+    try:
+        async with limiter.slot(deadline):
+            start = time.perf_counter()
+            try:
+                completion = await provider.generate(
+                    prompt, model, generation_config, timeout=max(deadline - time.monotonic(), 0.001)
+                )
+            except UpstreamError as e:
+                metrics.GEMINI_REQUEST_SECONDS.observe(time.perf_counter() - start, model=model, outcome="error")
+                recorded = True
+                raise _upstream_failed(model, e.status, str(e), e.retry_after)
+        breaker.record_success()
+        recorded = True
+    finally:
+        # Deadline while queueing, cancellation (hedge loser, client gone): release a half-open probe
+        if not recorded:
+            breaker.record_neutral()
+
+    elapsed = time.perf_counter() - start
+    limiter.on_success()
+    metrics.GEMINI_REQUEST_SECONDS.observe(elapsed, model=model, outcome="ok")
+    metrics.GEMINI_RESPONSE_BYTES.observe(len(completion.raw.encode("utf-8")), model=model)
+    metrics.GEMINI_TOKENS.inc(completion.prompt_tokens, model=model, kind="prompt")
+    metrics.GEMINI_TOKENS.inc(completion.response_tokens, model=model, kind="response")
+    if log_payload:
+        logger.debug(f"{provider.name} raw response: {completion.raw}")
+    return completion.text
+
+async def _stream_gemini(prompt: str, model: str, generation_config: Dict = None) -> AsyncIterator[str]:
+    """
+    Stream text chunks from the configured provider as they arrive.
+    Streams are not retried (chunks may already have been forwarded) but share the
+    limiter, breaker and deadline with regular calls.
+    """
+    deadline = time.monotonic() + settings.LLM_REQUEST_DEADLINE_SECONDS
+    breaker = breaker_for(model)
+    breaker.before_call()
+    recorded = False
+    try:
+        async with limiter.slot(deadline):
+            try:
+                async for chunk in get_provider().stream(prompt, model, generation_config):
+                    yield chunk
+            except UpstreamError as e:
+                recorded = True
+                raise _upstream_failed(model, e.status, str(e), e.retry_after)
+        breaker.record_success()
+        recorded = True
+    finally:
+        # Also reached when the consumer stops early (GeneratorExit) or the task is cancelled
+        if not recorded:
+            breaker.record_neutral()
+
+    limiter.on_success()
+
+LLM_CACHE_EVENTS = metrics.gauge("architai_llm_cache_events", "LLM response cache counters since start", ["event"])
+LLM_CACHE_MEMORY = metrics.gauge("architai_llm_cache_memory", "LLM response cache memory tier occupancy", ["unit"])
+LLM_SINGLE_FLIGHT = metrics.gauge("architai_llm_single_flight", "Upstream calls started (leaders) vs joined (followers)", ["role"])
+LLM_CONCURRENCY = metrics.gauge("architai_llm_concurrency", "Adaptive upstream concurrency limit and calls in flight", ["kind"])
+LLM_HEDGE = metrics.gauge("architai_llm_hedge", "Hedging counters since start (requests, hedged, hedge_wins)", ["event"])
+LLM_HEDGE_RATIO = metrics.gauge("architai_llm_hedge_ratio", "hedge_rate = hedged/requests, win_rate = hedge_wins/hedged", ["kind"])
+LLM_CIRCUIT_OPEN = metrics.gauge("architai_llm_circuit_open", "1 while a model's circuit breaker is open or half-open", ["model"])
+
+def _collect_llm_stats() -> None:
+    snapshot = llm_cache.cache.snapshot()
+    for event in ("memory_hits", "disk_hits", "misses", "evictions", "bypassed"):
+        LLM_CACHE_EVENTS.set(snapshot[event], event=event)
+    LLM_CACHE_MEMORY.set(snapshot["memory_entries"], unit="entries")
+    LLM_CACHE_MEMORY.set(snapshot["memory_bytes"], unit="bytes")
+    for role, value in single_flight_stats.items():
+        LLM_SINGLE_FLIGHT.set(value, role=role)
+    LLM_CONCURRENCY.set(round(limiter.limit, 2), kind="limit")
+    LLM_CONCURRENCY.set(limiter.inflight, kind="inflight")
+    for event, value in hedger.stats.items():
+        LLM_HEDGE.set(value, event=event)
+    requests, hedged = hedger.stats["requests"], hedger.stats["hedged"]
+    LLM_HEDGE_RATIO.set(hedged / requests if requests else 0, kind="hedge_rate")
+    LLM_HEDGE_RATIO.set(hedger.stats["hedge_wins"] / hedged if hedged else 0, kind="win_rate")
+    for model, breaker in breakers.items():
+        LLM_CIRCUIT_OPEN.set(0 if breaker.state == "closed" else 1, model=model)
+
+metrics.registry.on_collect(_collect_llm_stats)
+
+# -----------------------------
+# Model routing per operation, with fallback
+# -----------------------------
+# Operations that only need a small, fast model vs the full design generation
+OPERATION_TIERS = {
+    "questions": "fast",
+    "reply": "fast",
+    "summary": "fast",
+    "finalize": "large",
+    "revise": "large",
+}
+
+LLM_ROUTES = metrics.counter(
+    "architai_llm_routes_total", "Model chosen per LLM call", ["operation", "model", "route", "reason"]
+)
+
+def route_model(operation: str) -> str:
+    """Primary model for an operation: LLM_ROUTES override, else its tier model, else DEFAULT_MODEL."""
+    if operation in settings.LLM_ROUTES:
+        return settings.LLM_ROUTES[operation]
+    tier = OPERATION_TIERS.get(operation)
+    if tier == "fast" and settings.LLM_MODEL_FAST:
+        return settings.LLM_MODEL_FAST
+    if tier == "large" and settings.LLM_MODEL_LARGE:
+        return settings.LLM_MODEL_LARGE
+    return DEFAULT_MODEL
+
+def _record_route(operation: str, model: str, route: str, reason: str) -> None:
+    LLM_ROUTES.inc(operation=operation, model=model, route=route, reason=reason)
+    logger.info(f"LLM route: {operation} -> {model} ({route}, {reason})")
+
+def fallback_delay(operation: str) -> float:
+    """Seconds to wait for the primary model before falling back: LLM_FALLBACK_AFTER override, else the default."""
+    return settings.LLM_FALLBACK_AFTER.get(operation, settings.LLM_FALLBACK_AFTER_SECONDS)
+
+def _drain(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        # Mark the exception retrieved: nobody awaits an abandoned primary
+        logger.debug(f"Abandoned primary call failed: {task.exception()}")
+
+async def _call_routed(prompt: str, operation: str, generation_config: Dict = None, bypass_cache: bool = False) -> str:
+    """
+    _call_gemini on the operation's primary model. When LLM_MODEL_FALLBACK is set,
+    a primary that errors or has not answered within fallback_delay(operation) is
+    abandoned for the fallback model. The abandoned call keeps running and fills the
+    cache; it is only cancelled if the caller itself is.
+    """
+    primary = route_model(operation)
+    fallback = settings.LLM_MODEL_FALLBACK
+    if not fallback or fallback == primary:
+        result = await _call_gemini(prompt, primary, generation_config, bypass_cache)
+        _record_route(operation, primary, "primary", "ok")
+        return result
+
+    task = asyncio.create_task(_call_gemini(prompt, primary, generation_config, bypass_cache))
+    try:
+        done, _ = await asyncio.wait({task}, timeout=fallback_delay(operation))
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if not done:
+        reason = "slow"
+        task.add_done_callback(_drain)
+    else:
+        try:
+            result = task.result()
+            _record_route(operation, primary, "primary", "ok")
+            return result
+        except (UpstreamError, CircuitOpenError, DeadlineExceeded) as e:
+            reason = type(e).__name__
+    logger.warning(f"Primary model {primary} failed for {operation} ({reason}), using {fallback}")
+    result = await _call_gemini(prompt, fallback, generation_config, bypass_cache)
+    _record_route(operation, fallback, "fallback", reason)
+    return result
+
+async def _stream_routed(prompt: str, operation: str, generation_config: Dict = None) -> AsyncIterator[str]:
+    """Stream from the primary model, switching to the fallback only if nothing has been streamed yet."""
+    primary = route_model(operation)
+    fallback = settings.LLM_MODEL_FALLBACK
+    streamed = False
+    try:
+        async for chunk in _stream_gemini(prompt, primary, generation_config):
+            streamed = True
+            yield chunk
+        _record_route(operation, primary, "primary", "ok")
+        return
+    except (UpstreamError, CircuitOpenError, DeadlineExceeded) as e:
+        if streamed or not fallback or fallback == primary:
+            raise
+        reason = type(e).__name__
+    logger.warning(f"Primary model {primary} failed for {operation} stream ({reason}), using {fallback}")
+    async for chunk in _stream_gemini(prompt, fallback, generation_config):
+        yield chunk
+    _record_route(operation, fallback, "fallback", reason)
+
+# -----------------------------
+# Rolling conversation summary
+# -----------------------------
+async def _summarize_turns(summary: str, new_messages: List[Dict]) -> str:
+    max_words = settings.PROMPT_SUMMARY_TOKENS * 3 // 4
+    system_msg = (
+        "You maintain a running summary of a system design requirements conversation. "
+        "Update the summary with the new messages, keeping every requirement, constraint and decision. "
+        f"Respond with plain text only, at most {max_words} words."
+    )
+    new_text = "\n".join(f"{m['role']}: {m['text'][:1000]}" for m in new_messages)
+    final_prompt = build_prompt([], f"Summary so far: {summary or '(none)'}\n\nNew messages:\n{new_text}", system_prompt=system_msg)
+    return (await _call_routed(final_prompt, "summary")).strip()
+
+context = ContextManager(
+    token_budget=settings.PROMPT_TOKEN_BUDGET,
+    recent_messages=settings.PROMPT_RECENT_MESSAGES,
+    summary_tokens=settings.PROMPT_SUMMARY_TOKENS,
+    summarizer=_summarize_turns if settings.PROMPT_SUMMARY_MODE == "llm" else None,
+)
 
 # -----------------------------
 # Main Service Functions
 # -----------------------------
+@metrics.timed(metrics.LLM_OPERATION_SECONDS, operation="get_next_reply")
 async def get_next_reply(prompt: str, conversation: List[Dict]) -> str:
-    final_prompt = build_prompt(conversation, prompt)
-    return await _call_gemini(final_prompt, model=DEFAULT_MODEL)
+    final_prompt = await build_budgeted_prompt(conversation, prompt)
+    return await _call_routed(final_prompt, "reply")
+
+async def stream_next_reply(prompt: str, conversation: List[Dict]) -> AsyncIterator[str]:
+    """Streaming variant of get_next_reply: yields text chunks as Gemini produces them."""
+    final_prompt = await build_budgeted_prompt(conversation, prompt)
+    with metrics.LLM_OPERATION_SECONDS.time(operation="stream_next_reply"):
+        async for chunk in _stream_routed(final_prompt, "reply"):
+            yield chunk
 
-async def generate_final_design(prompt: str, conversation: List[Dict]) -> Dict:
+@metrics.timed(metrics.LLM_OPERATION_SECONDS, operation="get_next_replies")
+async def get_next_replies(answers: List[Dict], conversation: List[Dict], mode: str = None) -> List[str]:
     """
-    Ask Gemini to generate structured JSON with keys:
-      summary, components, diagrams.
-    Sanitizes the response to ensure all required fields exist for FastAPI.
+    Acknowledge several {"question", "answer"} pairs from one reply request.
+    Replies are returned in the same order as `answers` whatever the mode:
+      sequential - one call per answer, each seeing the previous replies
+      concurrent - one call per answer, at most REPLY_CONCURRENCY in flight
+      batched    - a single call returning a JSON array of acknowledgements
     """
+    if not answers:
+        return []
+    mode = mode or settings.REPLY_MODE
+
+    if mode == "batched" and len(answers) > 1:
+        try:
+            return await _get_batched_replies(answers, conversation)
+        except ValueError as e:
+            logger.warning(f"Batched reply failed ({e}). Falling back to concurrent replies.")
+            mode = "concurrent"
+
+    if mode == "sequential":
+        history = list(conversation)
+        replies = []
+        for ans in answers:
+            history.append({"role": "user", "text": ans["answer"]})
+            reply = await get_next_reply(format_answer_prompt(ans["question"], ans["answer"]), history)
+            history.append({"role": "architai", "text": reply})
+            replies.append(reply)
+        return replies
+
+    semaphore = asyncio.Semaphore(max(1, settings.REPLY_CONCURRENCY))
+
+    async def reply_one(ans: Dict) -> str:
+        history = conversation + [{"role": "user", "text": ans["answer"]}]
+        async with semaphore:
+            return await get_next_reply(format_answer_prompt(ans["question"], ans["answer"]), history)
+
+    return list(await asyncio.gather(*(reply_one(ans) for ans in answers)))
+
+async def _get_batched_replies(answers: List[Dict], conversation: List[Dict]) -> List[str]:
     system_msg = (
-        "You are a senior system architect. Generate a complete system design. "
-        "Respond only in valid JSON with these top-level keys: "
-        "'summary', 'components', 'db_schema', 'mermaid', 'tech_stack', "
-        "'integration_steps', 'rationale', 'diagram_url', 'diagrams'. "
-        "Each component must have 'name', 'description', and 'details' with "
-        "'technology_stack' (list of strings) and 'responsibilities' (list of strings)."
+        "You are a senior system designer collecting requirements. "
+        "For each numbered question/answer pair, write a short acknowledgement or follow-up note. "
+        f"Respond only with a JSON array of exactly {len(answers)} strings, in the same order."
+    )
+    numbered = "\n\n".join(
+        f"{i}. {format_answer_prompt(ans['question'], ans['answer'])}"
+        for i, ans in enumerate(answers, start=1)
     )
+    final_prompt = await build_budgeted_prompt(conversation, numbered, system_prompt=system_msg)
+    raw_text = await _call_routed(final_prompt, "reply")
+    try:
+        replies = json.loads(clean_gemini_json_text(raw_text))
+    except json.JSONDecodeError:
+        raise ValueError("response is not valid JSON")
+    if not isinstance(replies, list) or len(replies) != len(answers):
+        raise ValueError(f"expected {len(answers)} replies")
+    return [r if isinstance(r, str) else json.dumps(r) for r in replies]
 
-    final_prompt = build_prompt(conversation, prompt, system_prompt=system_msg)
-    raw_text = await _call_gemini(final_prompt, model=DEFAULT_MODEL)
-    clean_text = clean_gemini_json_text(raw_text)
-    design_json = parse_json_safe(clean_text)
+FINAL_DESIGN_SECTIONS = (
+    "summary", "components", "db_schema", "mermaid", "tech_stack",
+    "integration_steps", "rationale", "diagram_url", "diagrams",
+)
+
+FINAL_DESIGN_SYSTEM_MSG = (
+    "You are a senior system architect. Generate a complete system design. "
+    "Respond only in valid JSON with these top-level keys: "
+    "'summary', 'components', 'db_schema', 'mermaid', 'tech_stack', "
+    "'integration_steps', 'rationale', 'diagram_url', 'diagrams'. "
+    "Each component must have 'name', 'description', and 'details' with "
+    "'technology_stack' (list of strings) and 'responsibilities' (list of strings)."
+)
+
+FINAL_DESIGN_RETRY_MSG = (
+    "Your previous answer was not valid JSON. Respond again with only the JSON object, "
+    "no markdown fences or commentary."
+)
+
+# Structured output: Gemini constrains decoding to this schema, so most responses parse as-is
+FINAL_DESIGN_CONFIG = (
+    {
+        "responseMimeType": "application/json",
+        "responseSchema": gemini_response_schema(FinalizeResponse, require_all=True),
+    }
+    if settings.LLM_STRUCTURED_OUTPUT else None
+)
+
+# Keys models use instead of the FinalizeResponse names
+DESIGN_KEY_ALIASES = {
+    "overview": "summary",
+    "architecture_summary": "summary",
+    "database_schema": "db_schema",
+    "mermaid_diagram": "mermaid",
+    "technology_stack": "tech_stack",
+    "technologies": "tech_stack",
+    "steps": "integration_steps",
+}
+COMPONENT_TECH_ALIASES = ("technology", "technologies", "tech_stack", "technology_stack", "tech")
+
+DESIGN_PARSE = metrics.counter(
+    "architai_design_parse_total",
+    "Final design responses by how they were parsed (valid, repaired, reprompted, failed)",
+    ["outcome"],
+)
+
+def sanitize_design(design_json: Dict) -> Dict:
+    """Ensure all fields required by FinalizeResponse exist and have the right shape."""
+    for alias, key in DESIGN_KEY_ALIASES.items():
+        if alias in design_json and key not in design_json:
+            design_json[key] = design_json.pop(alias)
 
     # Ensure top-level keys exist
     design_json.setdefault("summary", "")
@@ -152,13 +629,21 @@ async def generate_final_design(prompt: str, conversation: List[Dict]) -> Dict:
             details = {}
 
         # Normalize Gemini "technology" → "technology_stack"
-        tech = comp.pop("technology", None)
-        if tech:
-            details.setdefault("technology_stack", [])
-            if isinstance(tech, str):
-                details["technology_stack"].append(tech)
-            elif isinstance(tech, list):
-                details["technology_stack"].extend(tech)
+        for alias in COMPONENT_TECH_ALIASES:
+            tech = comp.pop(alias, None)
+            if tech:
+                details.setdefault("technology_stack", [])
+                if isinstance(tech, str):
+                    details["technology_stack"].append(tech)
+                elif isinstance(tech, list):
+                    details["technology_stack"].extend(tech)
+
+        # Responsibilities listed on the component instead of under details
+        responsibilities = comp.pop("responsibilities", None)
+        if responsibilities and not details.get("responsibilities"):
+            details["responsibilities"] = (
+                [responsibilities] if isinstance(responsibilities, str) else responsibilities
+            )
 
         details.setdefault("technology_stack", [])
         details.setdefault("responsibilities", [])
@@ -168,19 +653,251 @@ async def generate_final_design(prompt: str, conversation: List[Dict]) -> Dict:
 
 
     # Sanitize all components
-    design_json["components"] = [sanitize_component(c) for c in design_json["components"]]
+    design_json["components"] = [
+        sanitize_component(c) for c in design_json["components"] if isinstance(c, dict)
+    ]
 
-    # Append Gemini response to conversation for traceability
-    conversation.append({
+    return design_json
+
+def design_inputs_hash(prompt: str, conversation: List[Dict]) -> str:
+    """Fingerprint of everything generate_final_design depends on, used to validate stored drafts."""
+    payload = json.dumps({
+        "model": route_model("finalize"),
+        "system": FINAL_DESIGN_SYSTEM_MSG,
+        "prompt": prompt,
+        "conversation": [[m["role"], m["text"]] for m in conversation],
+    })
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def design_raw_message(prompt: str, raw_text: str) -> Dict:
+    """Conversation entry that logs the raw finalize response for traceability."""
+    return {
         "role": "architai",
         "text": raw_text,
-        "meta": json.dumps({"prompt": prompt})
-    })
+        "meta": json.dumps({"prompt": prompt, "kind": "design_raw"})
+    }
+
+def _design_from_raw(raw_text: str) -> Optional[Dict]:
+    """
+    Parse and sanitize a final design, repairing almost-valid JSON locally.
+    Returns None when the text cannot be turned into a valid FinalizeResponse.
+    """
+    clean_text = clean_gemini_json_text(raw_text)
+    try:
+        design_json = json.loads(clean_text)
+        outcome = "valid"
+    except json.JSONDecodeError:
+        try:
+            design_json = repair_json(clean_text)
+        except ValueError as e:
+            logger.warning(f"Final design JSON could not be repaired: {e}")
+            return None
+        outcome = "repaired"
+    if not isinstance(design_json, dict):
+        return None
+    design_json = sanitize_design(design_json)
+    try:
+        FinalizeResponse.model_validate(design_json)
+    except ValidationError as e:
+        logger.warning(f"Final design does not match FinalizeResponse: {e}")
+        return None
+    DESIGN_PARSE.inc(outcome=outcome)
+    return design_json
+
+async def _finish_design(final_prompt: str, raw_text: str, bypass_cache: bool = False) -> Dict:
+    """
+    Design from a finalize response; re-prompt once only when local repair fails.
+    Raises UpstreamError (502) when the re-prompted response is not a valid design either.
+    """
+    design_json = _design_from_raw(raw_text)
+    if design_json is not None:
+        return design_json
+    retry_prompt = f"{final_prompt}\nsystem: {FINAL_DESIGN_RETRY_MSG}"
+    retry_text = await _call_routed(retry_prompt, "finalize", FINAL_DESIGN_CONFIG, bypass_cache=bypass_cache)
+    design_json = _design_from_raw(retry_text)
+    if design_json is not None:
+        DESIGN_PARSE.inc(outcome="reprompted")
+        return design_json
+    DESIGN_PARSE.inc(outcome="failed")
+    raise UpstreamError(502, "Gemini did not return a valid final design")
+
+def final_design_system_msg(references: Optional[str] = None) -> str:
+    """System message for finalize, with summaries of similar past designs when available."""
+    if not references:
+        return FINAL_DESIGN_SYSTEM_MSG
+    return (
+        f"{FINAL_DESIGN_SYSTEM_MSG}\n"
+        "For reference, designs produced for similar past projects (adapt what fits, do not copy):\n"
+        f"{references}"
+    )
+
+@metrics.timed(metrics.LLM_OPERATION_SECONDS, operation="generate_final_design")
+async def generate_final_design(
+    prompt: str, conversation: List[Dict], bypass_cache: bool = False, references: Optional[str] = None
+) -> Dict:
+    """
+    Ask Gemini to generate structured JSON with keys:
+      summary, components, diagrams.
+    Sanitizes the response to ensure all required fields exist for FastAPI.
+    """
+    system_msg = final_design_system_msg(references)
+    final_prompt = await build_budgeted_prompt(conversation, prompt, system_prompt=system_msg)
+    raw_text = await _call_routed(final_prompt, "finalize", FINAL_DESIGN_CONFIG, bypass_cache=bypass_cache)
+    design_json = await _finish_design(final_prompt, raw_text, bypass_cache)
+
+    # Append Gemini response to conversation for traceability
+    conversation.append(design_raw_message(prompt, raw_text))
 
     return design_json
 
+async def stream_final_design(
+    prompt: str, conversation: List[Dict], references: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming variant of generate_final_design. Yields events as they become available:
+      ("token", text)             - every chunk streamed by Gemini
+      ("section", (name, value))  - each top-level key once its value has fully parsed
+      ("design", design_json)     - the complete sanitized design, last
+    """
+    system_msg = final_design_system_msg(references)
+    final_prompt = await build_budgeted_prompt(conversation, prompt, system_prompt=system_msg)
+    parser = JSONSectionParser()
+    chunks = []
+    async for chunk in _stream_routed(final_prompt, "finalize", FINAL_DESIGN_CONFIG):
+        chunks.append(chunk)
+        yield "token", chunk
+        for name, value in parser.feed(chunk):
+            if name in FINAL_DESIGN_SECTIONS:
+                value = sanitize_design({name: value})[name]
+            yield "section", (name, value)
+
+    raw_text = "".join(chunks)
+    design_json = await _finish_design(final_prompt, raw_text)
+    conversation.append(design_raw_message(prompt, raw_text))
+    yield "design", design_json
+
+
+# -----------------------------
+# Incremental re-finalize
+# -----------------------------
+DESIGN_PATCH_SYSTEM_MSG = (
+    "You are a senior system architect revising an existing system design after the user "
+    "changed one of their answers. Return only the parts of the design that must change: "
+    "set unaffected sections to null, list only new or modified components (use the existing "
+    "name to modify one) and put the names of components that no longer apply in "
+    "'removed_components'. Respond only in valid JSON."
+)
+
+DESIGN_PATCH_CONFIG = (
+    {"responseMimeType": "application/json", "responseSchema": gemini_response_schema(DesignPatch)}
+    if settings.LLM_STRUCTURED_OUTPUT else None
+)
+
+def _patch_from_raw(raw_text: str) -> Optional[Dict]:
+    clean_text = clean_gemini_json_text(raw_text)
+    try:
+        patch = repair_json(clean_text)
+        if not isinstance(patch, dict):
+            return None
+        if isinstance(patch.get("components"), list):
+            patch["components"] = [sanitize_design({"components": [c]})["components"][0]
+                                   for c in patch["components"] if isinstance(c, dict)]
+        return DesignPatch.model_validate(patch).model_dump(exclude_none=True)
+    except (ValueError, ValidationError) as e:
+        logger.warning(f"Design patch could not be parsed: {e}")
+        return None
+
+@metrics.timed(metrics.LLM_OPERATION_SECONDS, operation="revise_final_design")
+async def revise_final_design(
+    prompt: str, conversation: List[Dict], design: Dict, question: str, old_answer: str, new_answer: str
+) -> Tuple[Optional[Dict], str]:
+    """
+    Ask for only the design sections affected by one changed answer.
+    Returns (patch, raw_text); patch is None when the response is unusable.
+    """
+    user_msg = (
+        f"System description: {prompt}\n"
+        f"Current design: {json.dumps(design)}\n"
+        f"Question: {question}\n"
+        f"Previous answer: {old_answer}\n"
+        f"Revised answer: {new_answer}"
+    )
+    final_prompt = await build_budgeted_prompt(conversation, user_msg, system_prompt=DESIGN_PATCH_SYSTEM_MSG)
+    raw_text = await _call_routed(final_prompt, "revise", DESIGN_PATCH_CONFIG)
+    return _patch_from_raw(raw_text), raw_text
+
+def _component_key(component: Dict) -> str:
+    return str(component.get("name", "")).strip().lower()
+
+def _merge_component(existing: Dict, patched: Dict) -> Dict:
+    """Patched fields over a stored component; omitted or empty fields (and the stored name) are kept."""
+    merged = dict(existing)
+    for key, value in patched.items():
+        if key == "name" or value in (None, "", [], {}):
+            continue
+        if key == "details" and isinstance(value, dict):
+            details = dict(existing.get("details") or {})
+            details.update({k: v for k, v in value.items() if v not in (None, "", [], {})})
+            merged["details"] = details
+        else:
+            merged[key] = value
+    return merged
+
+def merge_design_patch(design: Dict, patch: Dict) -> Tuple[Dict, Dict]:
+    """
+    Apply a DesignPatch to a stored design. Returns (merged design, diff) where
+    the diff has {"before", "after"} per replaced section and added/updated/
+    removed component names under "components".
+    """
+    merged = json.loads(json.dumps(design))  # deep copy
+    diff: Dict[str, Any] = {}
+
+    for name, value in patch.items():
+        if name in ("components", "removed_components") or name not in FINAL_DESIGN_SECTIONS:
+            continue
+        if merged.get(name) != value:
+            diff[name] = {"before": merged.get(name), "after": value}
+            merged[name] = value
+
+    components = list(merged.get("components") or [])
+    index = {_component_key(c): i for i, c in enumerate(components)}
+    added, updated = [], []
+    for component in patch.get("components") or []:
+        key = _component_key(component)
+        if key in index:
+            existing = components[index[key]]
+            merged_component = _merge_component(existing, component)
+            if merged_component != existing:
+                components[index[key]] = merged_component
+                updated.append(existing["name"])
+        else:
+            index[key] = len(components)
+            components.append(component)
+            added.append(component["name"])
+    drop = {n.strip().lower() for n in patch.get("removed_components") or []}
+    removed = [c["name"] for c in components if _component_key(c) in drop]
+    components = [c for c in components if _component_key(c) not in drop]
+    merged["components"] = components
+    if added or updated or removed:
+        diff["components"] = {"added": added, "updated": updated, "removed": removed}
+
+    return sanitize_design(merged), diff
+
+def diff_designs(before: Dict, after: Dict) -> Dict:
+    """Diff two complete designs in the merge_design_patch format (used after a full regeneration)."""
+    patch = {name: after.get(name) for name in FINAL_DESIGN_SECTIONS if name != "components"}
+    after_keys = {_component_key(c) for c in after.get("components") or []}
+    patch["components"] = after.get("components") or []
+    patch["removed_components"] = [
+        c["name"] for c in before.get("components") or [] if _component_key(c) not in after_keys
+    ]
+    return merge_design_patch(before, patch)[1]
+
 
-async def generate_initial_questions(prompt: str, conversation: List[Dict], num_questions: int = 4) -> List[str]:
+@metrics.timed(metrics.LLM_OPERATION_SECONDS, operation="generate_initial_questions")
+async def generate_initial_questions(
+    prompt: str, conversation: List[Dict], num_questions: int = 4, bypass_cache: bool = False
+) -> List[str]:
     """
     Ask Gemini for clarifying questions, avoiding repeating questions
     that the user already answered (present in conversation).
@@ -193,10 +910,11 @@ async def generate_initial_questions(prompt: str, conversation: List[Dict], num_
         "Respond only in valid JSON array format."
     )
     user_msg = f"System description: {prompt}\nGenerate {num_questions} questions as a JSON array of strings."
-    final_prompt = build_prompt(conversation, user_msg, system_prompt=system_msg)
-    raw_text = await _call_gemini(final_prompt, model=DEFAULT_MODEL)
+    final_prompt = await build_budgeted_prompt(conversation, user_msg, system_prompt=system_msg)
+    raw_text = await _call_routed(final_prompt, "questions", bypass_cache=bypass_cache)
     clean_text = clean_gemini_json_text(raw_text)
-    logger.info(f"Gemini cleaned text: {clean_text}")
+    if settings.LLM_LOG_PAYLOADS:
+        logger.debug(f"Gemini cleaned text: {clean_text}")
 
     # Parse JSON safely
     try:
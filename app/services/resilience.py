@@ -0,0 +1,213 @@
+# app/services/resilience.py
+"""
+Upstream protection for LLM calls: an AIMD concurrency limiter that learns the
+quota from 429s, a circuit breaker that fails fast while the upstream is
+unhealthy, tenacity helpers that respect Retry-After and a per-request
+deadline, and a budgeted hedging policy for tail latency.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from tenacity.wait import wait_base
+
+
+class UpstreamError(Exception):
+    """A failed upstream call. `status` is None for network errors and timeouts."""
+
+    RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, status: Optional[int], message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status in self.RETRYABLE_STATUSES
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM upstream circuit is open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After in seconds (HTTP-date values are ignored)."""
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    return isinstance(exc, UpstreamError) and exc.retryable
+
+
+class wait_retry_after(wait_base):
+    """Sleep for the upstream's Retry-After when it sent one, otherwise defer to `fallback`."""
+
+    def __init__(self, fallback: wait_base):
+        self.fallback = fallback
+
+    def __call__(self, retry_state) -> float:
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        if isinstance(exc, UpstreamError) and exc.retry_after is not None:
+            return exc.retry_after
+        return self.fallback(retry_state)
+
+
+class AIMDLimiter:
+    """
+    Adaptive cap on concurrent upstream calls.
+
+    Additive increase: each success raises the limit by 1/limit (about +1 per
+    round of `limit` successes). Multiplicative decrease: a 429 multiplies it
+    by `backoff` and pauses new calls for the Retry-After period. Further 429s
+    during that pause come from the same overload (calls already in flight),
+    so they extend the pause without cutting the limit again.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, backoff: float = 0.5):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.inflight = 0
+        self.paused_until = 0.0
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self, deadline: float):
+        await self._acquire(deadline)
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.inflight -= 1
+                self._cond.notify_all()
+
+    async def _acquire(self, deadline: float) -> None:
+        async with self._cond:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise DeadlineExceeded("Deadline passed while waiting for an LLM concurrency slot")
+                if now < self.paused_until:
+                    timeout = min(self.paused_until, deadline) - now
+                elif self.inflight < int(self.limit):
+                    self.inflight += 1
+                    return
+                else:
+                    timeout = deadline - now
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    def on_success(self) -> None:
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_throttle(self, retry_after: Optional[float]) -> None:
+        now = time.monotonic()
+        if now >= self.paused_until:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        self.paused_until = max(self.paused_until, now + (retry_after or 1.0))
+
+
+class CircuitBreaker:
+    """
+    closed    - calls flow; `failure_threshold` consecutive failures open the circuit
+    open      - calls fail fast with CircuitOpenError for `recovery_seconds`
+    half_open - a single probe call is let through; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold: int, recovery_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        if self.state == "open":
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.recovery_seconds:
+                raise CircuitOpenError(self.recovery_seconds - elapsed)
+            self.state = "half_open"
+            self._probe_in_flight = False
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                raise CircuitOpenError(1.0)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def record_neutral(self) -> None:
+        """An outcome that says nothing about upstream health (e.g. a 429)."""
+        self._probe_in_flight = False
+
+
+class HedgePolicy:
+    """
+    Decides when to hedge (send a second identical request) and caps how often.
+
+    The hedge delay is the `percentile` of recently observed latencies for the
+    model, so only the slow tail is hedged. A token bucket earns `budget`
+    tokens per request and spends one per hedge, so at most about
+    budget * 100 % of requests are ever duplicated.
+    """
+
+    def __init__(self, percentile: float, budget: float, min_samples: int, window: int = 500, burst: float = 2.0):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.window = window
+        self.burst = burst
+        self._samples: Dict[str, Deque[float]] = {}
+        self._tokens = 0.0
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+
+    def observe(self, model: str, seconds: float) -> None:
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def delay(self, model: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is too little data."""
+        samples = self._samples.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        return ordered[index]
+
+    def on_request(self) -> None:
+        self.stats["requests"] += 1
+        self._tokens = min(self.burst, self._tokens + self.budget)
+
+    def try_acquire(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        self.stats["hedged"] += 1
+        return True
+
+    def on_hedge_won(self) -> None:
+        self.stats["hedge_wins"] += 1
@@ -0,0 +1,89 @@
+# app/services/search.py
+"""
+Ranked full-text search over sessions.
+
+The index itself (SQLite FTS5 or a Postgres tsvector side table) is created
+by migration 2 and kept current by triggers on sessions, see
+app/core/migrations.py. This module only builds and runs the queries.
+"""
+import re
+from typing import Dict, List, Optional
+
+from app.core.db import database, is_sqlite
+from app.models.db_models import SessionStatus
+
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+
+# Words, optionally with a trailing * for prefix search; everything else is ignored
+_TERM = re.compile(r"[\w][\w.+#-]*\*?", re.UNICODE)
+
+SQLITE_SEARCH = f"""
+SELECT s.id, s.prompt, s.status, s.user_id, s.updated_at, sessions_fts.rank AS rank,
+       snippet(sessions_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 16) AS snippet
+FROM sessions_fts
+JOIN search_docs d ON d.id = sessions_fts.rowid
+JOIN sessions s ON s.id = d.session_id
+WHERE sessions_fts MATCH :query {{filters}}
+ORDER BY sessions_fts.rank
+LIMIT :limit
+"""
+
+# ts_headline is expensive, so it only runs on the page of top-ranked rows
+POSTGRES_SEARCH = f"""
+SELECT hits.id, hits.prompt, hits.status, hits.user_id, hits.updated_at, hits.rank,
+       ts_headline('english', hits.body, websearch_to_tsquery('english', :query),
+                   'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords=24, MinWords=8, MaxFragments=2')
+           AS snippet
+FROM (
+    SELECT s.id, s.prompt, s.status, s.user_id, s.updated_at, x.body,
+           ts_rank_cd(x.document, websearch_to_tsquery('english', :query)) AS rank
+    FROM session_search x
+    JOIN sessions s ON s.id = x.session_id
+    WHERE x.document @@ websearch_to_tsquery('english', :query) {{filters}}
+    ORDER BY rank DESC
+    LIMIT :limit
+) hits
+ORDER BY hits.rank DESC
+"""
+
+
+def fts5_query(text: str) -> Optional[str]:
+    """
+    User input as an FTS5 query: every term must match, terms are quoted so
+    operators and punctuation in the input cannot produce syntax errors.
+    "kafka stream*" -> '"kafka" "stream"*'
+    """
+    terms = []
+    for term in _TERM.findall(text):
+        prefix = term.endswith("*")
+        term = term.rstrip("*")
+        terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    return " ".join(terms) or None
+
+
+async def search_sessions(
+    text: str, limit: int = 20, status: Optional[SessionStatus] = None, user_id: Optional[str] = None
+) -> List[Dict]:
+    """Best matches first; each hit has id, prompt, status, user_id, updated_at, rank and snippet."""
+    values: Dict = {"limit": limit}
+    filters = ""
+    if status is not None:
+        filters += " AND s.status = :status"
+        values["status"] = status.name
+    if user_id is not None:
+        filters += " AND s.user_id = :user_id"
+        values["user_id"] = user_id
+
+    if is_sqlite():
+        query = fts5_query(text)
+        if query is None:
+            return []
+        values["query"] = query
+        rows = await database.fetch_all(SQLITE_SEARCH.format(filters=filters), values)
+        # bm25 scores are negative, lower is better; flip them so higher means more relevant
+        return [{**dict(r), "rank": -r["rank"]} for r in rows]
+
+    values["query"] = text
+    rows = await database.fetch_all(POSTGRES_SEARCH.format(filters=filters), values)
+    return [dict(r) for r in rows]
@@ -0,0 +1,305 @@
+# app/services/session_service.py
+"""
+Session operations shared by the HTTP endpoints and background workers.
+Errors are raised as plain exceptions; the API layer maps them to HTTP codes.
+
+Writes use optimistic concurrency: every update is a compare-and-swap on
+sessions.version, and a writer that loses the race re-reads the session and
+re-applies its change on top (see update_session).
+
+Archived sessions (see archive.py) are loaded with their final design and
+conversation decompressed, and the first write restores them to hot rows.
+"""
+import json
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import null
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.db import database
+from app.models.db_models import session_archive, sessions, SessionStatus
+from app.services import archive, conversation_store, llm_service, similarity
+from app.services.speculation import speculator, usable_draft
+
+SESSION_WRITE_CONFLICTS = metrics.counter(
+    "architai_session_write_conflicts_total", "Session writes that lost a compare-and-swap and were retried"
+)
+
+# apply(data) -> (column values to write, messages to append)
+SessionUpdate = Callable[[Dict], Tuple[Dict, List[Dict]]]
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class SessionNotReady(Exception):
+    """Not every question has been answered yet."""
+
+
+class NoFinalDesign(Exception):
+    """The session has not been finalized yet."""
+
+
+class UnknownQuestion(Exception):
+    """The question is not part of this session."""
+
+
+class SessionConflict(Exception):
+    """Concurrent writers kept winning; gave up after SESSION_WRITE_MAX_ATTEMPTS."""
+
+
+class _StaleVersion(Exception):
+    pass
+
+
+async def load_session(session_id: str) -> Dict:
+    query = sessions.select().where(sessions.c.id == session_id)
+    session_record = await database.fetch_one(query)
+    if not session_record:
+        raise SessionNotFound(session_id)
+    return await archive.hydrate_session(dict(session_record))
+
+
+async def _compare_and_swap(
+    session_id: str, version: int, values: Dict, conversation: List[Dict], persisted: int, unarchive: bool = False
+) -> Optional[int]:
+    """Write `values` and the unsaved messages if the row is still at `version`; return the new version or None."""
+    query = (
+        sessions.update()
+        .where(sessions.c.id == session_id)
+        .where(sessions.c.version == version)
+        .values(**values, conversation=null(), version=sessions.c.version + 1)  # messages table is authoritative
+        .returning(sessions.c.version)
+    )
+    try:
+        async with database.transaction():
+            row = await database.fetch_one(query)
+            if row is None:
+                raise _StaleVersion()
+            # Safe to use seq numbers from our snapshot: every message writer bumps version
+            await conversation_store.append_messages(session_id, conversation, persisted)
+            if unarchive:
+                await database.execute(session_archive.delete().where(session_archive.c.session_id == session_id))
+    except _StaleVersion:
+        return None
+    return row["version"]
+
+
+async def update_session(
+    session_id: str, data: Dict, conversation: List[Dict], persisted: int, apply: SessionUpdate
+) -> Tuple[Dict, List[Dict]]:
+    """
+    Apply a change to a session snapshot and save it with compare-and-swap.
+
+    On a version conflict the session is reloaded and `apply` runs again on the
+    fresh snapshot, so it must derive everything from its `data` argument
+    (e.g. skip answers another request already recorded). Returns the saved
+    session and its full conversation.
+    """
+    for _ in range(settings.SESSION_WRITE_MAX_ATTEMPTS):
+        values, new_messages = apply(data)
+        unarchive = bool(data.get("archived_at"))
+        if unarchive:
+            # Back to a hot row; the archived conversation is re-inserted as unpersisted messages
+            values = {"final_design": data.get("final_design"), **values, "archived_at": None}
+        merged = conversation + new_messages
+        version = await _compare_and_swap(
+            session_id, data.get("version") or 0, values, merged, persisted, unarchive=unarchive
+        )
+        if version is not None:
+            return {**data, **values, "version": version}, merged
+        SESSION_WRITE_CONFLICTS.inc()
+        data = await load_session(session_id)
+        conversation, persisted = await conversation_store.load_conversation(session_id, data.get("conversation"))
+    raise SessionConflict(session_id)
+
+
+def collect_new_answers(data: Dict, submitted: List[Dict]) -> List[Dict]:
+    """Valid {"question", "answer"} pairs from a request, minus questions the session already has answered."""
+    answered = {a["question"] for a in data.get("answers") or []}
+    new_answers: List[Dict] = []
+    for ans in submitted:
+        if not isinstance(ans, dict):
+            continue
+        q = ans.get("question")
+        a = ans.get("answer")
+        if not isinstance(q, str) or not isinstance(a, str) or not q or not a or q in answered:
+            continue  # Skip invalid or already answered
+        new_answers.append({"question": q, "answer": a})
+        answered.add(q)
+    return new_answers
+
+
+def next_questions(data: Dict) -> List[str]:
+    answered = {a["question"] for a in data.get("answers") or []}
+    return [q for q in data.get("questions") or [] if q not in answered]
+
+
+async def save_replies(
+    session_id: str, data: Dict, conversation: List[Dict], persisted: int, replies: List[Tuple[Dict, str]]
+) -> Tuple[Dict, List[Dict]]:
+    """Record (answer, llm_reply) pairs in order and move the session to ready_to_finalize once all are answered."""
+    now = datetime.utcnow()
+
+    def apply(current: Dict) -> Tuple[Dict, List[Dict]]:
+        answers: List[Dict] = list(current.get("answers") or [])
+        questions: List[str] = current.get("questions") or []
+        answered = {a["question"] for a in answers}
+        new_messages = []
+        for ans, llm_reply in replies:
+            if ans["question"] in answered:
+                continue  # a concurrent request recorded this answer first
+            new_messages.append({"role": "user", "text": ans["answer"]})
+            new_messages.append({
+                "role": "architai",
+                "text": llm_reply,
+                "meta": json.dumps({"prompt": llm_service.format_answer_prompt(ans["question"], ans["answer"])})
+            })
+            answers.append(ans)
+            answered.add(ans["question"])
+
+        status = current.get("status") or SessionStatus.in_progress
+        if status != SessionStatus.completed:
+            remaining = [q for q in questions if q not in answered]
+            status = SessionStatus.in_progress if remaining else SessionStatus.ready_to_finalize
+        return {"answers": answers, "status": status, "updated_at": now}, new_messages
+
+    saved, conversation = await update_session(session_id, data, conversation, persisted, apply)
+    if saved["status"] == SessionStatus.ready_to_finalize and data.get("status") != SessionStatus.ready_to_finalize:
+        speculator.schedule(session_id)
+    return saved, conversation
+
+
+async def load_finalizable_session(session_id: str) -> Dict:
+    """Fetch a session and make sure every question has been answered."""
+    data = await load_session(session_id)
+    answers: List[Dict] = data.get("answers") or []
+    questions: List[str] = data.get("questions") or []
+
+    if len(answers) < len(questions):
+        raise SessionNotReady(session_id)
+    return data
+
+
+async def save_final_design(
+    session_id: str, data: Dict, conversation: List[Dict], persisted: int, final_design: Dict
+) -> Tuple[Dict, List[Dict]]:
+    """Log the final design in the conversation and mark the session completed."""
+    # Messages added during generation (e.g. the raw design) are carried over on retry
+    generated = conversation[persisted:]
+    design_message = {
+        "role": "architai",
+        "text": str(final_design),
+        "meta": json.dumps({"prompt": data["prompt"], "kind": "design"})
+    }
+
+    def apply(current: Dict) -> Tuple[Dict, List[Dict]]:
+        values = {
+            "final_design": final_design,
+            "draft_design": null(),
+            "draft_raw": None,
+            "draft_inputs_hash": None,
+            "status": SessionStatus.completed,
+            "updated_at": datetime.utcnow(),
+        }
+        return values, generated + [design_message]
+
+    saved, conversation = await update_session(session_id, data, conversation[:persisted], persisted, apply)
+    similarity.record_design(session_id, saved["prompt"], saved.get("answers") or [], final_design)
+    return saved, conversation
+
+
+async def finalize(session_id: str, bypass_cache: bool = False) -> Dict:
+    """
+    Generate, persist and return the final design for a session. A speculative
+    draft built from the same inputs is used instead of a new generation
+    unless bypass_cache is set.
+    """
+    if bypass_cache:
+        speculator.cancel(session_id)
+    else:
+        await speculator.wait(session_id)
+    data = await load_finalizable_session(session_id)
+    conversation, persisted = await conversation_store.load_conversation(session_id, data.get("conversation"))
+    prompt: str = data["prompt"]
+
+    draft = None if bypass_cache else usable_draft(data, conversation)
+    if draft is not None:
+        conversation.append(llm_service.design_raw_message(prompt, data["draft_raw"]))
+        final_design = draft
+    else:
+        final_design = await llm_service.generate_final_design(
+            prompt, conversation, bypass_cache=bypass_cache, references=similarity.design_references(data)
+        )
+
+    await save_final_design(session_id, data, conversation, persisted, final_design)
+    return final_design
+
+
+async def run_finalize_job(session_id: str, params: Dict) -> None:
+    """Job queue handler for kind 'finalize'."""
+    await finalize(session_id, bypass_cache=params.get("refresh", False))
+
+
+async def revise_answer(session_id: str, question: str, answer: str) -> Tuple[Dict, Dict, bool]:
+    """
+    Change one answer on a finalized session and regenerate only the design
+    sections that depend on it. Returns (saved session, diff, full_regeneration);
+    the whole design is regenerated only when the model's patch is unusable.
+    """
+    data = await load_session(session_id)
+    if not data.get("final_design"):
+        raise NoFinalDesign(session_id)
+    previous = next((a for a in data.get("answers") or [] if a["question"] == question), None)
+    if previous is None:
+        raise UnknownQuestion(question)
+    if previous["answer"] == answer:
+        return data, {}, False
+
+    speculator.cancel(session_id)
+    conversation, persisted = await conversation_store.load_conversation(session_id, data.get("conversation"))
+    prompt: str = data["prompt"]
+    revision = {
+        "role": "user",
+        "text": answer,
+        "meta": json.dumps({"kind": "revision", "question": question, "previous": previous["answer"]})
+    }
+
+    patch, raw_text = await llm_service.revise_final_design(
+        prompt, conversation, data["final_design"], question, previous["answer"], answer
+    )
+    full_regeneration = patch is None
+    if full_regeneration:
+        regenerated = conversation + [revision]
+        design = await llm_service.generate_final_design(
+            prompt, regenerated, references=similarity.design_references(data)
+        )
+        generated = regenerated[len(conversation):]
+    else:
+        generated = [revision, {
+            "role": "architai",
+            "text": raw_text,
+            "meta": json.dumps({"prompt": prompt, "kind": "design_patch"})
+        }]
+
+    result: Dict = {}
+
+    def apply(current: Dict) -> Tuple[Dict, List[Dict]]:
+        answers = [
+            dict(a, answer=answer) if a["question"] == question else a
+            for a in current.get("answers") or []
+        ]
+        current_design = current.get("final_design") or {}
+        if full_regeneration:
+            merged, diff = design, llm_service.diff_designs(current_design, design)
+        else:
+            merged, diff = llm_service.merge_design_patch(current_design, patch)
+        result["diff"] = diff
+        return {"answers": answers, "final_design": merged, "updated_at": datetime.utcnow()}, generated
+
+    saved, _ = await update_session(session_id, data, conversation, persisted, apply)
+    similarity.record_design(session_id, prompt, saved["answers"], saved["final_design"])
+    return saved, result["diff"], full_regeneration
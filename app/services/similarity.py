@@ -0,0 +1,246 @@
+# app/services/similarity.py
+"""
+Local similarity index over past sessions, used to warm-start new ones:
+  - create_session reuses the questions of a near-duplicate past prompt
+    instead of asking Gemini again,
+  - finalize adds compact summaries of the most similar completed designs to
+    the final design prompt as reference context.
+
+Texts are embedded locally as hashed n-gram vectors (word unigrams and
+bigrams plus character trigrams, signed feature hashing, L2-normalized), so
+cosine similarity is one matrix-vector product with NumPy. No external
+service is involved.
+
+The index is in memory and per process: it is loaded from the most recently
+updated sessions at startup and kept current by this process's writes.
+Sessions written by other workers are picked up on their next restart.
+"""
+import logging
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.db import database
+from app.models.db_models import sessions, SessionStatus
+from app.services import archive
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_LOOKUPS = metrics.counter(
+    "architai_similarity_lookups_total",
+    "Similar-session lookups by kind (questions, design) and outcome (hit, miss)",
+    ["kind", "outcome"],
+)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+# -----------------------------
+# Hashed n-gram vectors
+# -----------------------------
+def _features(text: str) -> List[str]:
+    words = _WORD.findall(text.lower())
+    features = [f"w:{w}" for w in words]
+    features += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    joined = f" {' '.join(words)} "
+    features += [f"c:{joined[i:i + 3]}" for i in range(len(joined) - 2)]
+    return features
+
+
+def embed(text: str, dim: int) -> np.ndarray:
+    """Unit-length float32 vector of `text`; all zeros for text without words."""
+    hashes = np.fromiter((zlib.crc32(f.encode()) for f in _features(text)), dtype=np.uint32)
+    vector = np.zeros(dim, dtype=np.float32)
+    if hashes.size:
+        # The top hash bit picks the sign, so colliding features tend to cancel out rather than add up
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        vector = np.bincount(hashes % dim, weights=signs, minlength=dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+    return vector
+
+
+def answers_text(answers: List[Dict]) -> str:
+    return " ".join(a.get("answer", "") for a in answers or [])
+
+
+def design_reference(prompt: str, design: Dict, max_chars: int) -> str:
+    """Compact text form of a final design: summary, components with their technologies, tech stack."""
+    parts = [f"Project: {prompt}"]
+    if design.get("summary"):
+        parts.append(f"Summary: {design['summary']}")
+    components = []
+    for component in design.get("components") or []:
+        if not isinstance(component, dict):
+            continue
+        tech = (component.get("details") or {}).get("technology_stack") or []
+        components.append(f"{component.get('name')} ({', '.join(tech)})" if tech else str(component.get("name")))
+    if components:
+        parts.append(f"Components: {'; '.join(components)}")
+    if design.get("tech_stack"):
+        parts.append(f"Tech stack: {', '.join(map(str, design['tech_stack']))}")
+    text = "\n".join(parts)
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+# -----------------------------
+# Index
+# -----------------------------
+class SimilarityIndex:
+    """
+    Fixed-capacity index of sessions. Each row holds a prompt vector (for
+    question reuse) and, once the session is completed, a design vector over
+    prompt, answers and design (for reference retrieval). When full, the
+    least recently added session is overwritten.
+    """
+
+    def __init__(self, dim: int, capacity: int, reference_chars: int):
+        self.dim = dim
+        self.capacity = capacity
+        self.reference_chars = reference_chars
+        self._prompts = np.zeros((capacity, dim), dtype=np.float32)
+        self._designs = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids: List[Optional[str]] = [None] * capacity
+        self._questions: List[List[str]] = [[] for _ in range(capacity)]
+        self._references: List[Optional[str]] = [None] * capacity
+        self._rows: Dict[str, int] = {}
+        self._size = 0
+        self._next = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _row(self, session_id: str) -> int:
+        row = self._rows.get(session_id)
+        if row is not None:
+            return row
+        row = self._next
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        evicted = self._ids[row]
+        if evicted is not None:
+            del self._rows[evicted]
+        self._ids[row] = session_id
+        self._rows[session_id] = row
+        self._designs[row] = 0.0
+        self._references[row] = None
+        return row
+
+    def add(self, session_id: str, prompt: str, questions: List[str]) -> None:
+        row = self._row(session_id)
+        self._prompts[row] = embed(prompt, self.dim)
+        self._questions[row] = list(questions or [])
+
+    def set_design(self, session_id: str, prompt: str, answers: List[Dict], design: Dict) -> None:
+        """Record (or replace) a session's final design, making it available as a reference."""
+        row = self._rows.get(session_id)
+        if row is None:
+            row = self._row(session_id)
+            self._prompts[row] = embed(prompt, self.dim)
+        reference = design_reference(prompt, design, self.reference_chars)
+        self._designs[row] = embed(f"{prompt} {answers_text(answers)} {reference}", self.dim)
+        self._references[row] = reference
+
+    def _top(self, matrix: np.ndarray, vector: np.ndarray, k: int, threshold: float, exclude: Optional[str]):
+        if not self._size or not vector.any():
+            return []
+        scores = matrix[:self._size] @ vector
+        excluded = self._rows.get(exclude) if exclude else None
+        if excluded is not None:
+            scores[excluded] = -1.0
+        k = min(k, self._size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top if scores[row] >= threshold]
+
+    def similar_questions(self, prompt: str, threshold: float) -> Optional[Tuple[str, float, List[str]]]:
+        """(session_id, score, questions) of the closest past prompt with questions, if at least `threshold` similar."""
+        for row, score in self._top(self._prompts, embed(prompt, self.dim), 5, threshold, None):
+            if self._questions[row]:
+                return self._ids[row], score, self._questions[row]
+        return None
+
+    def similar_designs(
+        self, prompt: str, answers: List[Dict], k: int, threshold: float, exclude: Optional[str] = None
+    ) -> List[Tuple[str, float, str]]:
+        """Up to k (session_id, score, reference text) of the closest completed designs, best first."""
+        vector = embed(f"{prompt} {answers_text(answers)}", self.dim)
+        return [
+            (self._ids[row], score, self._references[row])
+            for row, score in self._top(self._designs, vector, k, threshold, exclude)
+            if self._references[row]
+        ]
+
+    async def load(self) -> None:
+        """Fill the index from the most recently updated sessions."""
+        query = (
+            select(sessions.c.id, sessions.c.prompt, sessions.c.questions, sessions.c.answers,
+                   sessions.c.final_design, sessions.c.status, sessions.c.archived_at)
+            .order_by(sessions.c.updated_at.desc())
+            .limit(self.capacity)
+        )
+        rows = [dict(r) for r in await database.fetch_all(query)]
+        payloads = await archive.load_payloads([r["id"] for r in rows if r["archived_at"]])
+        for r in reversed(rows):  # oldest first, so the newest are the last to be evicted
+            archive.hydrate(r, payloads.get(r["id"]))
+            self.add(r["id"], r["prompt"], r["questions"])
+            if r["status"] == SessionStatus.completed and isinstance(r["final_design"], dict):
+                self.set_design(r["id"], r["prompt"], r["answers"], r["final_design"])
+        logger.info(f"Similarity index loaded with {len(self)} sessions")
+
+
+index = SimilarityIndex(
+    dim=settings.SIMILARITY_DIM,
+    capacity=settings.SIMILARITY_MAX_ENTRIES,
+    reference_chars=settings.SIMILARITY_REFERENCE_CHARS,
+)
+
+
+# -----------------------------
+# Warm-start helpers
+# -----------------------------
+def record_session(session_id: str, prompt: str, questions: List[str]) -> None:
+    """Index a new session's prompt and questions (no-op when the index is disabled)."""
+    if settings.SIMILARITY_ENABLED:
+        index.add(session_id, prompt, questions)
+
+
+def record_design(session_id: str, prompt: str, answers: List[Dict], design: Dict) -> None:
+    """Index a session's final design as a reference (no-op when the index is disabled)."""
+    if settings.SIMILARITY_ENABLED:
+        index.set_design(session_id, prompt, answers, design)
+
+
+def reusable_questions(prompt: str) -> Optional[List[str]]:
+    """Questions of a near-duplicate past prompt, or None when there is none (or the index is disabled)."""
+    if not settings.SIMILARITY_ENABLED:
+        return None
+    match = index.similar_questions(prompt, settings.SIMILARITY_QUESTION_THRESHOLD)
+    SIMILARITY_LOOKUPS.inc(kind="questions", outcome="hit" if match else "miss")
+    if match is None:
+        return None
+    session_id, score, questions = match
+    logger.info(f"Reusing questions of session {session_id} (similarity {score:.2f})")
+    return questions
+
+
+def design_references(data: Dict) -> Optional[str]:
+    """Reference context for finalizing session `data`: the top-k similar completed designs, or None."""
+    if not settings.SIMILARITY_ENABLED or settings.SIMILARITY_DESIGN_TOP_K <= 0:
+        return None
+    matches = index.similar_designs(
+        data["prompt"], data.get("answers") or [],
+        k=settings.SIMILARITY_DESIGN_TOP_K,
+        threshold=settings.SIMILARITY_DESIGN_THRESHOLD,
+        exclude=data.get("id"),
+    )
+    SIMILARITY_LOOKUPS.inc(kind="design", outcome="hit" if matches else "miss")
+    if not matches:
+        return None
+    return "\n\n".join(reference for _, _, reference in matches)
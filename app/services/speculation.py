@@ -0,0 +1,136 @@
+# app/services/speculation.py
+"""
+Speculative finalize: once a session becomes ready_to_finalize, generate the
+final design in the background and store it as a draft, so the user's
+finalize request can return it without waiting for Gemini.
+
+A draft is only used while its inputs hash still matches the session (see
+llm_service.design_inputs_hash), and it is written with a version check so a
+draft computed from stale answers is never stored. Tasks are per process;
+other workers simply see the stored draft.
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.db import database
+from app.models.db_models import sessions, SessionStatus
+from app.services import conversation_store, llm_service, similarity
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_FINALIZE = metrics.counter(
+    "architai_speculative_finalize_total",
+    "Speculative finalize runs and draft lookups by outcome",
+    ["outcome"],
+)
+
+
+class Speculator:
+    """Background draft generation, at most one task per session."""
+
+    def __init__(self, enabled: bool, max_inflight: int):
+        self.enabled = enabled
+        self.max_inflight = max_inflight
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def schedule(self, session_id: str) -> None:
+        """Start (or restart) draft generation for a session that just became ready_to_finalize."""
+        if not self.enabled:
+            return
+        self.cancel(session_id)
+        if len(self._tasks) >= self.max_inflight:
+            SPECULATIVE_FINALIZE.inc(outcome="skipped")
+            return
+        task = asyncio.create_task(self._run(session_id))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda t: self._forget(session_id, t))
+        SPECULATIVE_FINALIZE.inc(outcome="started")
+
+    def cancel(self, session_id: str) -> None:
+        """Drop in-flight speculative work, e.g. because the answers changed."""
+        task = self._tasks.pop(session_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+            SPECULATIVE_FINALIZE.inc(outcome="cancelled")
+
+    async def wait(self, session_id: str) -> None:
+        """Let a running speculation for this session finish instead of starting a duplicate generation."""
+        task = self._tasks.get(session_id)
+        if task is None:
+            return
+        try:
+            await asyncio.shield(task)
+        except Exception:
+            pass  # the caller falls back to a fresh run
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _forget(self, session_id: str, task: asyncio.Task) -> None:
+        if self._tasks.get(session_id) is task:
+            del self._tasks[session_id]
+
+    async def _run(self, session_id: str) -> None:
+        record = await database.fetch_one(sessions.select().where(sessions.c.id == session_id))
+        if not record or record["status"] != SessionStatus.ready_to_finalize:
+            return
+        data = dict(record)
+        conversation, _ = await conversation_store.load_conversation(session_id, data.get("conversation"))
+        inputs_hash = llm_service.design_inputs_hash(data["prompt"], conversation)
+
+        try:
+            draft_conversation = list(conversation)
+            design = await llm_service.generate_final_design(
+                data["prompt"], draft_conversation, references=similarity.design_references(data)
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Speculative finalize failed for session {session_id}")
+            SPECULATIVE_FINALIZE.inc(outcome="failed")
+            return
+
+        # Only store the draft if nobody has written to the session since it was read
+        stored = await database.fetch_one(
+            sessions.update()
+            .where(sessions.c.id == session_id)
+            .where(sessions.c.version == data["version"])
+            .values(
+                draft_design=design,
+                draft_raw=draft_conversation[-1]["text"],
+                draft_inputs_hash=inputs_hash,
+                updated_at=sessions.c.updated_at,  # a draft is not a user-visible change
+            )
+            .returning(sessions.c.id)
+        )
+        SPECULATIVE_FINALIZE.inc(outcome="stored" if stored else "stale")
+
+
+def usable_draft(data: Dict, conversation: List[Dict]) -> Optional[Dict]:
+    """The stored draft for this session if it was generated from exactly these inputs."""
+    if not data.get("draft_design") or not data.get("draft_inputs_hash"):
+        return None
+    if data["draft_inputs_hash"] != llm_service.design_inputs_hash(data["prompt"], conversation):
+        SPECULATIVE_FINALIZE.inc(outcome="miss")
+        return None
+    SPECULATIVE_FINALIZE.inc(outcome="hit")
+    return data["draft_design"]
+
+
+async def replay_draft(data: Dict, draft: Dict, conversation: List[Dict]) -> AsyncIterator[Tuple[str, Any]]:
+    """Emit a stored draft with the same events as llm_service.stream_final_design, without calling Gemini."""
+    for name in llm_service.FINAL_DESIGN_SECTIONS:
+        if name in draft:
+            yield "section", (name, draft[name])
+    conversation.append(llm_service.design_raw_message(data["prompt"], data["draft_raw"]))
+    yield "design", draft
+
+
+speculator = Speculator(enabled=settings.LLM_SPECULATIVE_FINALIZE, max_inflight=settings.LLM_SPECULATIVE_MAX_INFLIGHT)
@@ -0,0 +1,197 @@
+# app/services/transfer.py
+"""
+Streaming export/import of sessions as newline-delimited JSON (optionally gzip).
+
+One line per session, with its messages inlined:
+  {"id": ..., "prompt": ..., "questions": [...], "answers": [...], "final_design": {...},
+   "status": ..., "user_id": ..., "created_at": ..., "updated_at": ...,
+   "messages": [{"role": ..., "text": ..., "meta": ...}, ...]}
+
+Export walks the sessions table in keyset-ordered chunks (by id) and import
+inserts in batches, so memory stays bounded by the batch size on both ends.
+Keyset chunks are used rather than one long-lived server-side cursor so an
+export does not hold a connection and transaction open for its whole run.
+"""
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List
+
+from sqlalchemy import select
+
+from app.core.db import database
+from app.models.db_models import messages, sessions, SessionStatus
+from app.services import archive
+from app.services.conversation_store import row_to_message
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+EXPORT_COLUMNS = [
+    sessions.c.id,
+    sessions.c.prompt,
+    sessions.c.questions,
+    sessions.c.answers,
+    sessions.c.conversation,  # legacy sessions not yet moved to the messages table
+    sessions.c.final_design,
+    sessions.c.status,
+    sessions.c.user_id,
+    sessions.c.created_at,
+    sessions.c.updated_at,
+    sessions.c.archived_at,
+]
+
+
+class InvalidRecord(ValueError):
+    """A line of the import stream is not a valid session record."""
+
+
+# -----------------------------
+# Export
+# -----------------------------
+def _session_record(row: Dict, session_messages: List[Dict]) -> Dict:
+    row.pop("archived_at", None)
+    legacy = row.pop("conversation", None)
+    row["status"] = row["status"].value if isinstance(row["status"], SessionStatus) else row["status"]
+    for key in ("created_at", "updated_at"):
+        if isinstance(row[key], datetime):
+            row[key] = row[key].isoformat()
+    row["messages"] = session_messages or list(legacy or [])
+    return row
+
+
+async def iter_sessions(batch_size: int) -> AsyncIterator[Dict]:
+    """Yield export records for every session, batch_size sessions (and their messages) at a time."""
+    last_id = None
+    while True:
+        query = select(*EXPORT_COLUMNS).order_by(sessions.c.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(sessions.c.id > last_id)
+        rows = [dict(r) for r in await database.fetch_all(query)]
+        if not rows:
+            return
+        ids = [r["id"] for r in rows]
+        message_rows = await database.fetch_all(
+            messages.select()
+            .where(messages.c.session_id.in_(ids))
+            .order_by(messages.c.session_id, messages.c.seq)
+        )
+        by_session: Dict[str, List[Dict]] = {}
+        for m in message_rows:
+            by_session.setdefault(m["session_id"], []).append(row_to_message(m))
+        payloads = await archive.load_payloads([r["id"] for r in rows if r["archived_at"]])
+        for row in rows:
+            archive.hydrate(row, payloads.get(row["id"]))
+            yield _session_record(row, by_session.get(row["id"], []))
+        last_id = ids[-1]
+
+
+async def export_ndjson(batch_size: int, compress: bool = False) -> AsyncIterator[bytes]:
+    """Encoded export stream; gzip-compressed incrementally when `compress` is set."""
+    gzip = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+    async for record in iter_sessions(batch_size):
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        if gzip is None:
+            yield line
+        else:
+            chunk = gzip.compress(line)
+            if chunk:
+                yield chunk
+    if gzip is not None:
+        yield gzip.flush()
+
+
+# -----------------------------
+# Import
+# -----------------------------
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines, transparently gunzipping it if it starts with the gzip magic."""
+    decoder = None
+    pending = b""
+    first = True
+    async for chunk in chunks:
+        if first and chunk:
+            first = False
+            if chunk[:2] == GZIP_MAGIC:
+                decoder = zlib.decompressobj(wbits=31)
+        if decoder is not None:
+            chunk = decoder.decompress(chunk)
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if decoder is not None:
+        pending += decoder.flush()
+    if pending.strip():
+        yield pending
+
+
+def _parse_record(line: bytes, line_no: int) -> Dict:
+    try:
+        record = json.loads(line)
+        created_at = datetime.fromisoformat(record["created_at"]) if record.get("created_at") else datetime.utcnow()
+        updated_at = datetime.fromisoformat(record["updated_at"]) if record.get("updated_at") else created_at
+        session = {
+            "id": record["id"],
+            "prompt": record["prompt"],
+            "questions": record.get("questions") or [],
+            "answers": record.get("answers") or [],
+            "final_design": record.get("final_design"),
+            "status": SessionStatus(record.get("status") or SessionStatus.in_progress),
+            "user_id": record.get("user_id"),
+            "version": 0,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+        session_messages = []
+        for seq, m in enumerate(record.get("messages") or []):
+            meta = m.get("meta")
+            session_messages.append({
+                "session_id": record["id"],
+                "seq": seq,
+                "role": m["role"],
+                "text": m["text"],
+                "meta": meta if meta is None or isinstance(meta, str) else json.dumps(meta),
+                "created_at": updated_at,
+            })
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidRecord(f"line {line_no}: {e}")
+    return {"session": session, "messages": session_messages}
+
+
+async def _insert_batch(batch: List[Dict], stats: Dict) -> None:
+    unique = {item["session"]["id"]: item for item in batch}  # last duplicate within a batch wins
+    existing = {
+        r["id"] for r in await database.fetch_all(select(sessions.c.id).where(sessions.c.id.in_(list(unique))))
+    }
+    fresh = [item for session_id, item in unique.items() if session_id not in existing]
+    stats["skipped"] += len(batch) - len(fresh)
+    if not fresh:
+        return
+    session_rows = [item["session"] for item in fresh]
+    message_rows = [m for item in fresh for m in item["messages"]]
+    async with database.transaction():
+        await database.execute_many(sessions.insert(), session_rows)
+        if message_rows:
+            await database.execute_many(messages.insert(), message_rows)
+    stats["imported"] += len(session_rows)
+    stats["messages"] += len(message_rows)
+
+
+async def import_ndjson(chunks: AsyncIterator[bytes], batch_size: int) -> Dict:
+    """
+    Insert sessions from an export stream in batches. Sessions whose id already
+    exists are skipped, so re-running an interrupted import is safe.
+    """
+    stats = {"imported": 0, "skipped": 0, "messages": 0}
+    batch: List[Dict] = []
+    line_no = 0
+    async for line in iter_lines(chunks):
+        line_no += 1
+        batch.append(_parse_record(line, line_no))
+        if len(batch) >= batch_size:
+            await _insert_batch(batch, stats)
+            batch = []
+    if batch:
+        await _insert_batch(batch, stats)
+    return stats
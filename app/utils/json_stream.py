@@ -0,0 +1,154 @@
+# app/utils/json_stream.py
+import json
+from typing import Any, List, Tuple
+
+
+class JSONSectionParser:
+    """
+    Incrementally scan a streamed top-level JSON object and return each
+    member ("section") as soon as its value is complete.
+
+    Text before the opening brace (e.g. a ```json fence) is ignored, and a
+    member that does not parse on its own is skipped rather than raised,
+    since the full text is parsed again once the stream ends.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+        self._done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.buffer += chunk
+        sections = []
+        while self._pos < len(self.buffer) and not self._done:
+            ch = self.buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = self._pos + 1
+            elif ch in "}]" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    sections.extend(self._close_member())
+                    self._done = True
+            elif ch == "," and self._depth == 1:
+                sections.extend(self._close_member())
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return sections
+
+    def _close_member(self) -> List[Tuple[str, Any]]:
+        member = self.buffer[self._member_start:self._pos].strip()
+        if not member:
+            return []
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return []
+        return list(parsed.items())
+
+
+def repair_json(text: str) -> Any:
+    """
+    Parse almost-valid JSON from an LLM in a single pass, tolerating:
+      - prose or ```json fences around the value
+      - trailing commas before } or ]
+      - raw newlines and tabs inside strings
+      - truncation: open strings and containers are closed, and a dangling
+        key or partial member is dropped
+
+    Raises ValueError when the text still cannot be parsed.
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError("no JSON object or array found")
+
+    out: List[str] = []
+    stack: List[str] = []
+    # (output length, stack depth) after each complete member, for cutting back a truncated tail
+    safe_points: List[Tuple[int, int]] = []
+    in_string = escape = False
+
+    for ch in text[min(starts):]:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                ch = "\\n"
+            elif ch == "\t":
+                ch = "\\t"
+            out.append(ch)
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            safe_points.append((len(out), len(stack)))
+            continue
+        elif ch in "}]":
+            if not stack or ch != stack[-1]:
+                raise ValueError(f"unbalanced '{ch}'")
+            _strip_trailing_comma(out)
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                break
+            continue
+        elif ch == ",":
+            _strip_trailing_comma(out)  # collapse ",," left by the model
+            safe_points.append((len(out), len(stack)))
+        out.append(ch)
+
+    if not stack:
+        return json.loads("".join(out))
+
+    # Truncated: first keep the partial tail (e.g. an unfinished string value) ...
+    tail = "".join(out) + ('"' if in_string and not escape else "")
+    try:
+        return json.loads(_close(tail, stack))
+    except json.JSONDecodeError:
+        pass
+    # ... then fall back to the last complete member
+    for length, depth in reversed(safe_points):
+        head = list(out[:length])
+        _strip_trailing_comma(head)
+        try:
+            return json.loads(_close("".join(head), stack[:depth]))
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("could not repair truncated JSON")
+
+
+def _strip_trailing_comma(out: List[str]) -> None:
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i:]
+
+
+def _close(text: str, stack: List[str]) -> str:
+    text = text.rstrip()
+    if text.endswith(","):
+        text = text[:-1]
+    return text + "".join(reversed(stack))
@@ -0,0 +1,64 @@
+# app/utils/response_schema.py
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel
+
+# JSON Schema keywords Gemini's responseSchema (an OpenAPI 3.0 subset) understands
+_PASSTHROUGH = ("description", "enum", "format", "minItems", "maxItems")
+
+
+def gemini_response_schema(model: Type[BaseModel], require_all: bool = False) -> Dict:
+    """
+    Translate a pydantic model into Gemini's responseSchema format: $refs are
+    inlined, Optional[X] becomes X with nullable, type names are upper-case,
+    and propertyOrdering follows the model's field order. Fields whose type
+    cannot be expressed (e.g. List[Any]) are left out.
+
+    With require_all, fields that have defaults are required too, so the
+    model cannot omit them (Optional fields may still be null).
+    """
+    schema = model.model_json_schema()
+    return _convert(schema, schema.get("$defs", {}), require_all)
+
+
+def _convert(node: Dict, defs: Dict, require_all: bool = False) -> Optional[Dict]:
+    if "$ref" in node:
+        return _convert(defs[node["$ref"].split("/")[-1]], defs, require_all)
+
+    variants = node.get("anyOf")
+    if variants:
+        non_null = [v for v in variants if v.get("type") != "null"]
+        if len(non_null) != 1:
+            return None
+        converted = _convert(non_null[0], defs, require_all)
+        if converted is not None and len(non_null) < len(variants):
+            converted["nullable"] = True
+        return converted
+
+    json_type = node.get("type")
+    if json_type is None:
+        return None  # Any
+    out: Dict[str, Any] = {"type": json_type.upper()}
+    for key in _PASSTHROUGH:
+        if key in node:
+            out[key] = node[key]
+
+    if json_type == "array":
+        items = _convert(node.get("items", {}), defs, require_all)
+        if items is None:
+            return None
+        out["items"] = items
+    elif json_type == "object":
+        properties = {}
+        for name, prop in node.get("properties", {}).items():
+            converted = _convert(prop, defs, require_all)
+            if converted is not None:
+                properties[name] = converted
+        if not properties:
+            return None
+        out["properties"] = properties
+        out["propertyOrdering"] = list(properties)
+        required = list(properties) if require_all else [n for n in node.get("required", []) if n in properties]
+        if required:
+            out["required"] = required
+    return out
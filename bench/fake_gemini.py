@@ -0,0 +1,173 @@
+# bench/fake_gemini.py
+"""
+Local stand-in for the Gemini REST API, for benchmarks and load tests.
+
+Answers generateContent and streamGenerateContent with well-formed responses
+for each ArchitAI prompt type (questions, replies, batched replies, summaries,
+final design, design patch), after a latency drawn from a configurable
+distribution, and injects 500s and 429s at configurable rates.
+
+  python -m bench.fake_gemini --port 8799 --latency lognormal:0.8,0.5 --error-rate 0.01
+
+Latency specs (seconds):
+  fixed:S             always S
+  uniform:LO,HI       uniformly distributed
+  lognormal:MEDIAN,SIGMA
+  normal:MEAN,STDDEV  clipped at 0
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+from typing import Callable, Dict
+
+from aiohttp import web
+
+DESIGN = {
+    "summary": "A horizontally scaled web service with a relational store and a cache.",
+    "components": [
+        {
+            "name": "API Gateway",
+            "description": "Terminates TLS, authenticates and routes requests.",
+            "details": {"technology_stack": ["Nginx"], "responsibilities": ["Routing", "Rate limiting"]},
+        },
+        {
+            "name": "Application Service",
+            "description": "Stateless business logic.",
+            "details": {"technology_stack": ["Python", "FastAPI"], "responsibilities": ["Business rules"]},
+        },
+        {
+            "name": "Database",
+            "description": "Primary system of record.",
+            "details": {"technology_stack": ["PostgreSQL"], "responsibilities": ["Persistence"]},
+        },
+    ],
+    "db_schema": "users(id, email), orders(id, user_id, total)",
+    "mermaid": "graph TD; Client-->API_Gateway; API_Gateway-->Application_Service; Application_Service-->Database",
+    "tech_stack": ["Python", "FastAPI", "PostgreSQL", "Redis"],
+    "integration_steps": ["Provision the database", "Deploy the service", "Configure the gateway"],
+    "rationale": "Simple, well understood components that scale horizontally.",
+    "diagram_url": None,
+}
+
+PATCH = {
+    "summary": "Revised: " + DESIGN["summary"],
+    "components": [DESIGN["components"][1]],
+    "removed_components": [],
+}
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+
+def reply_for(prompt: str) -> str:
+    if "revising an existing system design" in prompt:
+        return json.dumps(PATCH)
+    if "senior system architect" in prompt:
+        return json.dumps(DESIGN)
+    match = re.search(r"JSON array of exactly (\d+) strings", prompt)
+    if match:
+        return json.dumps([f"Noted, thanks ({i + 1})." for i in range(int(match.group(1)))])
+    if "JSON array" in prompt:
+        match = re.search(r"Generate (\d+) questions", prompt)
+        count = int(match.group(1)) if match else 4
+        return json.dumps([f"Clarifying question {i + 1}?" for i in range(count)])
+    if "running summary" in prompt:
+        return "The user wants a scalable web service; requirements gathered so far are noted."
+    return "Thanks, noted. That helps narrow down the design."
+
+
+class FakeGemini:
+    def __init__(self, latency: Callable[[], float], error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 chunk_size: int = 40):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.chunk_size = chunk_size
+        self.stats: Dict[str, int] = {"requests": 0, "streams": 0, "errors": 0, "throttled": 0}
+
+    def _fault(self):
+        roll = random.random()
+        if roll < self.error_rate:
+            self.stats["errors"] += 1
+            return web.Response(status=500, text="injected failure")
+        if roll < self.error_rate + self.throttle_rate:
+            self.stats["throttled"] += 1
+            return web.Response(status=429, text="injected throttle", headers={"Retry-After": "1"})
+        return None
+
+    async def generate(self, request: web.Request) -> web.Response:
+        self.stats["requests"] += 1
+        body = await request.json()
+        prompt = body["contents"][0]["parts"][0]["text"]
+        await asyncio.sleep(self.latency())
+        fault = self._fault()
+        if fault is not None:
+            return fault
+        text = reply_for(prompt)
+        return web.json_response({
+            "candidates": [{"content": {"parts": [{"text": text}]}}],
+            "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4},
+        })
+
+    async def stream(self, request: web.Request) -> web.StreamResponse:
+        self.stats["streams"] += 1
+        body = await request.json()
+        prompt = body["contents"][0]["parts"][0]["text"]
+        fault = self._fault()
+        if fault is not None:
+            return fault
+        text = reply_for(prompt)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+        delay = self.latency() / len(chunks)
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            frame = {"candidates": [{"content": {"parts": [{"text": chunk}]}}]}
+            await resp.write(f"data: {json.dumps(frame)}\r\n\r\n".encode())
+        return resp
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1beta/models/{model}:generateContent", self.generate)
+        app.router.add_post("/v1beta/models/{model}:streamGenerateContent", self.stream)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Gemini server for ArchitAI benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", default="lognormal:0.5,0.4", help="latency distribution, see module docstring")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    fake = FakeGemini(parse_latency(args.latency), args.error_rate, args.throttle_rate)
+    web.run_app(fake.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
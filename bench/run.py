@@ -0,0 +1,360 @@
+# bench/run.py
+"""
+End-to-end benchmark of the session lifecycle.
+
+Boots bench.fake_gemini and the FastAPI app (uvicorn, fresh SQLite database)
+as subprocesses, drives concurrent virtual users through full sessions
+(create -> one reply per question -> finalize -> get) and reports, per
+endpoint, latency percentiles and errors, plus throughput, DB time (from the
+app's /metrics) and app memory. Results are written as JSON so runs can be
+compared:
+
+  python -m bench.run --users 20 --sessions 200 --latency lognormal:0.5,0.4
+  python -m bench.run --compare bench/results/<baseline>.json --threshold 0.15
+
+--env KEY=VALUE passes app settings (e.g. --env REPLY_MODE=batched); set
+DATABASE_URL there to benchmark another database. The LLM response cache and
+the similarity warm start are off unless --cache / --similarity are given,
+since the benchmark prompts repeat.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+
+ENDPOINTS = ("create_session", "reply_to_session", "finalize_session", "get_session")
+PROMPTS = (
+    "A ride sharing app for a mid-sized city",
+    "An online bookstore with recommendations",
+    "A multiplayer quiz game backend",
+    "An IoT telemetry ingestion pipeline",
+)
+
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def parse_metrics(text: str, name: str) -> Dict[str, float]:
+    """{label string: value} for every sample of one metric in Prometheus text format."""
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith(name + "{") or line.startswith(name + " "):
+            key, _, value = line.rpartition(" ")
+            samples[key[len(name):] or "{}"] = float(value)
+    return samples
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+# -----------------------------
+# Virtual users
+# -----------------------------
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.sessions_completed = 0
+        self.sessions_failed = 0
+
+    async def call(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[endpoint] += 1
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if resp.status_code >= 400:
+            self.errors[endpoint] += 1
+            return None
+        return resp.json()
+
+
+async def run_session(client: httpx.AsyncClient, recorder: Recorder, index: int) -> None:
+    created = await recorder.call(
+        client, "create_session", "POST", "/session/", json={"prompt": PROMPTS[index % len(PROMPTS)]}
+    )
+    if created is None:
+        recorder.sessions_failed += 1
+        return
+    session_id = created["session_id"]
+    for n, question in enumerate(created["questions"]):
+        answer = {"question": question, "answer": f"Answer {n} for session {index}"}
+        if await recorder.call(client, "reply_to_session", "POST", f"/session/{session_id}/reply",
+                               json={"answers": [answer]}) is None:
+            recorder.sessions_failed += 1
+            return
+    if await recorder.call(client, "finalize_session", "POST", f"/session/{session_id}/finalize") is None:
+        recorder.sessions_failed += 1
+        return
+    if await recorder.call(client, "get_session", "GET", f"/session/{session_id}") is None:
+        recorder.sessions_failed += 1
+        return
+    recorder.sessions_completed += 1
+
+
+async def virtual_user(base_url: str, queue: "asyncio.Queue[int]", recorder: Recorder, timeout: float) -> None:
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        while True:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await run_session(client, recorder, index)
+
+
+async def sample_memory(pid: int, samples: List[int], interval: float = 0.5) -> None:
+    while True:
+        value = rss_bytes(pid)
+        if value is not None:
+            samples.append(value)
+        await asyncio.sleep(interval)
+
+
+# -----------------------------
+# Run
+# -----------------------------
+async def benchmark(args, app_pid: int, base_url: str) -> Dict:
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for i in range(args.warmup):
+            await run_session(client, Recorder(), i)
+        before = (await client.get("/metrics")).text
+
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for i in range(args.sessions):
+        queue.put_nowait(i)
+    recorder = Recorder()
+    memory: List[int] = []
+    sampler = asyncio.create_task(sample_memory(app_pid, memory))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user(base_url, queue, recorder, args.timeout) for _ in range(args.users)))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        after = (await client.get("/metrics")).text
+
+    endpoints = {}
+    total_requests = 0
+    for endpoint in ENDPOINTS:
+        values = sorted(recorder.latencies.get(endpoint, []))
+        total_requests += len(values) + recorder.errors.get(endpoint, 0)
+        endpoints[endpoint] = {
+            "count": len(values),
+            "errors": recorder.errors.get(endpoint, 0),
+            "mean": sum(values) / len(values) if values else None,
+            "p50": percentile(values, 50),
+            "p90": percentile(values, 90),
+            "p99": percentile(values, 99),
+            "max": values[-1] if values else None,
+            "rps": len(values) / elapsed if elapsed else None,
+        }
+
+    def delta(name: str) -> Dict[str, float]:
+        old, new = parse_metrics(before, name), parse_metrics(after, name)
+        return {k: round(v - old.get(k, 0.0), 6) for k, v in new.items() if v - old.get(k, 0.0)}
+
+    db_seconds = delta("architai_db_query_seconds_sum")
+    db_queries = delta("architai_db_query_seconds_count")
+    return {
+        "duration_seconds": round(elapsed, 3),
+        "requests": total_requests,
+        "requests_per_second": total_requests / elapsed if elapsed else None,
+        "sessions_completed": recorder.sessions_completed,
+        "sessions_failed": recorder.sessions_failed,
+        "sessions_per_second": recorder.sessions_completed / elapsed if elapsed else None,
+        "endpoints": endpoints,
+        "db": {
+            "seconds_total": round(sum(db_seconds.values()), 6),
+            "queries_total": int(sum(db_queries.values())),
+            "seconds_by_query": db_seconds,
+        },
+        "llm": {
+            "upstream_seconds": delta("architai_gemini_request_seconds_sum"),
+            "upstream_calls": delta("architai_gemini_request_seconds_count"),
+        },
+        "memory": {
+            "rss_start_bytes": memory[0] if memory else None,
+            "rss_peak_bytes": max(memory) if memory else None,
+            "rss_end_bytes": memory[-1] if memory else None,
+        },
+    }
+
+
+def start_processes(args, workdir: str):
+    fake_cmd = [
+        sys.executable, "-m", "bench.fake_gemini", "--port", str(args.fake_port),
+        "--latency", args.latency, "--error-rate", str(args.error_rate),
+        "--throttle-rate", str(args.throttle_rate),
+    ]
+    if args.seed is not None:
+        fake_cmd += ["--seed", str(args.seed)]
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}",
+        "GOOGLE_GEMINI_API_KEY": "bench",
+        "GOOGLE_GEMINI_BASE_URL": f"http://127.0.0.1:{args.fake_port}/v1beta",
+        "LLM_PROVIDER": "gemini",
+        "LLM_RECORD_MODE": "off",
+        # PROMPTS repeat across sessions, so the response cache and the similarity warm start
+        # would skip most Gemini calls and measure themselves instead of the pipeline
+        "LLM_CACHE_ENABLED": "true" if args.cache else "false",
+        "SIMILARITY_ENABLED": "true" if args.similarity else "false",
+    })
+    env.update(dict(item.split("=", 1) for item in args.env))
+    app_cmd = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(args.app_port), "--log-level", "warning",
+    ]
+    fake = subprocess.Popen(fake_cmd)
+    output = subprocess.DEVNULL if args.quiet else None
+    app = subprocess.Popen(app_cmd, env=env, stdout=output, stderr=output)
+    return fake, app
+
+
+def print_report(results: Dict) -> None:
+    print(f"\n{'endpoint':<18}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in results["endpoints"].items():
+        def ms(value):
+            return f"{value * 1000:.1f}" if value is not None else "-"
+        print(f"{name:<18}{stats['count']:>7}{stats['errors']:>8}{ms(stats['p50']):>10}"
+              f"{ms(stats['p90']):>10}{ms(stats['p99']):>10}{ms(stats['max']):>10}")
+    memory = results["memory"]["rss_peak_bytes"]
+    print(f"\n{results['requests']} requests in {results['duration_seconds']}s "
+          f"({results['requests_per_second']:.1f} req/s, {results['sessions_per_second']:.2f} sessions/s, "
+          f"{results['sessions_failed']} sessions failed)")
+    print(f"DB: {results['db']['queries_total']} queries, {results['db']['seconds_total']:.3f}s total; "
+          f"peak RSS: {memory / 2**20:.1f} MiB" if memory else "peak RSS: n/a")
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> bool:
+    """Print changes against a baseline run; True if anything regressed by more than `threshold`."""
+    regressed = False
+    print(f"\nCompared with {baseline['meta'].get('label') or baseline['meta'].get('git_revision')}:")
+    for name, stats in results["endpoints"].items():
+        old = baseline["results"]["endpoints"].get(name)
+        if not old:
+            continue
+        for key in ("p50", "p99"):
+            if not old.get(key) or stats.get(key) is None:
+                continue
+            change = stats[key] / old[key] - 1
+            flag = "  REGRESSION" if change > threshold else ""
+            regressed |= bool(flag)
+            print(f"  {name} {key}: {old[key] * 1000:.1f} -> {stats[key] * 1000:.1f} ms ({change:+.1%}){flag}")
+    old_rps = baseline["results"].get("requests_per_second")
+    if old_rps and results["requests_per_second"]:
+        change = results["requests_per_second"] / old_rps - 1
+        flag = "  REGRESSION" if change < -threshold else ""
+        regressed |= bool(flag)
+        print(f"  throughput: {old_rps:.1f} -> {results['requests_per_second']:.1f} req/s ({change:+.1%}){flag}")
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the ArchitAI session lifecycle.")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--sessions", type=int, default=50, help="sessions to run in total")
+    parser.add_argument("--warmup", type=int, default=2, help="sessions run before measuring")
+    parser.add_argument("--latency", default="lognormal:0.5,0.4", help="fake Gemini latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="app setting override")
+    parser.add_argument("--cache", action="store_true", help="enable the LLM response cache")
+    parser.add_argument("--similarity", action="store_true", help="enable the similarity warm start")
+    parser.add_argument("--app-port", type=int, default=8800)
+    parser.add_argument("--fake-port", type=int, default=8799)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request client timeout")
+    parser.add_argument("--label", default=None, help="name for this run in results and comparisons")
+    parser.add_argument("--output", default=os.path.join("bench", "results"))
+    parser.add_argument("--compare", default=None, metavar="RESULTS_JSON", help="baseline run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change that counts as a regression")
+    parser.add_argument("--quiet", action="store_true", help="hide app output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        fake, app = start_processes(args, workdir)
+        try:
+            base_url = f"http://127.0.0.1:{args.app_port}"
+            asyncio.run(wait_until_up(f"http://127.0.0.1:{args.fake_port}/stats"))
+            asyncio.run(wait_until_up(base_url + "/"))
+            results = asyncio.run(benchmark(args, app.pid, base_url))
+        finally:
+            for process in (app, fake):
+                process.terminate()
+                process.wait(timeout=10)
+
+    meta = {
+        "label": args.label,
+        "git_revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output", "quiet")},
+    }
+    print_report(results)
+
+    os.makedirs(args.output, exist_ok=True)
+    name = f"{meta['timestamp'].replace(':', '')}-{args.label or meta['git_revision'] or 'run'}.json"
+    path = os.path.join(args.output, name)
+    with open(path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
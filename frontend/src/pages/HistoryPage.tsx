@@ -30,12 +30,11 @@ const HistoryPage = () => {
   useEffect(() => {
     const fetchSessions = async () => {
       try {
-        const res = await api.get("/session");
-        const sessionsData = (res.data || []).map((s: any) => ({
+        const res = await api.get("/session", { params: { limit: 100 } });
+        const sessionsData = (res.data?.items || []).map((s: any) => ({
             id: s.session_id,
-            title: s.questions && s.questions.length > 0 ? s.questions[0] : `Session ${s.session_id.slice(0, 6)}`,
+            title: s.prompt || `Session ${s.session_id.slice(0, 6)}`,
             created_at: s.created_at,
-            conversation: s.conversation || [],
             }));
         setSessions(sessionsData);
       } catch (err) {
@@ -57,16 +56,11 @@ const HistoryPage = () => {
 
   setDetailLoading(true);
   try {
-    // Find the session locally from the sessions array
-    const selectedSession = sessions.find((s) => s.id === selectedSessionId);
-
-    if (!selectedSession) {
-      setConversation([]);
-      return;
-    }
+    // The list only carries summaries, so load the conversation on demand
+    const res = await api.get(`/session/${selectedSessionId}`);
 
     // Map backend conversation to frontend type
-    const conv: ConversationMessage[] = (selectedSession.conversation || []).map((msg: any) => ({
+    const conv: ConversationMessage[] = (res.data?.conversation || []).map((msg: any) => ({
     role:
         msg.role?.toLowerCase() === "architai"
         ? "architai"
@@ -1,15 +1,34 @@
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from app.api.v1 import design
+from app.core import migrations
 from app.core.db import database
 from app.core.config import settings
 from app.api.v1 import session  # new
+from app.api.v1 import metrics
+from app.services import archive, http_client, job_queue, session_service, similarity
+from app.services.speculation import speculator
+from app.services.resilience import CircuitOpenError, DeadlineExceeded, UpstreamError
 from fastapi.middleware.cors import CORSMiddleware
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if settings.DB_AUTO_MIGRATE:
+        await asyncio.to_thread(migrations.run)
     await database.connect()
+    if settings.SIMILARITY_ENABLED:
+        await similarity.index.load()
+    await http_client.start()
+    job_queue.queue.register("finalize", session_service.run_finalize_job)
+    await job_queue.queue.start()
+    archive.compactor.start()
     yield
+    await archive.compactor.stop()
+    await speculator.stop()
+    await job_queue.queue.stop()
+    await http_client.close()
     await database.disconnect()
 
 app = FastAPI(title="ArchitAI", version="0.1", lifespan=lifespan)
@@ -27,8 +46,25 @@ app.add_middleware(
     allow_headers=["*"],         # allow all headers
 )
 
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(int(exc.retry_after), 1))},
+    )
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+@app.exception_handler(UpstreamError)
+async def upstream_error_handler(request: Request, exc: UpstreamError):
+    return JSONResponse(status_code=502, content={"detail": str(exc)})
+
 app.include_router(design.router)
 app.include_router(session.router)  # register session routes
+app.include_router(metrics.router)
 
 @app.get("/")
 def root():
@@ -0,0 +1,109 @@
+# tests/conftest.py
+"""
+Shared fixtures. The app reads its settings when first imported, so the test
+database and a dummy API key are set here, before any app module loads.
+Async tests run on asyncio through the anyio pytest plugin.
+"""
+import os
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix="architai-tests-")
+TEST_DB = os.path.join(TEST_DIR, "test.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{TEST_DB}"
+os.environ["GOOGLE_GEMINI_API_KEY"] = "test"
+os.environ["SIMILARITY_ENABLED"] = "false"
+os.environ["ARCHIVE_INTERVAL_SECONDS"] = "0"
+
+import pytest
+
+from app.core import migrations
+from app.core.db import database
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def empty_database():
+    """Delete the test database file, so the next migration starts from scratch."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(TEST_DB + suffix):
+            os.remove(TEST_DB + suffix)
+
+
+@pytest.fixture
+async def db(empty_database):
+    """A freshly migrated, connected test database."""
+    migrations.run()
+    await database.connect()
+    yield database
+    await database.disconnect()
+
+
+@pytest.fixture
+def make_session(db):
+    """Factory inserting a session row (plus optional messages) and returning its values."""
+    from datetime import datetime
+
+    from app.models.db_models import SessionStatus, sessions
+    from app.services import conversation_store
+
+    async def make(session_id: str, conversation=None, **values):
+        now = datetime.utcnow()
+        row = {
+            "id": session_id,
+            "prompt": f"Prompt of {session_id}",
+            "questions": ["Q1?"],
+            "answers": [{"question": "Q1?", "answer": "A1"}],
+            "final_design": None,
+            "status": SessionStatus.in_progress,
+            "version": 0,
+            "created_at": now,
+            "updated_at": now,
+            **values,
+        }
+        await db.execute(sessions.insert().values(**row))
+        if conversation:
+            await conversation_store.append_messages(session_id, conversation, 0)
+        return row
+
+    return make
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """
+    Scripted LLM provider behind a fresh llm_service call path (breakers, limiter,
+    hedger, no cache). Set `provider.handler = async fn(model, timeout) -> text`.
+    """
+    from app.core.config import settings
+    from app.services import llm_service
+    from app.services.llm_providers import Completion, LLMProvider
+    from app.services.resilience import AIMDLimiter, HedgePolicy
+
+    class ScriptedProvider(LLMProvider):
+        name = "scripted"
+
+        def __init__(self):
+            self.calls = []
+            self.handler = self.ok
+
+        @staticmethod
+        async def ok(model, timeout):
+            return "ok"
+
+        async def generate(self, prompt, model, generation_config, timeout):
+            self.calls.append(model)
+            return Completion(await self.handler(model, timeout))
+
+    scripted = ScriptedProvider()
+    monkeypatch.setattr(llm_service, "get_provider", lambda: scripted)
+    monkeypatch.setattr(llm_service, "breakers", {})
+    monkeypatch.setattr(llm_service, "limiter", AIMDLimiter(initial=8, min_limit=1, max_limit=64))
+    monkeypatch.setattr(llm_service, "hedger", HedgePolicy(percentile=95, budget=1.0, min_samples=1))
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "LLM_SINGLE_FLIGHT", False)
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", False)
+    return scripted
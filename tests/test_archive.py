@@ -0,0 +1,77 @@
+# tests/test_archive.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models.db_models import SessionStatus, messages, session_archive, sessions
+from app.services import archive, conversation_store, session_service
+
+pytestmark = pytest.mark.anyio
+
+OLD = datetime.utcnow() - timedelta(days=40)
+DESIGN = {"summary": "A design", "components": [{"name": "API", "description": "REST"}]}
+CONVERSATION = [
+    {"role": "user", "text": "city wide"},
+    {"role": "architai", "text": "{}", "meta": '{"kind": "design_raw"}'},
+]
+
+
+async def _completed(make_session, session_id: str, updated_at: datetime = OLD):
+    return await make_session(
+        session_id, CONVERSATION, status=SessionStatus.completed, final_design=DESIGN, updated_at=updated_at
+    )
+
+
+async def test_compact_archives_only_old_completed_sessions(db, make_session):
+    await _completed(make_session, "old")
+    await _completed(make_session, "recent", updated_at=datetime.utcnow())
+    await make_session("open", updated_at=OLD)
+
+    stats = await archive.compact(older_than_days=30)
+    assert stats["archived"] == 1
+    assert 0 < stats["stored_bytes"]
+
+    row = await db.fetch_one(sessions.select().where(sessions.c.id == "old"))
+    assert row["archived_at"] is not None
+    assert row["final_design"] is None
+    assert row["version"] == 1
+    assert row["updated_at"] == OLD
+    assert await db.fetch_val(select(func.count()).select_from(messages).where(messages.c.session_id == "old")) == 0
+    assert await archive.compact(older_than_days=30) == {"archived": 0, "skipped": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+
+async def test_archived_session_reads_back_transparently(db, make_session):
+    await _completed(make_session, "s1")
+    await archive.compact(older_than_days=30)
+
+    data = await session_service.load_session("s1")
+    assert data["final_design"] == DESIGN
+    assert data["conversation"] == CONVERSATION
+    assert await archive.archived_final_design("s1") == DESIGN
+
+
+async def test_first_write_restores_a_hot_row(db, make_session):
+    await _completed(make_session, "s1")
+    await archive.compact(older_than_days=30)
+
+    data = await session_service.load_session("s1")
+    conversation, persisted = await conversation_store.load_conversation("s1", data.get("conversation"))
+    reply = {"role": "architai", "text": "Revised"}
+    await session_service.update_session("s1", data, conversation, persisted, lambda d: ({}, [reply]))
+
+    row = await db.fetch_one(sessions.select().where(sessions.c.id == "s1"))
+    assert row["archived_at"] is None
+    assert row["final_design"] == DESIGN
+    assert await db.fetch_one(session_archive.select().where(session_archive.c.session_id == "s1")) is None
+    conversation, persisted = await conversation_store.load_conversation("s1")
+    assert conversation == CONVERSATION + [reply]
+    assert persisted == 3
+
+
+async def test_compact_skips_a_session_written_concurrently(db, make_session):
+    row = await _completed(make_session, "s1")
+    await db.execute(sessions.update().where(sessions.c.id == "s1").values(version=1, updated_at=OLD))
+
+    assert await archive._archive_one(row, CONVERSATION, level=6) is None
+    assert (await db.fetch_one(sessions.select().where(sessions.c.id == "s1")))["archived_at"] is None
@@ -0,0 +1,78 @@
+# tests/test_context_manager.py
+import pytest
+
+from app.services.context_manager import ContextManager, estimate_tokens, format_message, is_design_dump
+
+pytestmark = pytest.mark.anyio
+
+
+def _messages(count: int, size: int = 40, start: int = 0):
+    return [{"role": "user", "text": f"{i:03d}" + "x" * size} for i in range(start, start + count)]
+
+
+def _manager(summarizer=None, **overrides) -> ContextManager:
+    options = {"token_budget": 100, "recent_messages": 3, "summary_tokens": 20}
+    return ContextManager(summarizer=summarizer, **{**options, **overrides})
+
+
+def test_design_dumps_are_recognised_with_or_without_meta():
+    assert is_design_dump({"role": "architai", "text": "x", "meta": '{"kind": "design_raw"}'})
+    assert is_design_dump({"role": "architai", "text": '{"summary": "legacy dump"}'})
+    assert not is_design_dump({"role": "user", "text": '{"summary": "user typed this"}'})
+    assert not is_design_dump({"role": "architai", "text": "Thanks", "meta": "not json"})
+
+
+async def test_conversation_that_fits_is_used_verbatim_without_design_dumps():
+    dump = {"role": "architai", "text": "{}", "meta": '{"kind": "design"}'}
+    conversation = _messages(2, size=10) + [dump]
+
+    summary, recent = await _manager().fit(conversation)
+    assert summary is None
+    assert recent == conversation[:2]
+
+
+async def test_older_messages_are_summarized_and_the_recent_window_fits():
+    calls = []
+
+    async def summarizer(previous, new_messages):
+        calls.append((previous, [m["text"][:3] for m in new_messages]))
+        return f"{previous}+{len(new_messages)}"
+
+    manager = _manager(summarizer)
+    conversation = _messages(8)
+    summary, recent = await manager.fit(conversation, reserved_tokens=10)
+
+    assert summary == "+" + str(8 - len(recent))
+    assert recent == conversation[-len(recent):]
+    assert 0 < len(recent) <= 3
+    assert sum(estimate_tokens(format_message(m)) for m in recent) <= 100 - 10 - 20
+
+
+async def test_each_turn_only_summarizes_newly_evicted_messages():
+    calls = []
+
+    async def summarizer(previous, new_messages):
+        calls.append(len(new_messages))
+        return f"{previous}+{len(new_messages)}"
+
+    manager = _manager(summarizer, token_budget=60, recent_messages=2)
+    conversation = _messages(6)
+    first, recent = await manager.fit(conversation)
+    assert len(recent) == 2
+    second, _ = await manager.fit(conversation + _messages(1, start=6))
+
+    assert calls == [4, 1]
+    assert second == first + "+1"
+    await manager.fit(conversation + _messages(1, start=6))
+    assert calls == [4, 1]  # served from the summary cache
+
+
+async def test_failing_summarizer_falls_back_to_an_extractive_summary():
+    async def summarizer(previous, new_messages):
+        raise RuntimeError("upstream down")
+
+    manager = _manager(summarizer)
+    summary, recent = await manager.fit(_messages(8))
+    # Keeps the tail: the newest summarized message is always in there
+    assert summary.endswith(format_message(_messages(1, start=8 - len(recent) - 1)[0]))
+    assert len(summary) <= 20 * 4
@@ -0,0 +1,52 @@
+# tests/test_design_patch.py
+import json
+
+from app.services.llm_service import _patch_from_raw, diff_designs, merge_design_patch, sanitize_design
+
+DESIGN = sanitize_design({
+    "summary": "A design",
+    "components": [
+        {"name": "API", "description": "REST", "details": {"technology_stack": ["FastAPI"], "responsibilities": ["auth"]}},
+        {"name": "Cache", "description": "Hot keys", "details": {"technology_stack": ["Redis"], "responsibilities": []}},
+    ],
+})
+
+
+def _patch(raw: dict) -> dict:
+    return _patch_from_raw(json.dumps(raw))
+
+
+def test_component_fields_are_merged_not_replaced():
+    merged, diff = merge_design_patch(DESIGN, _patch({"components": [{"name": "api", "description": "GraphQL"}]}))
+
+    assert merged["components"][0] == {
+        "name": "API",
+        "description": "GraphQL",
+        "details": {"technology_stack": ["FastAPI"], "responsibilities": ["auth"]},
+    }
+    assert diff == {"components": {"added": [], "updated": ["API"], "removed": []}}
+
+
+def test_only_changed_fields_count_as_updates():
+    unchanged = _patch({"summary": "A design", "components": [{"name": "API", "description": "REST"}]})
+    assert merge_design_patch(DESIGN, unchanged)[1] == {}
+
+
+def test_sections_added_and_removed_components():
+    merged, diff = merge_design_patch(DESIGN, _patch({
+        "summary": "Revised",
+        "components": [{"name": "Queue", "description": "Async jobs"}],
+        "removed_components": ["cache"],
+    }))
+
+    assert [c["name"] for c in merged["components"]] == ["API", "Queue"]
+    assert diff["summary"] == {"before": "A design", "after": "Revised"}
+    assert diff["components"] == {"added": ["Queue"], "updated": [], "removed": ["Cache"]}
+
+
+def test_diff_of_a_full_regeneration():
+    after = json.loads(json.dumps(DESIGN))
+    after["components"][0]["details"]["technology_stack"] = ["Go"]
+    del after["components"][1]
+
+    assert diff_designs(DESIGN, after) == {"components": {"added": [], "updated": ["API"], "removed": ["Cache"]}}
@@ -0,0 +1,40 @@
+# tests/test_final_design.py
+import json
+
+import pytest
+
+from app.services import llm_service
+from app.services.resilience import UpstreamError
+
+pytestmark = pytest.mark.anyio
+
+VALID = json.dumps({"summary": "A design", "components": [{"name": "API", "description": "REST"}]})
+
+
+def test_valid_and_repairable_responses_parse_locally():
+    assert llm_service._design_from_raw(f"```json\n{VALID}\n```")["summary"] == "A design"
+    assert llm_service._design_from_raw(VALID[:-2])["components"][0]["name"] == "API"  # truncated
+    assert llm_service._design_from_raw("Sorry, I cannot help with that.") is None
+
+
+async def test_unparsable_response_is_reprompted_once(monkeypatch):
+    prompts = []
+
+    async def call(prompt, operation, generation_config=None, bypass_cache=False):
+        prompts.append(prompt)
+        return VALID
+
+    monkeypatch.setattr(llm_service, "_call_routed", call)
+    design = await llm_service._finish_design("final prompt", "not json")
+    assert design["summary"] == "A design"
+    assert prompts == [f"final prompt\nsystem: {llm_service.FINAL_DESIGN_RETRY_MSG}"]
+
+
+async def test_invalid_reprompt_raises_instead_of_returning_a_partial_design(monkeypatch):
+    async def call(prompt, operation, generation_config=None, bypass_cache=False):
+        return "Still no JSON here"
+
+    monkeypatch.setattr(llm_service, "_call_routed", call)
+    with pytest.raises(UpstreamError) as error:
+        await llm_service._finish_design("final prompt", "not json")
+    assert error.value.status == 502
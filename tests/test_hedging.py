@@ -0,0 +1,63 @@
+# tests/test_hedging.py
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services import llm_service
+from app.services.resilience import UpstreamError
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def hedging(provider, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_MAX_ATTEMPTS", 1)
+    llm_service.hedger.observe("m", 0.05)  # hedge after 50 ms
+    return provider
+
+
+async def test_hedge_wins_when_the_primary_is_slow(hedging):
+    async def first_slow(model, timeout):
+        if len(hedging.calls) == 1:
+            await asyncio.sleep(10)
+            return "primary"
+        return "hedge"
+
+    hedging.handler = first_slow
+    assert await asyncio.wait_for(llm_service._hedged_request("p", "m"), 2) == "hedge"
+    assert len(hedging.calls) == 2
+    assert llm_service.hedger.stats["hedge_wins"] == 1
+
+
+async def test_no_hedge_without_budget(hedging):
+    llm_service.hedger.budget = 0.0
+
+    async def slow(model, timeout):
+        await asyncio.sleep(0.1)
+        return "primary"
+
+    hedging.handler = slow
+    assert await llm_service._hedged_request("p", "m") == "primary"
+    assert len(hedging.calls) == 1
+
+
+async def test_hedge_shares_the_primary_deadline(hedging, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_REQUEST_DEADLINE_SECONDS", 0.3)
+    timeouts = []
+
+    async def hang(model, timeout):
+        timeouts.append(timeout)
+        await asyncio.sleep(timeout)
+        raise UpstreamError(None, "timed out")
+
+    hedging.handler = hang
+    start = time.monotonic()
+    with pytest.raises(UpstreamError):
+        await llm_service._hedged_request("p", "m")
+
+    assert time.monotonic() - start < 0.3 + 0.1
+    assert len(timeouts) == 2
+    assert timeouts[1] < timeouts[0]
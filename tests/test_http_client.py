@@ -0,0 +1,93 @@
+# tests/test_http_client.py
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from app.core.config import settings
+from app.services import http_client
+from app.services.llm_providers import GeminiProvider
+from app.services.resilience import UpstreamError
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def gemini():
+    """Local stand-in for the Gemini REST API; `behaviour` picks the response."""
+    state = {"peers": set(), "behaviour": "ok"}
+
+    async def generate(request):
+        state["peers"].add(request.transport.get_extra_info("peername"))
+        if state["behaviour"] == "slow":
+            await asyncio.sleep(1)
+        if state["behaviour"] == "html":
+            return web.Response(text="<html>proxy error</html>")
+        if state["behaviour"] == "throttle":
+            return web.json_response({"error": "quota"}, status=429, headers={"Retry-After": "7"})
+        return web.json_response({
+            "candidates": [{"content": {"parts": [{"text": "hello"}]}}],
+            "usageMetadata": {"promptTokenCount": 3, "candidatesTokenCount": 1},
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1beta/models/{model}:generateContent", generate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    await http_client.start()
+    yield GeminiProvider("test", f"http://127.0.0.1:{port}/v1beta"), state
+    await http_client.close()
+    await runner.cleanup()
+
+
+async def test_calls_share_one_pooled_client_and_connection(gemini):
+    provider, state = gemini
+    first = await provider.generate("p", "m", None, timeout=5)
+    client = http_client.get_client()
+    second = await provider.generate("p", "m", None, timeout=5)
+
+    assert (first.text, first.prompt_tokens, first.response_tokens) == ("hello", 3, 1)
+    assert second.text == "hello"
+    assert http_client.get_client() is client
+    assert len(state["peers"]) == 1  # keep-alive: the second call reused the connection
+
+
+async def test_close_releases_the_client_and_start_reopens_it():
+    await http_client.start()
+    client = http_client.get_client()
+    await http_client.close()
+    assert client.closed
+    await http_client.start()
+    assert http_client.get_client() is not client
+    await http_client.close()
+
+
+async def test_pooled_read_timeout_still_applies_to_each_call(gemini, monkeypatch):
+    provider, state = gemini
+    state["behaviour"] = "slow"
+    monkeypatch.setattr(settings, "HTTP_READ_TIMEOUT", 0.1)
+
+    with pytest.raises(UpstreamError) as error:
+        await asyncio.wait_for(provider.generate("p", "m", None, timeout=30), 0.8)
+    assert error.value.status is None
+
+
+async def test_non_json_body_is_a_retryable_upstream_error(gemini):
+    provider, state = gemini
+    state["behaviour"] = "html"
+
+    with pytest.raises(UpstreamError) as error:
+        await provider.generate("p", "m", None, timeout=5)
+    assert error.value.retryable
+
+
+async def test_throttle_carries_retry_after(gemini):
+    provider, state = gemini
+    state["behaviour"] = "throttle"
+
+    with pytest.raises(UpstreamError) as error:
+        await provider.generate("p", "m", None, timeout=5)
+    assert (error.value.status, error.value.retry_after) == (429, 7.0)
@@ -0,0 +1,121 @@
+# tests/test_job_queue.py
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.db_models import JobStatus, jobs
+from app.services.job_queue import JobQueue
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def queue(db, make_session):
+    await make_session("s1")
+    queues = []
+
+    def build(handler=None, **kwargs) -> JobQueue:
+        q = JobQueue(workers=kwargs.pop("workers", 1), max_depth=10, **kwargs)
+        if handler is not None:
+            q.register("finalize", handler)
+        queues.append(q)
+        return q
+
+    yield build
+    for q in queues:
+        await q.stop()
+
+
+async def test_submitted_job_runs_and_long_poll_returns_when_done(queue):
+    calls = []
+
+    async def handler(session_id, params):
+        calls.append((session_id, params))
+
+    q = queue(handler)
+    await q.start()
+    job = await q.submit("finalize", "s1", {"refresh": True})
+    done = await q.wait(job["id"], timeout=5)
+
+    assert done["status"] == JobStatus.succeeded
+    assert calls == [("s1", {"refresh": True})]
+
+
+async def test_failed_handler_records_the_error(queue):
+    async def handler(session_id, params):
+        raise RuntimeError("boom")
+
+    q = queue(handler)
+    await q.start()
+    job = await q.wait((await q.submit("finalize", "s1"))["id"], timeout=5)
+    assert job["status"] == JobStatus.failed
+    assert job["error"] == "boom"
+
+
+async def test_double_submit_returns_the_unfinished_job(queue):
+    q = queue()
+    first = await q.submit("finalize", "s1")
+    assert (await q.submit("finalize", "s1"))["id"] == first["id"]
+
+
+async def test_a_job_is_claimed_by_one_worker_only(queue):
+    calls = []
+
+    async def handler(session_id, params):
+        calls.append(session_id)
+        await asyncio.sleep(0.05)
+
+    a, b = queue(handler), queue(handler)
+    job = await a.submit("finalize", "s1")
+    await asyncio.gather(a._run(job["id"]), b._run(job["id"]))
+    assert calls == ["s1"]
+    assert (await a.get(job["id"]))["status"] == JobStatus.succeeded
+
+
+async def test_start_recovers_queued_and_stale_running_jobs_only(db, queue):
+    now = datetime.utcnow()
+    await db.execute(jobs.insert(), {
+        "id": "queued", "session_id": "s1", "kind": "finalize", "status": JobStatus.queued, "created_at": now,
+    })
+    await db.execute(jobs.insert(), {
+        "id": "stale", "session_id": "s1", "kind": "finalize", "status": JobStatus.running,
+        "created_at": now, "started_at": now - timedelta(hours=1),
+    })
+    await db.execute(jobs.insert(), {
+        "id": "live", "session_id": "s1", "kind": "finalize", "status": JobStatus.running,
+        "created_at": now, "started_at": now,
+    })
+    ran = []
+
+    async def handler(session_id, params):
+        ran.append(session_id)
+
+    q = queue(handler, stale_seconds=600)
+    await q.start()
+    await q._queue.join()
+
+    assert len(ran) == 2
+    assert (await q.get("queued"))["status"] == JobStatus.succeeded
+    assert (await q.get("stale"))["status"] == JobStatus.succeeded
+    assert (await q.get("live"))["status"] == JobStatus.running
+
+
+async def test_long_poll_sees_a_job_finishing_before_it_registers(queue, monkeypatch):
+    q = queue()
+    job = await q.submit("finalize", "s1")
+    real_get = q.get
+
+    async def get_then_finish(job_id):
+        row = await real_get(job_id)
+        # The worker finishes right after the status read
+        await q._set_status(job_id, JobStatus.succeeded)
+        event = q._done_events.pop(job_id, None)
+        if event is not None:
+            event.set()
+        return row
+
+    monkeypatch.setattr(q, "get", get_then_finish)
+    done = await asyncio.wait_for(q.wait(job["id"], timeout=30), 5)
+    assert done["status"] == JobStatus.succeeded
+    assert q._done_events == {}
@@ -0,0 +1,78 @@
+# tests/test_llm_cache.py
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.models.db_models import llm_cache
+from app.services.llm_cache import LLMCache, make_key
+
+pytestmark = pytest.mark.anyio
+
+
+def _cache(**overrides) -> LLMCache:
+    options = {"max_entries": 10, "max_bytes": 1000, "ttl_seconds": 60, "persist": False, "db_max_entries": 10}
+    return LLMCache(**{**options, **overrides})
+
+
+def test_key_covers_model_prompt_and_params():
+    key = make_key("m", "p", {"temperature": 0.1, "topK": 1})
+    assert key == make_key("m", "p", {"topK": 1, "temperature": 0.1})
+    assert key != make_key("m2", "p", {"temperature": 0.1, "topK": 1})
+    assert key != make_key("m", "p", {"temperature": 0.2, "topK": 1})
+
+
+async def test_memory_tier_evicts_least_recently_used():
+    cache = _cache(max_entries=2)
+    await cache.set("a", "m", "A")
+    await cache.set("b", "m", "B")
+    assert await cache.get("a") == "A"
+    await cache.set("c", "m", "C")
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == "A"
+    assert cache.stats["evictions"] == 1
+
+
+async def test_memory_tier_is_bounded_by_bytes():
+    cache = _cache(max_bytes=10)
+    await cache.set("a", "m", "x" * 6)
+    await cache.set("b", "m", "y" * 6)
+    await cache.set("huge", "m", "z" * 11)  # larger than the whole tier: not cached
+
+    assert cache.snapshot()["memory_bytes"] == 6
+    assert await cache.get("a") is None
+    assert await cache.get("huge") is None
+
+
+async def test_memory_entries_expire():
+    cache = _cache(ttl_seconds=0.01)
+    await cache.set("a", "m", "A")
+    await asyncio.sleep(0.02)
+    assert await cache.get("a") is None
+    assert cache.snapshot()["memory_entries"] == 0
+
+
+async def test_disk_tier_serves_after_a_restart_until_the_ttl(db):
+    cache = _cache(persist=True)
+    await cache.set("a", "m", "A")
+    cache.clear_memory()
+    assert await cache.get("a") == "A"
+    assert cache.stats["disk_hits"] == 1
+
+    await db.execute(llm_cache.update().values(created_at=datetime.utcnow() - timedelta(seconds=61)))
+    cache.clear_memory()
+    assert await cache.get("a") is None
+
+
+async def test_prune_drops_expired_rows_and_keeps_the_newest(db):
+    cache = _cache(persist=True, db_max_entries=2)
+    now = datetime.utcnow()
+    for i, age in enumerate([120, 3, 2, 1]):
+        await db.execute(llm_cache.insert().values(
+            key=f"k{i}", model="m", response="r", size_bytes=1, created_at=now - timedelta(seconds=age)
+        ))
+
+    await cache.prune()
+    assert sorted(r["key"] for r in await db.fetch_all(select(llm_cache.c.key))) == ["k2", "k3"]
@@ -0,0 +1,97 @@
+# tests/test_migrations.py
+import json
+import sqlite3
+from datetime import datetime
+
+from sqlalchemy import JSON, Column, DateTime, Enum, MetaData, String, Table, create_engine
+
+from app.core import migrations
+from app.models.db_models import SessionStatus
+
+# sessions as created before the messages table, versioning and archival existed
+legacy_metadata = MetaData()
+legacy_sessions = Table(
+    "sessions",
+    legacy_metadata,
+    Column("id", String, primary_key=True),
+    Column("prompt", String, nullable=False),
+    Column("questions", JSON, nullable=False),
+    Column("answers", JSON, nullable=False),
+    Column("conversation", JSON, nullable=True),
+    Column("final_design", JSON, nullable=True),
+    Column("status", Enum(SessionStatus)),
+    Column("user_id", String, nullable=True),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+
+UPDATED_AT = datetime(2025, 9, 22, 14, 4, 2, 308575)
+
+
+def _legacy_db(tmp_path) -> str:
+    path = tmp_path / "legacy.db"
+    engine = create_engine(f"sqlite:///{path}")
+    legacy_metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(legacy_sessions.insert(), [
+            {
+                "id": "s1",
+                "prompt": "A ride sharing app",
+                "questions": ["Scale?"],
+                "answers": [{"question": "Scale?", "answer": "city wide"}],
+                "conversation": [
+                    {"role": "user", "text": "city wide"},
+                    {"role": "architai", "text": "Noted", "meta": {"prompt": "x"}},
+                    {"role": "architai", "text": "Raw", "meta": '{"kind": "design_raw"}'},
+                ],
+                "status": SessionStatus.in_progress,
+                "created_at": UPDATED_AT,
+                "updated_at": UPDATED_AT,
+            },
+            {
+                "id": "s2",
+                "prompt": "An online bookstore",
+                "questions": [],
+                "answers": [],
+                "conversation": None,
+                "status": SessionStatus.in_progress,
+                "created_at": UPDATED_AT,
+                "updated_at": UPDATED_AT,
+            },
+        ])
+    engine.dispose()
+    return str(path)
+
+
+def test_legacy_database_is_upgraded_in_place(tmp_path):
+    path = _legacy_db(tmp_path)
+    migrations.run(f"sqlite:///{path}")
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT seq, role, text, meta FROM messages WHERE session_id = 's1' ORDER BY seq").fetchall()
+    assert rows == [
+        (0, "user", "city wide", None),
+        (1, "architai", "Noted", json.dumps({"prompt": "x"})),
+        (2, "architai", "Raw", '{"kind": "design_raw"}'),
+    ]
+    sessions = conn.execute("SELECT id, conversation, version, updated_at FROM sessions ORDER BY id").fetchall()
+    assert [(s[0], s[1], s[2]) for s in sessions] == [("s1", None, 0), ("s2", None, 0)]
+    # Migrations are not user-visible changes: updated_at keeps its value
+    assert {s[3] for s in sessions} == {UPDATED_AT.isoformat(sep=" ")}
+    assert conn.execute(
+        "SELECT count(*) FROM sessions_fts WHERE sessions_fts MATCH 'bookstore'"
+    ).fetchone() == (1,)
+    versions = [v for (v,) in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+    assert versions == [version for version, _, _ in migrations.DATA_MIGRATIONS]
+    conn.close()
+
+
+def test_rerunning_migrations_is_a_no_op(tmp_path):
+    path = _legacy_db(tmp_path)
+    migrations.run(f"sqlite:///{path}")
+    migrations.run(f"sqlite:///{path}")
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT count(*) FROM messages").fetchone() == (3,)
+    assert conn.execute("SELECT count(*) FROM schema_migrations").fetchone() == (len(migrations.DATA_MIGRATIONS),)
+    conn.close()
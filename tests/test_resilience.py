@@ -0,0 +1,123 @@
+# tests/test_resilience.py
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services import llm_service
+from app.services.resilience import (
+    AIMDLimiter, CircuitBreaker, CircuitOpenError, DeadlineExceeded, UpstreamError, parse_retry_after,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") is None
+    assert parse_retry_after(None) is None
+
+
+def test_breaker_opens_fails_fast_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_seconds=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()  # the probe
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_and_neutral_probe_frees_the_slot():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=0.0)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_neutral()
+    breaker.before_call()  # a neutral outcome lets the next probe through
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_limiter_increases_additively_and_halves_once_per_pause():
+    limiter = AIMDLimiter(initial=4, min_limit=1, max_limit=5)
+    for _ in range(4):
+        limiter.on_success()
+    assert limiter.limit == pytest.approx(5.0, abs=0.3)
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.limit == 5
+
+    for _ in range(10):  # one burst of 429s
+        limiter.on_throttle(0.05)
+    assert limiter.limit == 2.5
+    time.sleep(0.06)
+    limiter.on_throttle(None)
+    assert limiter.limit == 1.25
+
+
+async def test_limiter_slot_gives_up_at_the_deadline():
+    limiter = AIMDLimiter(initial=1, min_limit=1, max_limit=1)
+    async with limiter.slot(time.monotonic() + 1):
+        with pytest.raises(DeadlineExceeded):
+            async with limiter.slot(time.monotonic() + 0.05):
+                pass
+    assert limiter.inflight == 0
+
+
+async def test_retries_server_errors_but_not_client_errors(provider, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_ATTEMPTS", 3)
+    statuses = [503, 503]
+
+    async def flaky(model, timeout):
+        if statuses:
+            raise UpstreamError(statuses.pop(0), "unavailable", retry_after=0)
+        return "ok"
+
+    provider.handler = flaky
+    assert await llm_service._request_gemini("p", "m") == "ok"
+    assert len(provider.calls) == 3
+
+    async def bad_request(model, timeout):
+        raise UpstreamError(400, "bad request")
+
+    provider.handler = bad_request
+    with pytest.raises(UpstreamError):
+        await llm_service._request_gemini("p", "m")
+    assert len(provider.calls) == 4
+
+
+@pytest.mark.parametrize("outcome", ["cancelled", "deadline"])
+async def test_half_open_probe_is_released_when_the_call_never_completes(provider, outcome, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_REQUEST_DEADLINE_SECONDS", 0.05)
+    breaker = llm_service.breaker_for("m")
+    breaker.state, breaker.opened_at = "open", 0.0
+
+    async def hang(model, timeout):
+        await asyncio.sleep(10)
+
+    provider.handler = hang
+    if outcome == "cancelled":
+        task = asyncio.create_task(llm_service._request_gemini("p", "m"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    else:
+        # No concurrency slot frees up before the deadline
+        llm_service.limiter.inflight = int(llm_service.limiter.limit)
+        with pytest.raises(DeadlineExceeded):
+            await llm_service._request_gemini("p", "m")
+
+    assert breaker.state == "half_open"
+    breaker.before_call()  # the next probe is allowed
@@ -0,0 +1,64 @@
+# tests/test_routing.py
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services import llm_service
+from app.services.resilience import UpstreamError
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def routed(provider, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(settings, "LLM_MODEL_FAST", "fast")
+    monkeypatch.setattr(settings, "LLM_MODEL_LARGE", "large")
+    monkeypatch.setattr(settings, "LLM_ROUTES", {"summary": "custom"})
+    monkeypatch.setattr(settings, "LLM_MODEL_FALLBACK", "backup")
+    return provider
+
+
+def test_operations_route_to_their_tier(routed):
+    assert llm_service.route_model("questions") == "fast"
+    assert llm_service.route_model("finalize") == "large"
+    assert llm_service.route_model("summary") == "custom"
+
+
+async def test_failing_primary_falls_back(routed):
+    async def primary_down(model, timeout):
+        if model == "fast":
+            raise UpstreamError(400, "bad")
+        return model
+
+    routed.handler = primary_down
+    assert await llm_service._call_routed("p", "questions") == "backup"
+
+
+async def test_slow_primary_falls_back_and_still_finishes(routed, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_FALLBACK_AFTER", {"questions": 0.05})
+    finished = asyncio.Event()
+
+    async def slow_primary(model, timeout):
+        if model == "fast":
+            await asyncio.sleep(0.1)
+            finished.set()
+        return model
+
+    routed.handler = slow_primary
+    assert await llm_service._call_routed("p", "questions") == "backup"
+    await asyncio.wait_for(finished.wait(), 1)  # abandoned, not cancelled
+
+
+async def test_fallback_delay_is_per_operation(routed, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_FALLBACK_AFTER_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "LLM_FALLBACK_AFTER", {"finalize": 1.0})
+
+    async def slowish(model, timeout):
+        await asyncio.sleep(0.1)
+        return model
+
+    routed.handler = slowish
+    assert await llm_service._call_routed("p", "finalize") == "large"
+    assert await llm_service._call_routed("p", "questions") == "backup"
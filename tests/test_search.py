@@ -0,0 +1,62 @@
+# tests/test_search.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.db_models import SessionStatus, sessions
+from app.services import archive
+from app.services.search import SNIPPET_START, fts5_query, search_sessions
+
+pytestmark = pytest.mark.anyio
+
+
+def test_fts5_query_quotes_terms():
+    assert fts5_query("kafka stream*") == '"kafka" "stream"*'
+    assert fts5_query('c++ AND "OR" (x') == '"c++" "AND" "OR" "x"'
+    assert fts5_query(" -- ") is None
+
+
+async def _seed(make_session):
+    await make_session("ride", prompt="A ride sharing app", answers=[{"question": "Q", "answer": "kafka events"}])
+    await make_session(
+        "books", prompt="An online bookstore", user_id="u1", status=SessionStatus.completed,
+        final_design={"summary": "Uses kafka for orders", "mermaid": "graph TD; ride-->x"},
+    )
+
+
+async def test_prompt_matches_rank_above_design_matches(db, make_session):
+    await _seed(make_session)
+    await make_session("quiz", prompt="A quiz game using kafka")
+
+    hits = await search_sessions("kafka")
+    assert [h["id"] for h in hits][0] == "quiz"
+    assert {h["id"] for h in hits} == {"quiz", "ride", "books"}
+    assert hits[0]["rank"] >= hits[-1]["rank"]
+    assert SNIPPET_START in hits[0]["snippet"]
+
+
+async def test_filters_prefixes_and_excluded_diagrams(db, make_session):
+    await _seed(make_session)
+
+    assert [h["id"] for h in await search_sessions("kafka", status=SessionStatus.completed)] == ["books"]
+    assert [h["id"] for h in await search_sessions("kafka", user_id="u1")] == ["books"]
+    assert [h["id"] for h in await search_sessions("book*")] == ["books"]
+    assert [h["id"] for h in await search_sessions("ride")] == ["ride"]  # mermaid text is not indexed
+    assert await search_sessions("") == []
+
+
+async def test_index_follows_updates_deletes_and_archival(db, make_session):
+    await _seed(make_session)
+    await db.execute(sessions.update().where(sessions.c.id == "ride").values(
+        answers=[{"question": "Q", "answer": "redis streams"}]
+    ))
+    assert [h["id"] for h in await search_sessions("redis")] == ["ride"]
+    assert [h["id"] for h in await search_sessions("kafka")] == ["books"]
+
+    old = datetime.utcnow() - timedelta(days=40)
+    await db.execute(sessions.update().where(sessions.c.id == "books").values(updated_at=old))
+    await archive.compact(older_than_days=30)
+    assert [h["id"] for h in await search_sessions("orders")] == ["books"]  # still found once archived
+
+    await db.execute(sessions.delete().where(sessions.c.id == "ride"))
+    assert await search_sessions("redis") == []
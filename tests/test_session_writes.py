@@ -0,0 +1,60 @@
+# tests/test_session_writes.py
+import pytest
+
+from app.services import conversation_store, session_service
+
+pytestmark = pytest.mark.anyio
+
+
+def _add_answer(question: str, answer: str):
+    def apply(data):
+        if any(a["question"] == question for a in data["answers"]):
+            return {}, []
+        answers = data["answers"] + [{"question": question, "answer": answer}]
+        return {"answers": answers}, [{"role": "user", "text": answer}]
+    return apply
+
+
+async def _snapshot(session_id: str):
+    data = await session_service.load_session(session_id)
+    conversation, persisted = await conversation_store.load_conversation(session_id, data.get("conversation"))
+    return data, conversation, persisted
+
+
+async def test_stale_writer_reapplies_its_change_on_the_fresh_row(make_session):
+    await make_session("s1", questions=["Q1?", "Q2?", "Q3?"], answers=[])
+    first = await _snapshot("s1")
+    second = await _snapshot("s1")
+
+    saved, _ = await session_service.update_session("s1", *first, _add_answer("Q1?", "one"))
+    assert saved["version"] == 1
+    # Still holds version 0: loses the compare-and-swap, reloads and re-applies
+    saved, conversation = await session_service.update_session("s1", *second, _add_answer("Q2?", "two"))
+    assert saved["version"] == 2
+
+    data, conversation, persisted = await _snapshot("s1")
+    assert [a["answer"] for a in data["answers"]] == ["one", "two"]
+    assert [m["text"] for m in conversation] == ["one", "two"]
+    assert persisted == 2
+    assert data["version"] == 2
+
+
+async def test_conflict_is_raised_after_max_attempts(make_session, monkeypatch):
+    await make_session("s1", answers=[])
+    attempts = []
+
+    async def always_stale(*args, **kwargs):
+        attempts.append(args)
+        return None
+
+    monkeypatch.setattr(session_service, "_compare_and_swap", always_stale)
+    monkeypatch.setattr(session_service.settings, "SESSION_WRITE_MAX_ATTEMPTS", 3)
+    with pytest.raises(session_service.SessionConflict):
+        await session_service.update_session("s1", *await _snapshot("s1"), _add_answer("Q1?", "one"))
+    assert len(attempts) == 3
+
+
+async def test_compare_and_swap_rejects_a_stale_version(make_session):
+    await make_session("s1", version=4)
+    assert await session_service._compare_and_swap("s1", 3, {"answers": []}, [], 0) is None
+    assert await session_service._compare_and_swap("s1", 4, {"answers": []}, [], 0) == 5
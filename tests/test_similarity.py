@@ -0,0 +1,55 @@
+# tests/test_similarity.py
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import similarity
+from app.services.similarity import SimilarityIndex, embed
+
+DESIGN = {"summary": "Event driven", "components": [{"name": "Broker", "details": {"technology_stack": ["Kafka"]}}]}
+
+
+@pytest.fixture
+def index(monkeypatch):
+    fresh = SimilarityIndex(dim=256, capacity=3, reference_chars=200)
+    monkeypatch.setattr(similarity, "index", fresh)
+    return fresh
+
+
+def test_embeddings_are_unit_length_and_similar_for_similar_text():
+    a, b, c = (embed(t, 256) for t in ("ride sharing app", "a ride sharing application", "quiz game backend"))
+    assert np.linalg.norm(a) == pytest.approx(1.0)
+    assert a @ b > a @ c
+    assert not embed("   ", 256).any()
+
+
+def test_similar_prompt_reuses_questions_and_designs_become_references(index):
+    index.add("s1", "A ride sharing app for a city", ["Scale?"])
+    index.add("s2", "A multiplayer quiz game", ["Players?"])
+    index.set_design("s1", "A ride sharing app for a city", [{"answer": "kafka"}], DESIGN)
+
+    assert index.similar_questions("ride sharing app for a small city", 0.5)[0] == "s1"
+    assert index.similar_questions("an IoT telemetry pipeline", 0.5) is None
+    matches = index.similar_designs("ride sharing", [], k=2, threshold=0.1)
+    assert [m[0] for m in matches] == ["s1"]
+    assert "Broker (Kafka)" in matches[0][2]
+    assert index.similar_designs("ride sharing", [], k=2, threshold=0.1, exclude="s1") == []
+
+
+def test_oldest_session_is_evicted_when_full(index):
+    for i in range(4):
+        index.add(f"s{i}", f"prompt number {i}", ["Q?"])
+    assert len(index) == 3
+    assert "s0" not in index._rows
+
+
+def test_disabled_feature_neither_reads_nor_writes_the_index(index, monkeypatch):
+    monkeypatch.setattr(settings, "SIMILARITY_ENABLED", False)
+    similarity.record_session("s1", "A ride sharing app", ["Scale?"])
+    similarity.record_design("s1", "A ride sharing app", [], DESIGN)
+    assert len(index) == 0
+    assert similarity.reusable_questions("A ride sharing app") is None
+
+    monkeypatch.setattr(settings, "SIMILARITY_ENABLED", True)
+    similarity.record_session("s1", "A ride sharing app", ["Scale?"])
+    assert similarity.reusable_questions("A ride sharing app") == ["Scale?"]
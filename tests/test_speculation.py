@@ -0,0 +1,68 @@
+# tests/test_speculation.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.db_models import SessionStatus, sessions
+from app.services import llm_service, session_service
+from app.services.speculation import Speculator, usable_draft
+
+pytestmark = pytest.mark.anyio
+
+DESIGN = {"summary": "Draft", "components": []}
+UPDATED_AT = datetime.utcnow() - timedelta(hours=1)
+
+
+@pytest.fixture
+def generate(monkeypatch):
+    async def fake_generate(prompt, conversation, bypass_cache=False, references=None):
+        conversation.append(llm_service.design_raw_message(prompt, '{"summary": "Draft"}'))
+        return DESIGN
+
+    monkeypatch.setattr(llm_service, "generate_final_design", fake_generate)
+
+
+async def _ready(make_session, session_id: str = "s1"):
+    return await make_session(
+        session_id, [{"role": "user", "text": "A1"}], status=SessionStatus.ready_to_finalize, updated_at=UPDATED_AT
+    )
+
+
+async def test_draft_is_stored_without_touching_updated_at(db, make_session, generate):
+    await _ready(make_session)
+    await Speculator(enabled=True, max_inflight=4)._run("s1")
+
+    row = await db.fetch_one(sessions.select().where(sessions.c.id == "s1"))
+    assert row["draft_design"] == DESIGN
+    assert row["updated_at"] == UPDATED_AT
+    data = await session_service.load_session("s1")
+    assert usable_draft(data, [{"role": "user", "text": "A1"}]) == DESIGN
+    assert usable_draft(data, [{"role": "user", "text": "changed"}]) is None
+
+
+async def test_draft_from_a_stale_snapshot_is_dropped(db, make_session, generate, monkeypatch):
+    await _ready(make_session)
+
+    async def generate_while_session_changes(prompt, conversation, bypass_cache=False, references=None):
+        await db.execute(sessions.update().where(sessions.c.id == "s1").values(version=sessions.c.version + 1))
+        return DESIGN
+
+    monkeypatch.setattr(llm_service, "generate_final_design", generate_while_session_changes)
+    await Speculator(enabled=True, max_inflight=4)._run("s1")
+    assert (await db.fetch_one(sessions.select().where(sessions.c.id == "s1")))["draft_design"] is None
+
+
+async def test_schedule_respects_enabled_and_max_inflight(db, make_session, generate):
+    await _ready(make_session, "s1")
+    await _ready(make_session, "s2")
+
+    disabled = Speculator(enabled=False, max_inflight=4)
+    disabled.schedule("s1")
+    assert disabled._tasks == {}
+
+    speculator = Speculator(enabled=True, max_inflight=1)
+    speculator.schedule("s1")
+    speculator.schedule("s2")
+    assert list(speculator._tasks) == ["s1"]
+    await speculator.wait("s1")
+    await speculator.stop()
@@ -0,0 +1,71 @@
+# tests/test_transfer.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.db_models import SessionStatus, messages, sessions
+from app.services import archive, conversation_store, session_service, transfer
+
+pytestmark = pytest.mark.anyio
+
+DESIGN = {"summary": "A design", "components": []}
+
+
+async def _seed(make_session):
+    old = datetime.utcnow() - timedelta(days=40)
+    await make_session("a", [{"role": "user", "text": "one"}, {"role": "architai", "text": "ok", "meta": '{"k": 1}'}])
+    await make_session("b", status=SessionStatus.ready_to_finalize, user_id="u1")
+    await make_session(
+        "c", [{"role": "user", "text": "three"}], status=SessionStatus.completed, final_design=DESIGN, updated_at=old
+    )
+    await archive.compact(older_than_days=30)
+
+
+async def _export(compress: bool) -> bytes:
+    return b"".join([chunk async for chunk in transfer.export_ndjson(batch_size=2, compress=compress)])
+
+
+async def _chunks(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def _state():
+    result = {}
+    for session_id in ("a", "b", "c"):
+        data = await session_service.load_session(session_id)
+        conversation, _ = await conversation_store.load_conversation(session_id, data.get("conversation"))
+        result[session_id] = (
+            data["prompt"], data["answers"], data["final_design"], data["status"], data["user_id"],
+            data["updated_at"], conversation,
+        )
+    return result
+
+
+@pytest.mark.parametrize("compress", [False, True])
+async def test_export_then_import_restores_every_session(db, make_session, compress):
+    await _seed(make_session)
+    before = await _state()
+    dump = await _export(compress)
+    assert dump.startswith(transfer.GZIP_MAGIC) == compress
+
+    await db.execute(messages.delete())
+    await db.execute(sessions.delete())
+    stats = await transfer.import_ndjson(_chunks(dump), batch_size=2)
+
+    assert stats == {"imported": 3, "skipped": 0, "messages": 3}
+    assert await _state() == before
+
+
+async def test_reimport_skips_existing_sessions(db, make_session):
+    await _seed(make_session)
+    dump = await _export(compress=False)
+
+    stats = await transfer.import_ndjson(_chunks(dump), batch_size=2)
+    assert stats == {"imported": 0, "skipped": 3, "messages": 0}
+
+
+async def test_invalid_line_reports_its_number(db):
+    dump = b'{"id": "x", "prompt": "p"}\n{"id": "y"}\n'
+    with pytest.raises(transfer.InvalidRecord, match="line 2"):
+        await transfer.import_ndjson(_chunks(dump), batch_size=10)
@@ -0,0 +1,45 @@
+# tests/test_websocket.py
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from app.core.db import sync_database_url
+from app.models.db_models import SessionStatus, sessions
+from main import app
+
+
+@pytest.fixture
+def session_client(empty_database):
+    """The app (migrating the empty test database on startup) with one in-progress session."""
+    with TestClient(app) as client:
+        engine = create_engine(sync_database_url())
+        with engine.begin() as conn:
+            conn.execute(sessions.insert().values(
+                id="s1", prompt="A ride sharing app", questions=["Q1?"], answers=[],
+                status=SessionStatus.in_progress, version=0,
+                created_at=datetime.utcnow(), updated_at=datetime.utcnow(),
+            ))
+        engine.dispose()
+        yield client
+
+
+def test_malformed_frames_get_an_error_and_keep_the_socket_open(session_client):
+    with session_client.websocket_connect("/session/s1/ws") as ws:
+        assert ws.receive_json() == {"type": "state", "status": "in_progress", "next_questions": ["Q1?"]}
+
+        ws.send_text("{not json")
+        assert ws.receive_json() == {"type": "error", "detail": "Invalid JSON"}
+        for payload in ([1, 2], "text", 3):
+            ws.send_json(payload)
+            assert ws.receive_json() == {"type": "error", "detail": "Expected a JSON object"}
+        ws.send_json({"answers": [1, "x", {"question": ["Q1?"], "answer": "a"}]})
+        assert ws.receive_json() == {"type": "error", "detail": "No new valid answers"}
+        ws.send_json({"question": "Unknown?", "answer": ""})
+        assert ws.receive_json()["type"] == "error"
+
+
+def test_unknown_session_is_closed_with_an_error(session_client):
+    with session_client.websocket_connect("/session/nope/ws") as ws:
+        assert ws.receive_json() == {"type": "error", "detail": "Session not found"}